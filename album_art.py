@@ -0,0 +1,193 @@
+"""
+Album artwork: right-sized image selection and an optional thumbnail proxy.
+
+Spotify lists each album's art at several sizes (typically 640, 300 and 64
+px) and images[0] is the largest. pick_image() returns the smallest one that
+still covers the display size, so a 44px cover downloads the 64px file
+(a few KB) instead of the 640px one.
+
+When MASHLAB_THUMB_PROXY is set (e.g. http://localhost:5000/thumb),
+thumbnail_url() points <img> tags at the Flask /thumb route instead of the
+CDN. ThumbnailCache stores each image once on disk under the SHA-256 of its
+bytes, with a small per-URL link file pointing at that blob, and the route
+serves it with an immutable one-year Cache-Control. Only Spotify and Deezer
+image hosts are proxied, redirects included. The cache is capped at
+MASHLAB_THUMB_CACHE_MAX_BYTES (default 200 MB); the least recently served
+blobs are pruned first.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import quote, urljoin, urlsplit
+
+COVER_PX = 44  # .mash-cover in app.py
+
+ALLOWED_HOSTS = ("i.scdn.co", "mosaic.scdn.co", "image-cdn-ak.spotifycdn.com",
+                 "image-cdn-fa.spotifycdn.com", "cdn-images.dzcdn.net", "e-cdns-images.dzcdn.net")
+MAX_IMAGE_BYTES = 2 * 1024 * 1024
+MAX_REDIRECTS = 3
+CACHE_MAX_AGE = 365 * 24 * 3600
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+def pick_image(images: Optional[Iterable[Dict[str, Any]]], min_px: int = COVER_PX) -> Optional[str]:
+    """
+    URL of the smallest image whose shorter side is at least min_px. Falls
+    back to the largest image when none is big enough, and to the first one
+    when sizes are missing.
+    """
+    images = [img for img in images or [] if img.get("url")]
+    if not images:
+        return None
+    sized = [img for img in images if img.get("width") and img.get("height")]
+    if not sized:
+        return images[0]["url"]
+
+    def side(img):
+        return min(img["width"], img["height"])
+
+    big_enough = [img for img in sized if side(img) >= min_px]
+    if big_enough:
+        return min(big_enough, key=side)["url"]
+    return max(sized, key=side)["url"]
+
+def album_art_url(item: Dict[str, Any], min_px: int = COVER_PX) -> Optional[str]:
+    """pick_image() for a Spotify track object."""
+    return pick_image((item.get("album") or {}).get("images"), min_px)
+
+def is_allowed(url: str) -> bool:
+    parts = urlsplit(url or "")
+    return parts.scheme == "https" and parts.hostname in ALLOWED_HOSTS
+
+def thumbnail_url(url: Optional[str]) -> str:
+    """The proxied URL when MASHLAB_THUMB_PROXY is set, else the URL unchanged."""
+    proxy = os.getenv("MASHLAB_THUMB_PROXY")
+    if not url or not proxy or not is_allowed(url):
+        return url or ""
+    return f"{proxy}?u={quote(url, safe='')}"
+
+class ThumbnailCache:
+    """Content-addressed image store: blobs/<sha256 of bytes>, urls/<sha256 of url>."""
+
+    def __init__(self, root: str, fetch=None, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._fetch = fetch or _http_fetch
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ThumbnailCache":
+        return cls(os.getenv("MASHLAB_THUMB_CACHE", ".thumb_cache"),
+                   max_bytes=int(os.getenv("MASHLAB_THUMB_CACHE_MAX_BYTES", CACHE_MAX_BYTES)))
+
+    def _link_path(self, url: str) -> str:
+        return os.path.join(self.root, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest)
+
+    def _lookup(self, url: str) -> Optional[Tuple[str, str]]:
+        try:
+            with open(self._link_path(url), encoding="utf-8") as f:
+                digest, mime = f.read().split(" ", 1)
+            os.utime(self.blob_path(digest))  # mtime is the LRU clock for prune()
+            os.utime(self._link_path(url))
+        except (OSError, ValueError):
+            return None
+        return digest, mime
+
+    def get(self, url: str) -> Tuple[str, str]:
+        """
+        (content digest, MIME type) for url, downloading it on first use.
+        Raises ValueError for hosts outside ALLOWED_HOSTS.
+        """
+        if not is_allowed(url):
+            raise ValueError(f"not an allowed image host: {url!r}")
+        hit = self._lookup(url)
+        if hit:
+            return hit
+        data, mime = self._fetch(url)
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            new_blob = not os.path.exists(self.blob_path(digest))
+            if new_blob:
+                _atomic_write(self.blob_path(digest), data)
+            _atomic_write(self._link_path(url), f"{digest} {mime}".encode("utf-8"))
+            if new_blob:
+                self.prune(keep=digest)
+        return digest, mime
+
+    def prune(self, keep: Optional[str] = None) -> int:
+        """
+        Delete least recently served blobs until the cache fits in max_bytes,
+        plus link files older than the newest deleted blob. Returns bytes freed.
+        """
+        blobs = []
+        for name in _listdir(os.path.join(self.root, "blobs")):
+            try:
+                st = os.stat(self.blob_path(name))
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _mtime, size, _name in blobs)
+        freed, cutoff = 0, None
+        for mtime, size, name in sorted(blobs):
+            if total - freed <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.blob_path(name))
+            except OSError:
+                continue
+            freed += size
+            cutoff = mtime
+        if cutoff is not None:
+            links = os.path.join(self.root, "urls")
+            for name in _listdir(links):
+                path = os.path.join(links, name)
+                try:
+                    if os.stat(path).st_mtime <= cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+        return freed
+
+def _listdir(path: str) -> Iterable[str]:
+    try:
+        return [n for n in os.listdir(path) if not n.endswith(".tmp")]
+    except OSError:
+        return []
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _get_allowed(url: str):
+    """GET url, following redirects only while they stay on ALLOWED_HOSTS."""
+    from spotify_clients import http_session
+
+    for _ in range(MAX_REDIRECTS + 1):
+        r = http_session().get(url, timeout=10, stream=True, allow_redirects=False)
+        if not r.is_redirect:
+            return r
+        r.close()
+        url = urljoin(url, r.headers["Location"])
+        if not is_allowed(url):
+            raise ValueError(f"redirected to a host that is not allowed: {url!r}")
+    raise ValueError("too many redirects")
+
+def _http_fetch(url: str) -> Tuple[bytes, str]:
+    with _get_allowed(url) as r:
+        r.raise_for_status()
+        mime = r.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
+        if not mime.startswith("image/"):
+            raise ValueError(f"not an image: {mime}")
+        data = r.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError("image too large")
+    return data, mime
@@ -1,10 +1,22 @@
+from startup import profile_startup
+profile_startup()  # no-op unless MASHLAB_PROFILE_STARTUP=1
 import streamlit as st
 import sqlite3
 import os
-import pandas as pd
-from spotipy import Spotify
-from spotipy.oauth2 import SpotifyClientCredentials
-from spotify_oauth import get_user_token, handle_oauth_callback, show_login_button, show_logout_button, is_authenticated
+from functools import partial
+from html import escape
+from album_art import album_art_url, thumbnail_url
+from audio_features import get_audio_features
+from bpm_cache import get_resolver, load_cached_bpms, parse_bpm, store_bpms
+from circuit_breaker import CircuitOpenError
+from compat import to_camelot  # same wheel as effective_metrics' SQL, so Search and Library agree
+from db_migrations import ensure_schema
+from library_search import enable_replace_triggers, search_local
+from playlist_sync import sync_playlists
+from search_pipeline import fan_out
+from spotify_clients import get_app_client, get_user_client
+from spotify_search import search_cache_stats, search_tracks_cached
+from tracing import span, start_trace, traced
 
 # ============ Configuration ============
 st.set_page_config(
@@ -18,112 +30,64 @@ st.set_page_config(
 def get_conn():
     conn = sqlite3.connect('murphmixes.db')
     conn.row_factory = sqlite3.Row
+    enable_replace_triggers(conn)  # add_track uses INSERT OR REPLACE
     return conn
 
+@traced("db.init")
 def init_db():
-    conn = get_conn()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS tracks (
-            track_id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            artist TEXT NOT NULL,
-            key_int INTEGER,
-            mode_int INTEGER,
-            energy REAL,
-            camelot TEXT,
-            url TEXT,
-            album_art TEXT,
-            source TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Add missing columns if they don't exist
-    try:
-        conn.execute("ALTER TABLE tracks ADD COLUMN album_art TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        conn.execute("ALTER TABLE tracks ADD COLUMN source TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        conn.execute("ALTER TABLE tracks ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    conn.commit()
-    conn.close()
+    """Apply pending schema migrations (a no-op after the first call in this process)."""
+    ensure_schema('murphmixes.db')
 
 # ============ Spotify Integration ============
-@st.cache_data
 def get_spotify_client():
-    """Get Spotify client with caching."""
-    cid = os.getenv("SPOTIPY_CLIENT_ID")
-    sec = os.getenv("SPOTIPY_CLIENT_SECRET")
-    
-    if not all([cid, sec]):
-        return None
-    
+    """Get the process-wide client-credentials Spotify client."""
     try:
-        auth_manager = SpotifyClientCredentials(client_id=cid, client_secret=sec)
-        sp = Spotify(auth_manager=auth_manager)
-        return sp
+        return get_app_client()
     except Exception as e:
         st.error(f"Spotify authentication failed: {str(e)}")
         return None
 
+@traced()
 def get_user_spotify_client():
     """Get Spotify client with user authentication for audio features."""
+    from spotify_oauth import current_token_sid, get_user_token
+
     user_token = get_user_token()
     if not user_token:
         return None
     
     try:
-        # Create a custom auth manager that uses the user token
-        from spotipy.oauth2 import SpotifyOAuth
-        auth_manager = SpotifyOAuth(
-            client_id=os.getenv("SPOTIPY_CLIENT_ID"),
-            client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
-            redirect_uri="http://localhost:3000/callback",
-            scope="user-read-private user-read-email playlist-read-private playlist-read-collaborative user-library-read user-top-read"
-        )
-        auth_manager._token = {
-            'access_token': user_token,
-            'token_type': 'Bearer',
-            'expires_in': 3600
-        }
-        
-        sp = Spotify(auth_manager=auth_manager)
-        return sp
+        # Keyed by token session, so logging out (or idle sign-out) drops it
+        return get_user_client(current_token_sid(), user_token)
     except Exception as e:
         st.error(f"User Spotify authentication failed: {str(e)}")
         return None
 
 # ============ Core Functions ============
+@traced()
 def search_tracks(query, limit=25):
-    """Search tracks using Spotipy with market='US'."""
+    """Search tracks using Spotipy with market='US' (shared cache across sessions)."""
     sp = get_spotify_client()
     if not sp:
         return []
     
     try:
-        results = sp.search(q=query, type='track', limit=limit, market='US')
-        return results['tracks']['items']
+        return search_tracks_cached(sp, query, limit=limit, market='US')
+    except CircuitOpenError as e:
+        st.warning(f"Spotify is temporarily unavailable; showing library matches only (retrying in {e.retry_in:.0f}s).")
+        return []
     except Exception as e:
         st.error(f"Spotify search failed: {str(e)}")
         return []
 
+@traced()
 def get_audio_features_map(sp, ids):
-    """Get audio features for multiple tracks via batch API call."""
+    """Get audio features for multiple tracks (SQLite cache first, then chunked API calls)."""
     if not sp or not ids:
         return {}
     
     try:
-        features = sp.audio_features(ids)
-        return {f['id']: f for f in features if f}
+        return get_audio_features(sp, ids, db_path='murphmixes.db')
     except Exception as e:
         st.error(f"Failed to get audio features: {str(e)}")
         return {}
@@ -137,18 +101,8 @@ def musical_key_name(key_int, mode_int):
         return "—"
     return f"{KEYS[key_int]} {'major' if mode_int == 1 else 'min'}"
 
-def to_camelot(key_int, mode_int):
-    """Convert key and mode to Camelot notation using formula: ((key_int + 3) % 12) + 1."""
-    if key_int is None or mode_int is None:
-        return ""
-    
-    # Calculate camelot number using formula from spec
-    camelot_number = ((key_int + 3) % 12) + 1
-    camelot_letter = "B" if mode_int == 1 else "A"  # Major = B, Minor = A
-    
-    return f"{camelot_number}{camelot_letter}"
-
 # ============ Database Operations ============
+@traced("db.in_db")
 def in_db(track_id):
     """Check if track exists in database."""
     conn = get_conn()
@@ -157,17 +111,31 @@ def in_db(track_id):
     conn.close()
     return exists
 
+@traced("db.library_ids")
+def library_ids(track_ids):
+    """The subset of track_ids already in the library, in one query."""
+    track_ids = list(track_ids)
+    if not track_ids:
+        return set()
+    conn = get_conn()
+    placeholders = ",".join("?" * len(track_ids))
+    rows = conn.execute(f"SELECT track_id FROM tracks WHERE track_id IN ({placeholders})", track_ids).fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+@traced("db.add_track")
 def add_track(row):
     """Add track to database with source field."""
     conn = get_conn()
     conn.execute("""
         INSERT OR REPLACE INTO tracks 
-        (track_id, title, artist, key_int, mode_int, energy, camelot, url, album_art, source)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        (track_id, title, artist, bpm, key_int, mode_int, energy, camelot, url, album_art, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         row['track_id'],
         row['title'],
         row['artist'],
+        row.get('bpm'),
         row.get('key_int'),
         row.get('mode_int'),
         row.get('energy'),
@@ -179,26 +147,162 @@ def add_track(row):
     conn.commit()
     conn.close()
 
-def db_list_tracks():
-    """Get all tracks from the database."""
+@traced("db.search_library")
+def search_library(query, limit=10):
+    """Instant prefix search over the local library (FTS5, no network)."""
     conn = get_conn()
-    # Check if created_at column exists
-    try:
-        cursor = conn.execute("SELECT * FROM tracks ORDER BY created_at DESC")
-    except sqlite3.OperationalError:
-        # If created_at doesn't exist, just select all without ordering
-        cursor = conn.execute("SELECT * FROM tracks")
-    tracks = [dict(row) for row in cursor.fetchall()]
+    hits = search_local(conn, query, limit=limit)
     conn.close()
-    return tracks
+    return hits
+
+# ============ Search Results ============
+def build_result_row(index, track):
+    """Search result row as soon as the track is known; BPM and key are filled in later."""
+    album_art = album_art_url(track)
+    
+    return {
+        'index': index,
+        'track_id': track['id'],
+        'title': track.get('name', ''),
+        'artist': ', '.join(a['name'] for a in (track.get('artists') or [])),
+        'bpm': None,
+        'key_int': None,
+        'mode_int': None,
+        'energy': None,
+        'camelot': '',
+        'key_name': musical_key_name(None, None),
+        'url': (track.get('external_urls') or {}).get('spotify', ''),
+        'album_art': album_art
+    }
+
+def apply_features(row, features):
+    """Merge Spotify audio features into a result row (GetSongBPM's BPM wins over tempo)."""
+    row['key_int'] = features.get('key')
+    row['mode_int'] = features.get('mode')
+    row['energy'] = features.get('energy')
+    row['key_name'] = musical_key_name(row['key_int'], row['mode_int'])
+    row['camelot'] = to_camelot(row['key_int'], row['mode_int'])
+    if row['bpm'] is None and features.get('tempo'):
+        row['bpm'] = round(features['tempo'], 1)
+
+@traced("db.lookup_cached_bpms")
+def lookup_cached_bpms(track_ids):
+    """BPMs already in simple_bpm_cache (None = known to have no BPM)."""
+    conn = get_conn()
+    cached = load_cached_bpms(conn, track_ids)
+    conn.close()
+    return cached
+
+@traced("db.save_fetched_bpms")
+def save_fetched_bpms(bpms):
+    """Persist GetSongBPM answers from this search."""
+    if not bpms:
+        return
+    conn = get_conn()
+    store_bpms(conn, bpms)
+    conn.close()
+
+# ============ Rendering ============
+RESULTS_HEADER_HTML = """
+<div style="display: flex; align-items: center; padding: 12px 8px; border-bottom: 1px solid var(--divider);">
+    <div class="mash-table-header" style="width: 40px;">#</div>
+    <div class="mash-table-header" style="width: 420px;">Track</div>
+    <div class="mash-table-header" style="width: 220px;">Artist</div>
+    <div class="mash-table-header" style="width: 90px;">BPM</div>
+    <div class="mash-table-header" style="width: 120px;">Key</div>
+    <div class="mash-table-header" style="width: 160px; text-align: right;"></div>
+</div>
+"""
+
+def result_row_html(r, already_added=None):
+    """One results row; already_added=None renders it without an action (while loading)."""
+    bpm_text = f"{r['bpm']:g}" if r.get('bpm') else "—"
+    row_html = f"""
+    <div class="mash-table-row">
+        <div class="mash-idx">{r["index"]}</div>
+        <div class="mash-track">
+            <img src="{thumbnail_url(r.get('album_art'))}" class="mash-cover" onerror="this.style.display='none'">
+            <div class="mash-track-info">
+                <div class="mash-title">{r["title"]}</div>
+                <div class="mash-subtitle">{r["artist"]}</div>
+            </div>
+        </div>
+        <div class="mash-artist">{r["artist"]}</div>
+        <div class="mash-bpm">{bpm_text}</div>
+        <div class="mash-key">{r["key_name"]}</div>
+        <div class="mash-action">
+    """
+    
+    if already_added:
+        row_html += '<button class="mash-btn-outline" disabled>Added</button>'
+    elif already_added is not None:
+        row_html += f'<button class="mash-btn-outline" onclick="addTrack_{r["track_id"]}()">Add to Library</button>'
+    
+    row_html += '</div></div>'
+    return row_html
+
+@st.fragment
+@traced()
+def render_result_row(r):
+    """One results row; its Add button reruns only this fragment, not the page."""
+    already_added = r['track_id'] in st.session_state.added_ids
+    st.markdown(result_row_html(r, already_added), unsafe_allow_html=True)
+    
+    if not already_added:
+        if st.button("Add to Library", key=f"add_{r['track_id']}", help="Add to Library"):
+            add_track(r)
+            st.session_state.added_ids.add(r['track_id'])
+            st.toast(f"Added {r['artist']} — {r['title']}", icon="✅")
+            st.rerun(scope="fragment")
+
+@traced()
+def results_table_html(rows):
+    """Whole results table without actions, re-rendered as enrichments land."""
+    return RESULTS_HEADER_HTML + "".join(result_row_html(r) for r in rows)
+
+@traced()
+def render_local_hits(hits):
+    """Show matches from the local library above the Spotify results."""
+    if not hits:
+        return
+    rows_html = f'<div class="mash-table-header">IN YOUR LIBRARY · {len(hits)}</div>'
+    for hit in hits:
+        rows_html += f"""
+        <div class="mash-table-row">
+            <div class="mash-idx">★</div>
+            <div class="mash-track">
+                <img src="{escape(thumbnail_url(hit.get('album_art')))}" class="mash-cover" onerror="this.style.display='none'">
+                <div class="mash-track-info">
+                    <div class="mash-title">{escape(hit['title'] or '')}</div>
+                    <div class="mash-subtitle">{escape(hit['artist'] or '')}</div>
+                </div>
+            </div>
+            <div class="mash-key">{escape(hit.get('camelot') or '')}</div>
+        </div>
+        """
+    st.markdown(rows_html, unsafe_allow_html=True)
+
+# ============ Debug Panel ============
+def debug_panel_enabled():
+    """Opt in with ?debug=1 or MASHLAB_DEBUG_PANEL=1."""
+    return st.query_params.get("debug") == "1" or os.getenv("MASHLAB_DEBUG_PANEL") == "1"
+
+def render_trace_panel(trace):
+    with st.sidebar.expander(f"⏱ Last rerun · {trace.root.ms:.0f} ms", expanded=True):
+        st.code("\n".join(trace.lines()), language=None)
 
 # ============ Main App ============
 def main():
-    # Initialize
-    init_db()
-    
-    # Handle OAuth callback
-    handle_oauth_callback()
+    with start_trace("rerun", page="app") as trace:
+        render_page()
+    if debug_panel_enabled():
+        render_trace_panel(trace)
+
+def render_page():
+    # Initialize (schema check once per session)
+    if not st.session_state.get('db_ready'):
+        init_db()
+        st.session_state.db_ready = True
     
     # Inject CSS using st.markdown with proper HTML structure
     st.markdown("""
@@ -429,6 +533,12 @@ def main():
     </html>
     """, unsafe_allow_html=True)
     
+    # Handle OAuth callback; the OAuth stack is imported after the styles are sent
+    with span("oauth"):
+        from spotify_oauth import handle_oauth_callback, is_authenticated, show_login_button, show_logout_button
+        handle_oauth_callback()
+        authenticated = is_authenticated()
+    
     # Main card container
     with st.container():
         st.markdown('<div class="mash-card">', unsafe_allow_html=True)
@@ -448,7 +558,7 @@ def main():
             """, unsafe_allow_html=True)
         with col3:
             # Authentication status
-            if is_authenticated():
+            if authenticated:
                 st.success("✅ Authenticated with Spotify")
                 show_logout_button()
             else:
@@ -463,131 +573,133 @@ def main():
             q = st.text_input("Search", placeholder="Search for a track...", key="query_box", label_visibility="collapsed")
         with col2:
             search_disabled = not (q or "").strip()
-            if st.button("Search", disabled=search_disabled, key="search_btn"):
-                q_clean = (q or "").strip()
-                if not q_clean:
-                    st.warning("Type something to search.")
+            search_clicked = st.button("Search", disabled=search_disabled, key="search_btn")
+        
+        local_slot = st.empty()
+        
+        if search_clicked:
+            q_clean = (q or "").strip()
+            if not q_clean:
+                st.warning("Type something to search.")
+            else:
+                # Local library hits render within milliseconds, before the Spotify round trip
+                st.session_state.local_results = search_library(q_clean)
+                with local_slot.container():
+                    render_local_hits(st.session_state.local_results)
+                
+                # Check if Spotify is available
+                sp = get_spotify_client()
+                if not sp:
+                    st.warning("Spotify is not available. Search is disabled.")
+                    return
+                
+                # Search with spinner
+                with st.spinner("Searching..."):
+                    raw_results = search_tracks(q_clean, limit=25)
+                
+                if not raw_results:
+                    st.warning("No search results found. Try a different search term.")
+                    return
+                
+                # Rows render as soon as the ids are known; enrichments fill them in
+                from track_store import TrackStore  # NumPy loads with the first search
+
+                with span("build_rows", tracks=len(raw_results)):
+                    processed_results = TrackStore.from_rows(
+                        build_result_row(i, track) for i, track in enumerate(raw_results, 1) if track.get('id'))
+                rows_by_id = {r['track_id']: r for r in processed_results}
+                track_ids = list(rows_by_id)
+                progress_slot = st.empty()
+                progress_slot.markdown(results_table_html(processed_results), unsafe_allow_html=True)
+                
+                tasks = {}
+                
+                # Audio features need user authentication
+                user_sp = get_user_spotify_client() if authenticated else None
+                if user_sp:
+                    tasks['features'] = traced("get_audio_features")(
+                        partial(get_audio_features, user_sp, track_ids, db_path='murphmixes.db'))
+                
+                # BPM: SQLite cache now, GetSongBPM concurrently for the rest
+                cached_bpms = lookup_cached_bpms(track_ids)
+                for track_id, bpm in cached_bpms.items():
+                    rows_by_id[track_id]['bpm'] = bpm
+                resolver = get_resolver()
+                if resolver:
+                    for r in processed_results:
+                        if r['track_id'] not in cached_bpms:
+                            tasks[('bpm', r['track_id'])] = traced("getsongbpm")(
+                                partial(resolver.get_bpm_for, title=r['title'], artist=r['artist']))
+                
+                features_map = {}
+                fetched_bpms = {}
+                with span("enrich", tasks=len(tasks)):
+                    for name, result, error in fan_out(tasks, timeout=20):
+                        if name == 'features':
+                            if error:
+                                st.error(f"Failed to get audio features: {str(error)}")
+                            else:
+                                features_map = result
+                                for track_id, features in features_map.items():
+                                    if track_id in rows_by_id:
+                                        apply_features(rows_by_id[track_id], features)
+                        elif not error:
+                            track_id = name[1]
+                            fetched_bpms[track_id] = parse_bpm(result)
+                            if fetched_bpms[track_id] is not None:
+                                rows_by_id[track_id]['bpm'] = fetched_bpms[track_id]
+                        progress_slot.markdown(results_table_html(processed_results), unsafe_allow_html=True)
+                progress_slot.empty()
+                save_fetched_bpms(fetched_bpms)
+                
+                if features_map:
+                    st.success("✅ Audio features retrieved with user authentication")
                 else:
-                    # Check if Spotify is available
-                    sp = get_spotify_client()
-                    if not sp:
-                        st.warning("Spotify is not available. Search is disabled.")
-                        return
-                    
-                    # Search with spinner
-                    with st.spinner("Searching..."):
-                        # Search tracks
-                        raw_results = search_tracks(q_clean, limit=25)
-                        
-                        if not raw_results:
-                            st.warning("No search results found. Try a different search term.")
-                            return
-                        
-                        # Get track IDs for audio features
-                        track_ids = [track['id'] for track in raw_results if track.get('id')]
-                        
-                        # Try to get audio features with user authentication first
-                        features_map = {}
-                        if is_authenticated():
-                            user_sp = get_user_spotify_client()
-                            if user_sp:
-                                features_map = get_audio_features_map(user_sp, track_ids)
-                                if features_map:
-                                    st.success("✅ Audio features retrieved with user authentication")
-                        
-                        # Fallback to client credentials if no user auth or features failed
-                        if not features_map:
-                            st.warning("⚠️ Audio features not available. Please login with Spotify for full functionality.")
-                            # You can still show results without audio features
-                        
-                        # Process results
-                        processed_results = []
-                        for i, track in enumerate(raw_results, 1):
-                            track_id = track.get('id')
-                            if not track_id:
-                                continue
-                            
-                            features = features_map.get(track_id, {})
-                            
-                            # Extract data
-                            key_int = features.get('key')
-                            mode_int = features.get('mode')
-                            
-                            # Get album art
-                            album_art = None
-                            if track.get('album') and track['album'].get('images'):
-                                album_art = track['album']['images'][0]['url']
-                            
-                            processed_results.append({
-                                'index': i,
-                                'track_id': track_id,
-                                'title': track.get('name', ''),
-                                'artist': ', '.join(a['name'] for a in (track.get('artists') or [])),
-                                'key_int': key_int,
-                                'mode_int': mode_int,
-                                'key_name': musical_key_name(key_int, mode_int),
-                                'url': (track.get('external_urls') or {}).get('spotify', ''),
-                                'album_art': album_art
-                            })
-                        
-                        st.session_state.search_results = processed_results
-                        st.toast(f"Found {len(processed_results)} tracks!")
+                    st.warning("⚠️ Audio features not available. Please login with Spotify for full functionality.")
+                    # You can still show results without audio features
+                
+                st.session_state.search_results = processed_results
+                st.session_state.added_ids = library_ids(track_ids)
+                st.toast(f"Found {len(processed_results)} tracks!")
+        elif st.session_state.get('local_results'):
+            with local_slot.container():
+                render_local_hits(st.session_state.local_results)
         
         # Divider
         st.markdown('<div style="height: 20px;"></div>', unsafe_allow_html=True)
         
         # Table headers
         if 'search_results' in st.session_state and st.session_state.search_results:
-            st.markdown("""
-            <div style="display: flex; align-items: center; padding: 12px 8px; border-bottom: 1px solid var(--divider);">
-                <div class="mash-table-header" style="width: 40px;">#</div>
-                <div class="mash-table-header" style="width: 420px;">Track</div>
-                <div class="mash-table-header" style="width: 220px;">Artist</div>
-
-                <div class="mash-table-header" style="width: 120px;">Key</div>
-                <div class="mash-table-header" style="width: 160px; text-align: right;"></div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(RESULTS_HEADER_HTML, unsafe_allow_html=True)
+            
+            # Library membership for every row in one query; rows update it themselves
+            if 'added_ids' not in st.session_state:
+                st.session_state.added_ids = library_ids(r['track_id'] for r in st.session_state.search_results)
             
             # Table rows
             for r in st.session_state.search_results:
-                # Check if track is already in library
-                already_added = in_db(r['track_id'])
-                
-                # Create row HTML
-                row_html = f"""
-                <div class="mash-table-row">
-                    <div class="mash-idx">{r["index"]}</div>
-                    <div class="mash-track">
-                        <img src="{r.get('album_art', '')}" class="mash-cover" onerror="this.style.display='none'">
-                        <div class="mash-track-info">
-                            <div class="mash-title">{r["title"]}</div>
-                            <div class="mash-subtitle">{r["artist"]}</div>
-                        </div>
-                    </div>
-                    <div class="mash-artist">{r["artist"]}</div>
-
-                    <div class="mash-key">{r["key_name"]}</div>
-                    <div class="mash-action">
-                """
-                
-                if already_added:
-                    row_html += '<button class="mash-btn-outline" disabled>Added</button>'
-                else:
-                    row_html += f'<button class="mash-btn-outline" onclick="addTrack_{r["track_id"]}()">Add to Library</button>'
-                
-                row_html += '</div></div>'
-                
-                st.markdown(row_html, unsafe_allow_html=True)
-                
-                # Handle add button click
-                if not already_added:
-                    if st.button("Add to Library", key=f"add_{r['track_id']}", help="Add to Library"):
-                        add_track(r)
-                        st.toast(f"Added {r['artist']} — {r['title']}", icon="✅")
-                        st.rerun()
+                render_result_row(r)
         
         st.markdown('</div>', unsafe_allow_html=True)  # Close mash-card
+    
+    # Shared search cache health (process-wide, all sessions)
+    with st.sidebar:
+        stats = search_cache_stats()
+        st.caption("Search cache")
+        st.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+        st.caption(f"{stats['entries']} queries · {stats['approx_bytes'] / 1024:.0f} KB · "
+                   f"{stats['stale_hits']} served stale")
+        
+        user_sp = get_user_spotify_client() if authenticated else None
+        if user_sp and st.button("🔄 Sync playlists"):
+            with st.spinner("Syncing playlists..."):
+                conn = get_conn()
+                report = sync_playlists(user_sp, conn)
+                conn.close()
+            st.caption(f"{report['synced']} updated · {report['unchanged']} unchanged · "
+                       f"+{report['tracks_added']}/−{report['tracks_removed']} tracks")
+            if report['failed']:
+                st.warning(f"{report['failed']} playlists failed to sync")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,19 @@
 import streamlit as st
+import importlib.util
 import sqlite3
 import os
 import pandas as pd
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
+from album_art import album_art_url, thumbnail_url
+from audio_features import get_audio_features as fetch_audio_features
+from db_migrations import ensure_schema
+from spotify_clients import http_session
+from spotify_search import prefetch_next_page, search_tracks_cached
+from library_search import enable_replace_triggers
+from library_export import export_filename, export_library_bytes, export_mime
+from compat import rank_library_partners, to_camelot
+from library_snapshot import get_snapshot, snapshot_version
 
 # ============ Configuration ============
 st.set_page_config(
@@ -17,66 +27,17 @@ st.set_page_config(
 def get_conn():
     conn = sqlite3.connect('murphmixes.db')
     conn.row_factory = sqlite3.Row
+    enable_replace_triggers(conn)  # add_track uses INSERT OR REPLACE
     return conn
 
 def init_db():
-    conn = get_conn()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS tracks (
-            track_id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            artist TEXT NOT NULL,
-            bpm REAL,
-            key_int INTEGER,
-            mode_int INTEGER,
-            energy REAL,
-            camelot TEXT,
-            url TEXT,
-            album_art TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS mashups (
-            mashup_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            left_track_id TEXT,
-            right_track_id TEXT,
-            left_title TEXT,
-            left_artist TEXT,
-            left_bpm REAL,
-            left_key_int INTEGER,
-            left_mode_int INTEGER,
-            left_camelot TEXT,
-            left_url TEXT,
-            right_title TEXT,
-            right_artist TEXT,
-            right_bpm REAL,
-            right_key_int INTEGER,
-            right_mode_int INTEGER,
-            right_camelot TEXT,
-            right_url TEXT,
-            score REAL,
-            reason TEXT,
-            tags TEXT,
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (left_track_id) REFERENCES tracks (track_id),
-            FOREIGN KEY (right_track_id) REFERENCES tracks (track_id)
-        )
-    """)
-    
-    # Add album_art column if it doesn't exist
-    try:
-        conn.execute("ALTER TABLE tracks ADD COLUMN album_art TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    conn.commit()
-    conn.close()
+    """Apply pending schema migrations (a no-op after the first call in this process)."""
+    ensure_schema('murphmixes.db')
 
 # ============ Spotify Integration ============
+@st.cache_resource
 def get_spotify():
+    """One OAuth client per process, sharing the pooled HTTP session."""
     cid = os.getenv("SPOTIPY_CLIENT_ID")
     sec = os.getenv("SPOTIPY_CLIENT_SECRET")
     redirect = os.getenv("SPOTIPY_REDIRECT_URI")
@@ -90,40 +51,36 @@ def get_spotify():
         redirect_uri=redirect,
         scope="user-read-email playlist-read-private playlist-read-collaborative user-library-read",
         open_browser=False,
-        cache_path=".spotipy_cache"
+        cache_path=".spotipy_cache",
+        requests_session=http_session()
     )
     
-    try:
-        sp = Spotify(auth_manager=auth)
-        # Test the connection
-        sp.current_user()
-        return sp
-    except:
-        return None
+    # No current_user() probe: a bad token surfaces on the first real call
+    return Spotify(auth_manager=auth, requests_session=http_session())
 
 # ============ Core Functions ============
-def fetch_spotify_search(query: str, limit: int = 20):
-    """Search Spotify for tracks."""
+PAGE_SIZE = 20
+
+def fetch_spotify_search(query: str, limit: int = PAGE_SIZE, offset: int = 0):
+    """Search Spotify for tracks (shared cache; prefetched pages are hits)."""
     sp = get_spotify()
     if not sp:
         return []
     
     try:
-        results = sp.search(q=query, type='track', limit=limit)
-        return results['tracks']['items']
+        return search_tracks_cached(sp, query, limit=limit, market=None, offset=offset)
     except Exception as e:
         st.error(f"Spotify search failed: {str(e)}")
         return []
 
 def get_audio_features(track_ids):
-    """Get audio features for multiple tracks."""
+    """Get audio features for multiple tracks (SQLite cache first, then chunked API calls)."""
     sp = get_spotify()
     if not sp or not track_ids:
         return {}
     
     try:
-        features = sp.audio_features(track_ids)
-        return {f['id']: f for f in features if f}
+        return fetch_audio_features(sp, track_ids, db_path='murphmixes.db')
     except:
         return {}
 
@@ -156,10 +113,7 @@ def fetch_features_or_preview(sp, tracks):
         # Generate camelot notation
         camelot = to_camelot(key_int, mode_int) if (key_int is not None and mode_int is not None) else ""
         
-        # Get album art
-        album_art = None
-        if track.get('album') and track['album'].get('images'):
-            album_art = track['album']['images'][0]['url']
+        album_art = album_art_url(track, min_px=50)
         
         results.append({
             'track_id': track_id,
@@ -177,6 +131,22 @@ def fetch_features_or_preview(sp, tracks):
     
     return results
 
+def load_results_page(sp, query, offset):
+    """Fetch one page of search results with album art and audio features."""
+    # The cached items are shared across sessions; enrich copies, never the originals
+    raw = [dict(it, album_art=album_art_url(it, min_px=50))  # sized for the 50px thumbnail
+           for it in fetch_spotify_search(query, PAGE_SIZE, offset)]
+    return fetch_features_or_preview(sp, raw), len(raw) == PAGE_SIZE
+
+def prefetch_next_results_page(sp, query):
+    """Warm the next Spotify page and its audio features in the background."""
+    if not sp or not st.session_state.get('search_has_more'):
+        return
+    prefetch_next_page(
+        sp, query, PAGE_SIZE, st.session_state.search_offset, market=None,
+        enrich=lambda ids: fetch_audio_features(sp, ids, db_path='murphmixes.db')
+    )
+
 # ============ Database Operations ============
 def db_add_track(track_data):
     """Add a track to the database."""
@@ -200,13 +170,52 @@ def db_add_track(track_data):
     conn.commit()
     conn.close()
 
-def db_list_tracks():
-    """Get all tracks from the database."""
+# Library view: sorting, filtering and paging run over the shared library
+# snapshot; pages are cached per PRAGMA data_version, so any writer (this
+# app, Flask, Next.js) invalidates them and nothing else does
+LIBRARY_SORT_LABELS = {
+    "created_at": "Date added",
+    "title": "Title",
+    "artist": "Artist",
+    "bpm": "BPM",
+    "camelot": "Camelot",
+    "energy": "Energy",
+}
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_library_page(version, search, sort, descending, limit, offset):
+    """One page of library rows plus the total number of matches, for one data_version."""
+    return get_snapshot('murphmixes.db').page(search=search, sort=sort, descending=descending,
+                                              limit=limit, offset=offset)
+
+def library_export_formats():
+    """CSV always; Parquet and Arrow when pyarrow is installed."""
+    return ["csv", "parquet", "arrow"] if importlib.util.find_spec("pyarrow") else ["csv"]
+
+def library_export_file(fmt, gzip):
+    """Called by the download button on click, not on every rerun."""
     conn = get_conn()
-    cursor = conn.execute("SELECT * FROM tracks ORDER BY created_at DESC")
-    tracks = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return tracks
+    try:
+        return export_library_bytes(conn, fmt, gzip=gzip)
+    finally:
+        conn.close()
+
+def library_frame(rows):
+    """Display columns for the Library grid, from a TrackStore page."""
+    df = rows.to_frame()
+    key_text = [
+        f"{KEYS[int(k)]} {'Major' if int(m) == 1 else 'Minor'}" if pd.notnull(k) and pd.notnull(m) else "—"
+        for k, m in zip(df["key_int"], df["mode_int"])
+    ]
+    return pd.DataFrame({
+        "Cover": [thumbnail_url(u) if isinstance(u, str) else None for u in df["album_art"]],
+        "Artist": df["artist"],
+        "Title": df["title"],
+        "BPM": df["bpm"],
+        "Key": key_text,
+        "Camelot": df["camelot"].fillna("—"),
+        "Spotify": df["url"],
+    })
 
 def db_list_mashups():
     """Get all mashups from the database."""
@@ -219,20 +228,6 @@ def db_list_mashups():
 # ============ Music Theory ============
 KEYS = ["C", "C♯/D♭", "D", "D♯/E♭", "E", "F", "F♯/G♭", "G", "G♯/A♭", "A", "A♯/B♭", "B"]
 
-def to_camelot(key_int, mode_int):
-    """Convert key and mode to Camelot notation."""
-    if key_int is None or mode_int is None:
-        return ""
-    
-    # Camelot wheel mapping
-    camelot_major = ["8B", "3B", "10B", "5B", "12B", "7B", "2B", "9B", "4B", "11B", "6B", "1B"]
-    camelot_minor = ["8A", "3A", "10A", "5A", "12A", "7A", "2A", "9A", "4A", "11A", "6A", "1A"]
-    
-    if mode_int == 1:  # Major
-        return camelot_major[key_int]
-    else:  # Minor
-        return camelot_minor[key_int]
-
 # ============ Main App ============
 def main():
     # Initialize
@@ -302,19 +297,10 @@ def main():
                             st.session_state.results_shown = 0
                             
                             # Fetch initial results
-                            raw = fetch_spotify_search(q_clean, 20)
-                            # Include album art in each item
-                            for it in raw:
-                                try:
-                                    if it.get("album") and it["album"].get("images"):
-                                        it["album_art"] = it["album"]["images"][0]["url"]
-                                    else:
-                                        it["album_art"] = None
-                                except:
-                                    it["album_art"] = None
-                            
-                            results = fetch_features_or_preview(sp, raw)
+                            results, has_more = load_results_page(sp, q_clean, 0)
                             st.session_state.search_results = results
+                            st.session_state.search_offset = PAGE_SIZE
+                            st.session_state.search_has_more = has_more
                             
                     except Exception as e:
                         st.error(f"Spotify search failed. Try again.\n\n{str(e)}")
@@ -334,9 +320,9 @@ def main():
                     
                     with col1:
                         # Album cover
-                        album_art_url = r.get('album_art')
-                        if album_art_url:
-                            st.image(album_art_url, width=50)
+                        cover = r.get('album_art')
+                        if cover:
+                            st.image(thumbnail_url(cover), width=50)
                         else:
                             st.markdown("🎵")
                     
@@ -375,10 +361,20 @@ def main():
                                 st.error(f"Failed to add: {str(e)}")
             
             # Show More button
-            if len(st.session_state.search_results) > st.session_state.results_shown + 10:
+            has_more_remote = st.session_state.get('search_has_more', False)
+            if len(st.session_state.search_results) > st.session_state.results_shown + 10 or has_more_remote:
                 if st.button("Show More Results", type="primary", key="show_more"):
+                    if len(st.session_state.search_results) <= st.session_state.results_shown + 20 and has_more_remote:
+                        # Usually a cache hit thanks to the prefetch below
+                        more, has_more = load_results_page(sp, query, st.session_state.search_offset)
+                        st.session_state.search_results += more
+                        st.session_state.search_offset += PAGE_SIZE
+                        st.session_state.search_has_more = has_more
                     st.session_state.results_shown += 10
                     st.rerun()
+            
+            # Page is on screen: fetch the next one while the user reads it
+            prefetch_next_results_page(sp, query)
         else:
             st.info("Search for tracks to see results here.")
     
@@ -386,64 +382,107 @@ def main():
     with tabs[1]:
         st.subheader("Library — your curated tracks")
         
-        # Load tracks
-        tracks = db_list_tracks()
-        df = pd.DataFrame(tracks)
+        f1, f2, f3, f4 = st.columns([2, 1, 0.6, 0.6])
+        with f1:
+            lib_query = st.text_input("Filter", placeholder="Filter by title or artist...", key="lib_filter")
+        with f2:
+            lib_sort = st.selectbox("Sort by", list(LIBRARY_SORT_LABELS), key="lib_sort",
+                                    format_func=LIBRARY_SORT_LABELS.get)
+        with f3:
+            lib_desc = st.toggle("Descending", value=True, key="lib_desc")
+        with f4:
+            lib_page_size = st.selectbox("Rows", [100, 250, 500], key="lib_page_size")
         
-        if df.empty:
+        # Page number resets whenever the filter/sort changes
+        view_key = (lib_query, lib_sort, lib_desc, lib_page_size)
+        if st.session_state.get("lib_view_key") != view_key:
+            st.session_state.lib_view_key = view_key
+            st.session_state.lib_page = 1
+        
+        page = st.session_state.lib_page
+        lib_version = snapshot_version('murphmixes.db')
+        rows, total = cached_library_page(lib_version, lib_query, lib_sort, lib_desc, lib_page_size, (page - 1) * lib_page_size)
+        pages = max(1, -(-total // lib_page_size))
+        if page > pages:
+            # The library shrank under us: show the last page instead
+            page = st.session_state.lib_page = pages
+            rows, total = cached_library_page(lib_version, lib_query, lib_sort, lib_desc, lib_page_size, (page - 1) * lib_page_size)
+        
+        if total == 0 and not lib_query:
             st.info("No tracks in your library yet. Search for tracks and add them to get started.")
+        elif total == 0:
+            st.info("No library tracks match this filter.")
         else:
-            # Export button
-            st.download_button(
-                "Export Library CSV",
-                data=df.to_csv(index=False).encode("utf-8"),
-                file_name="mashlab_library.csv",
-                mime="text/csv"
+            # One virtualized grid instead of a container per track
+            st.dataframe(
+                library_frame(rows),
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "Cover": st.column_config.ImageColumn("", width="small"),
+                    "BPM": st.column_config.NumberColumn(format="%.1f"),
+                    "Spotify": st.column_config.LinkColumn(display_text="Open"),
+                },
             )
             
-            # Library table
-            for i, row in df.iterrows():
-                with st.container(border=True):
-                    col1, col2, col3, col4, col5, col6, col7 = st.columns([0.5, 1, 1, 0.8, 0.8, 0.8, 1])
-                    
-                    with col1:
-                        # Album cover
-                        album_art = row.get('album_art', '')
-                        if album_art:
-                            st.image(album_art, width=50)
-                        else:
-                            st.markdown("🎵")
-                    
-                    with col2:
-                        st.write(f"**{row['artist']}**")
-                    
-                    with col3:
-                        st.write(f"**{row['title']}**")
-                    
-                    with col4:
-                        bpm = round(row['bpm'], 1) if pd.notnull(row['bpm']) else '—'
-                        st.write(f"**{bpm}**")
-                    
-                    with col5:
-                        key_text = (
-                            f"{KEYS[int(row['key_int'])]} {'Major' if int(row['mode_int']) == 1 else 'Minor'}"
-                            if (pd.notnull(row['key_int']) and pd.notnull(row['mode_int']))
-                            else "—"
-                        )
-                        st.write(f"**{key_text}**")
-                    
-                    with col6:
-                        camelot = row['camelot'] if row['camelot'] else "—"
-                        st.write(f"**{camelot}**")
-                    
-                    with col7:
-                        if st.button("Play in Spotify", key=f"play_{row['track_id']}"):
-                            st.link_button("🎵 Open in Spotify", row['url'])
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("← Previous", disabled=page <= 1, key="lib_prev"):
+                    st.session_state.lib_page = page - 1
+                    st.rerun()
+            with p2:
+                first = (page - 1) * lib_page_size + 1
+                st.caption(f"{first}–{first + len(rows) - 1} of {total} tracks · page {page}/{pages}")
+            with p3:
+                if st.button("Next →", disabled=page >= pages, key="lib_next"):
+                    st.session_state.lib_page = page + 1
+                    st.rerun()
+            
+            # Export: generated in batches only when the button is clicked
+            e1, e2, e3 = st.columns([1, 1, 2])
+            with e1:
+                export_fmt = st.selectbox("Export format", library_export_formats(),
+                                          format_func=str.upper, key="lib_export_fmt")
+            with e2:
+                export_gzip = st.checkbox("gzip", value=False, key="lib_export_gzip",
+                                          disabled=export_fmt != "csv",
+                                          help="Parquet and Arrow are already compressed")
+            with e3:
+                st.download_button(
+                    f"Export Library {export_fmt.upper()}",
+                    data=lambda: library_export_file(export_fmt, export_gzip),
+                    file_name=export_filename(export_fmt, export_gzip),
+                    mime=export_mime(export_fmt, export_gzip),
+                )
     
     # ---------- Recommender ----------
     with tabs[2]:
         st.subheader("Recommender — generate ideas from Library")
-        st.info("This feature will be implemented next.")
+        
+        snapshot = get_snapshot('murphmixes.db')
+        if not len(snapshot):
+            st.info("Add tracks to your library to get recommendations.")
+        else:
+            labels = dict(zip(snapshot.store.values("track_id"),
+                              (f"{a} — {t}" for a, t in zip(snapshot.store.values("artist"), snapshot.store.values("title")))))
+            r1, r2, r3 = st.columns([2, 1, 1])
+            with r1:
+                seed_id = st.selectbox("Seed track", list(labels), format_func=labels.get, key="rec_seed")
+            with r2:
+                pct_tol = st.slider("Tempo tolerance (%)", 1.0, 20.0, 8.0, 0.5, key="rec_pct_tol")
+            with r3:
+                key_mode = st.selectbox("Key matching", ["Harmonic", "Exact", "Ignore"], key="rec_key_mode")
+            
+            partners = rank_library_partners(snapshot, seed_id, pct_tol=pct_tol, key_mode=key_mode)
+            st.dataframe(
+                pd.DataFrame({
+                    "Track": [labels[track_id] for track_id, _score, _reason in partners],
+                    "Score": [score for _track_id, score, _reason in partners],
+                    "Why": [reason for _track_id, _score, reason in partners],
+                }),
+                hide_index=True,
+                use_container_width=True,
+            )
     
     # ---------- Mashups ----------
     with tabs[3]:
@@ -0,0 +1,185 @@
+"""
+Track genres from Spotify artist genres, resolved in bulk and cached.
+
+Spotify only assigns genres to artists, so a track's genres are the union
+of its artists' genres, primary artist first. Both hops are cached in
+SQLite: track_artists maps a track to its artist ids and artist_genres
+holds each artist's genres. A batch of track ids therefore costs at most
+one /tracks call per 50 unknown tracks and one /artists call per 50
+unknown artists, and nothing once the cache is warm.
+
+If Spotify fails (even while its breaker is still closed) and the cache
+cannot cover for it, track_genres raises GenresUnavailable rather than
+reporting those tracks as unknown or genre-less.
+"""
+from __future__ import annotations
+import json
+import logging
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from circuit_breaker import UpstreamError, breaker, is_outage
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 50         # /tracks and /artists maximum
+MAX_WORKERS = 4
+FRESH_FOR_DAYS = 30     # artist genres drift slowly
+STALE_FALLBACK_DAYS = 3650  # any cached row beats nothing while Spotify is down
+
+_SPOTIFY_ID = re.compile(r"^[0-9A-Za-z]{22}$")
+
+Writer = Callable[[str, List[Tuple[Any, ...]]], Any]
+
+class GenresUnavailable(UpstreamError):
+    """Spotify failed before every id was resolved; genres holds the ids that were."""
+    def __init__(self, genres: Dict[str, List[str]], unresolved: List[str], cause: BaseException):
+        super().__init__(f"Spotify unavailable for {len(unresolved)} track(s): {cause}")
+        self.genres = genres
+        self.unresolved = unresolved
+
+def create_genre_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS track_artists(
+          track_id  TEXT NOT NULL,
+          artist_id TEXT NOT NULL,
+          position  INTEGER NOT NULL,
+          PRIMARY KEY (track_id, artist_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS artist_genres(
+          artist_id  TEXT PRIMARY KEY,
+          name       TEXT,
+          genres     TEXT NOT NULL,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+INSERT_TRACK_ARTIST = "INSERT OR REPLACE INTO track_artists (track_id, artist_id, position) VALUES (?, ?, ?)"
+UPSERT_ARTIST_GENRES = """
+    INSERT INTO artist_genres (artist_id, name, genres, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(artist_id) DO UPDATE SET
+        name = excluded.name, genres = excluded.genres, updated_at = excluded.updated_at
+"""
+
+def is_spotify_id(value: str) -> bool:
+    return bool(_SPOTIFY_ID.match(value or ""))
+
+def _chunks(ids: Sequence[str], size: int = BATCH_SIZE) -> List[Sequence[str]]:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+def _placeholders(ids: Sequence[str]) -> str:
+    return ",".join("?" * len(ids))
+
+def load_track_artists(conn: sqlite3.Connection, track_ids: Sequence[str]) -> Dict[str, List[str]]:
+    """Cached artist ids per track, in credit order."""
+    artists: Dict[str, List[str]] = {}
+    for chunk in _chunks(track_ids, 500):
+        for track_id, artist_id in conn.execute(f"""
+            SELECT track_id, artist_id FROM track_artists
+            WHERE track_id IN ({_placeholders(chunk)}) ORDER BY track_id, position
+        """, chunk):
+            artists.setdefault(track_id, []).append(artist_id)
+    return artists
+
+def load_artist_genres(conn: sqlite3.Connection, artist_ids: Sequence[str],
+                       max_age_days: int = FRESH_FOR_DAYS) -> Dict[str, List[str]]:
+    """Cached genres for artists refreshed within max_age_days."""
+    genres: Dict[str, List[str]] = {}
+    for chunk in _chunks(artist_ids, 500):
+        for artist_id, raw in conn.execute(f"""
+            SELECT artist_id, genres FROM artist_genres
+            WHERE artist_id IN ({_placeholders(chunk)}) AND updated_at >= datetime('now', ?)
+        """, (*chunk, f"-{max_age_days} days")):
+            genres[artist_id] = json.loads(raw)
+    return genres
+
+def _fetch_all(fetch: Callable[[Sequence[str]], List[Optional[Dict[str, Any]]]],
+               ids: Sequence[str]) -> Tuple[List[Dict[str, Any]], List[str], Optional[BaseException]]:
+    """
+    Run fetch over 50-id chunks concurrently through the Spotify breaker,
+    dropping unknown ids. Returns (items, ids of chunks that failed with an
+    outage, the last outage error).
+    """
+    def guarded(chunk):
+        try:
+            return breaker("spotify").call(fetch, chunk), None
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            log.warning("Spotify unavailable, using cached genres only: %s", e)
+            return [], e
+
+    chunks = _chunks(ids)
+    if len(chunks) == 1:
+        pages = [guarded(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks)), thread_name_prefix="genres") as pool:
+            pages = list(pool.map(guarded, chunks))
+    items = [item for page, _error in pages for item in page if item]
+    failed = [i for chunk, (_page, error) in zip(chunks, pages) if error is not None for i in chunk]
+    errors = [error for _page, error in pages if error is not None]
+    return items, failed, errors[-1] if errors else None
+
+def _executemany_writer(conn: sqlite3.Connection) -> Writer:
+    def write(sql: str, rows: List[Tuple[Any, ...]]) -> None:
+        conn.executemany(sql, rows)
+        conn.commit()
+    return write
+
+def track_genres(sp, conn: sqlite3.Connection, track_ids: Iterable[str],
+                 write: Optional[Writer] = None) -> Dict[str, List[str]]:
+    """
+    Genres for each known Spotify track id (ids Spotify does not know are
+    left out). New cache rows go through write(sql, rows), e.g. a
+    write-behind queue; by default they are committed on conn. Raises
+    GenresUnavailable if an outage left any id unresolved.
+    """
+    write = write or _executemany_writer(conn)
+    ids = list(dict.fromkeys(t for t in track_ids if is_spotify_id(t)))
+
+    artists = load_track_artists(conn, ids)
+    missing_tracks = [t for t in ids if t not in artists]
+    failed_tracks: List[str] = []
+    failed_artists: List[str] = []
+    outage: Optional[BaseException] = None
+    if missing_tracks:
+        fetched, failed_tracks, outage = _fetch_all(lambda chunk: sp.tracks(list(chunk))["tracks"], missing_tracks)
+        rows = []
+        for track in fetched:
+            artist_ids = [a["id"] for a in track.get("artists") or [] if a.get("id")]
+            artists[track["id"]] = artist_ids
+            rows.extend((track["id"], artist_id, pos) for pos, artist_id in enumerate(artist_ids))
+        if rows:
+            write(INSERT_TRACK_ARTIST, rows)
+
+    artist_ids = list(dict.fromkeys(a for t in ids for a in artists.get(t, [])))
+    genres = load_artist_genres(conn, artist_ids)
+    missing_artists = [a for a in artist_ids if a not in genres]
+    if missing_artists:
+        fetched, failed_artists, error = _fetch_all(lambda chunk: sp.artists(list(chunk))["artists"], missing_artists)
+        outage = error or outage
+        for artist in fetched:
+            genres[artist["id"]] = artist.get("genres") or []
+        if fetched:
+            write(UPSERT_ARTIST_GENRES, [(a["id"], a.get("name"), json.dumps(genres[a["id"]])) for a in fetched])
+        unresolved = [a for a in missing_artists if a not in genres]
+        if unresolved:
+            # Spotify is down: expired rows beat no genres at all
+            genres.update(load_artist_genres(conn, unresolved, STALE_FALLBACK_DAYS))
+
+    unresolved_tracks = set(failed_tracks)
+    unresolved_artists = {a for a in failed_artists if a not in genres}
+    unresolved = [t for t in ids if t in unresolved_tracks
+                  or any(a in unresolved_artists for a in artists.get(t, []))]
+    result = {
+        t: list(dict.fromkeys(g for a in artists[t] for g in genres.get(a, [])))
+        for t in ids if t in artists and t not in unresolved
+    }
+    if unresolved:
+        raise GenresUnavailable(result, unresolved, outage)
+    return result
@@ -0,0 +1,134 @@
+"""
+Audio-features service with a persistent SQLite cache.
+
+Ids already fetched recently are served from track_sources.spotify_features.
+The rest are requested from Spotify in 100-id chunks (the API maximum), with
+the chunks fetched in parallel, and written back so the next search or rerun
+for the same tracks makes no network call at all.
+
+Age is taken from features_fetched_at, which only this module sets (other
+writers bump updated_at for unrelated columns). Ids Spotify has no features
+for are stored with NULL features and not asked for again for
+MISSING_FOR_DAYS.
+"""
+from __future__ import annotations
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from circuit_breaker import breaker, is_outage
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100        # Spotify's /audio-features limit
+MAX_WORKERS = 4
+FRESH_FOR_DAYS = 30     # same window as isMetricsFresh() in lib/db.ts
+MISSING_FOR_DAYS = 1    # retry ids Spotify had no features for after a day
+
+def _chunks(ids: List[str], size: int) -> List[List[str]]:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+def load_cached_features(conn: sqlite3.Connection, ids: List[str],
+                         max_age_days: Optional[int] = FRESH_FOR_DAYS) -> Dict[str, Dict[str, Any]]:
+    """Features fetched within max_age_days (any age for None), keyed by id."""
+    age = "" if max_age_days is None else "AND features_fetched_at >= datetime('now', ?)"
+    found: Dict[str, Dict[str, Any]] = {}
+    for chunk in _chunks(ids, 500):
+        placeholders = ",".join("?" * len(chunk))
+        params = (*chunk,) if max_age_days is None else (*chunk, f"-{int(max_age_days)} days")
+        rows = conn.execute(f"""
+            SELECT spotify_id, spotify_features FROM track_sources
+            WHERE spotify_id IN ({placeholders})
+              AND spotify_features IS NOT NULL {age}
+        """, params).fetchall()
+        for spotify_id, payload in rows:
+            try:
+                found[spotify_id] = json.loads(payload)
+            except (TypeError, ValueError):
+                continue
+    return found
+
+def load_known_missing(conn: sqlite3.Connection, ids: List[str],
+                       max_age_days: int = MISSING_FOR_DAYS) -> Set[str]:
+    """Ids Spotify recently returned no features for."""
+    missing: Set[str] = set()
+    for chunk in _chunks(ids, 500):
+        placeholders = ",".join("?" * len(chunk))
+        missing.update(row[0] for row in conn.execute(f"""
+            SELECT spotify_id FROM track_sources
+            WHERE spotify_id IN ({placeholders})
+              AND spotify_features IS NULL
+              AND features_fetched_at >= datetime('now', ?)
+        """, (*chunk, f"-{int(max_age_days)} days")))
+    return missing
+
+def store_features(conn: sqlite3.Connection, features: Iterable[Dict[str, Any]],
+                   missing: Iterable[str] = ()) -> None:
+    """
+    Upsert features, and NULL features for the ids in missing, without
+    touching the other source columns of track_sources.
+    """
+    rows = [(f["id"], json.dumps(f)) for f in features] + [(i, None) for i in missing]
+    conn.executemany("""
+        INSERT INTO track_sources (spotify_id, spotify_features, features_fetched_at, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(spotify_id) DO UPDATE SET
+          spotify_features = excluded.spotify_features,
+          features_fetched_at = CURRENT_TIMESTAMP,
+          updated_at = CURRENT_TIMESTAMP
+    """, rows)
+    conn.commit()
+
+def fetch_remote_features(sp, ids: List[str], max_workers: int = MAX_WORKERS) -> List[Dict[str, Any]]:
+    """
+    Fetch features for ids in parallel 100-id chunks. A failed chunk is
+    logged and skipped; the error is raised only if every chunk failed.
+    """
+    chunks = _chunks(ids, CHUNK_SIZE)
+    if not chunks:
+        return []
+    results: List[Dict[str, Any]] = []
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        futures = [pool.submit(breaker("spotify").call, sp.audio_features, chunk) for chunk in chunks]
+        for future in futures:
+            try:
+                results.extend(f for f in (future.result() or []) if f)
+            except Exception as e:
+                log.warning("audio_features chunk failed: %s", e)
+                errors.append(e)
+    if errors and len(errors) == len(chunks):
+        raise errors[0]
+    return results
+
+def get_audio_features(sp, ids: Iterable[str], db_path: str = "murphmixes.db",
+                       max_age_days: int = FRESH_FOR_DAYS) -> Dict[str, Dict[str, Any]]:
+    """Features for ids keyed by id: fresh cache rows first, Spotify for the rest."""
+    unique = list(dict.fromkeys(i for i in ids if i))
+    if not unique:
+        return {}
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        features = load_cached_features(conn, unique, max_age_days)
+        missing = [i for i in unique if i not in features]
+        if missing:
+            known_missing = load_known_missing(conn, missing)
+            missing = [i for i in missing if i not in known_missing]
+        if missing and sp is not None:
+            try:
+                fetched = fetch_remote_features(sp, missing)
+            except Exception as e:
+                if not is_outage(e):
+                    raise
+                log.warning("Spotify unavailable, serving stale audio features: %s", e)
+                # Any cached row beats nothing while Spotify is down
+                features.update(load_cached_features(conn, missing, None))
+                return features
+            returned = {f["id"] for f in fetched}
+            store_features(conn, fetched, [i for i in missing if i not in returned])
+            features.update((f["id"], f) for f in fetched)
+        return features
+    finally:
+        conn.close()
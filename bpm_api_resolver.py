@@ -1,18 +1,17 @@
 from __future__ import annotations
-import os, urllib.parse, re
-from typing import Optional, Dict, Any
-import requests
-from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from startup import load_env, profile_startup, span
+if __name__ == "__main__":
+    profile_startup()  # MASHLAB_PROFILE_STARTUP=1 times the imports below
+import os, urllib.parse
+from typing import TYPE_CHECKING, Optional, Dict, Any
+from circuit_breaker import UpstreamError, breaker, check_response
+from spotify_clients import get_app_client, http_session
+from track_keys import clean as _clean
 
-GETSONGBPM_BASE = "https://api.getsong.co"
+if TYPE_CHECKING:
+    import requests
 
-def _clean(s: str) -> str:
-    s = s.lower().strip()
-    s = re.sub(r"\s*\([^)]*\)", "", s)  # drop (...) like (feat. X)
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    return re.sub(r"\s+", " ", s).strip()
+GETSONGBPM_BASE = "https://api.getsong.co"
 
 class BPMApiResolver:
     """
@@ -20,12 +19,12 @@ class BPMApiResolver:
     return '-' (string). Never guess or compute locally.
     """
     def __init__(self, market: str = "US"):
-        load_dotenv(override=True)
-        cid = os.getenv("SPOTIFY_CLIENT_ID")
-        cs  = os.getenv("SPOTIFY_CLIENT_SECRET")
-        if not cid or not cs:
+        load_env(override=True)  # .env beats the shell environment, as it always has here
+        self._cid = os.getenv("SPOTIFY_CLIENT_ID")
+        self._cs  = os.getenv("SPOTIFY_CLIENT_SECRET")
+        if not self._cid or not self._cs:
             raise RuntimeError("Missing SPOTIFY_CLIENT_ID/SECRET")
-        self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=cid, client_secret=cs))
+        self._sp = None
         self.market = market
         self.gsbpm_key = os.getenv("GETSONGBPM_API_KEY")
         if not self.gsbpm_key:
@@ -38,20 +37,40 @@ class BPMApiResolver:
         meta = self._resolve_track_meta(query=query, uri=uri)
         if not meta: 
             return "-"
-        bpm = self._fetch_bpm_getsongbpm(title=meta["title"], artist=meta["artist"])
+        try:
+            bpm = self._fetch_bpm_getsongbpm(title=meta["title"], artist=meta["artist"])
+        except UpstreamError:
+            return "-"
+        return bpm if bpm is not None else "-"
+
+    def get_bpm_for(self, *, title: str, artist: str) -> str:
+        """
+        Same as get_bpm() for a track whose title/artist are already known
+        (e.g. from search results), skipping the Spotify lookup. Raises
+        UpstreamError while GetSongBPM is down, so callers do not cache "-".
+        """
+        bpm = self._fetch_bpm_getsongbpm(title=title, artist=artist)
         return bpm if bpm is not None else "-"
 
+    @property
+    def sp(self):
+        """The Spotify client, created (and spotipy imported) on first use."""
+        if self._sp is None:
+            self._sp = get_app_client(self._cid, self._cs)
+        return self._sp
+
     # ----- internals -----
     def _resolve_track_meta(self, *, query: Optional[str], uri: Optional[str]) -> Optional[Dict[str, Any]]:
         try:
+            spotify = breaker("spotify")
             if uri:
-                t = self.sp.track(uri)
+                t = spotify.call(self.sp.track, uri)
             elif query:
-                res = self.sp.search(q=query, type="track", limit=1, market=self.market)
+                res = spotify.call(self.sp.search, q=query, type="track", limit=1, market=self.market)
                 items = (res.get("tracks", {}) or {}).get("items", []) or []
                 if not items: 
                     return None
-                t = self.sp.track(items[0]["id"])
+                t = spotify.call(self.sp.track, items[0]["id"])
             else:
                 return None
             title = t.get("name") or ""
@@ -60,16 +79,28 @@ class BPMApiResolver:
         except Exception:
             return None
 
+    def _gsbpm_get(self, url: str) -> requests.Response:
+        """GET through the getsongbpm circuit breaker; transport errors raise UpstreamError."""
+        import requests
+
+        def get():
+            try:
+                r = http_session().get(url, headers={"X-API-KEY": self.gsbpm_key}, timeout=12)
+            except requests.RequestException as e:
+                raise UpstreamError(f"GetSongBPM: {e}") from e
+            return check_response(r)
+        return breaker("getsongbpm").call(get)
+
     def _fetch_bpm_getsongbpm(self, *, title: str, artist: str) -> Optional[str]:
         # Step 1: search for both song & artist
         lookup = f"song:{title} artist:{artist}"
         url = f"{GETSONGBPM_BASE}/search/?type=both&lookup={urllib.parse.quote_plus(lookup)}"
+        r = self._gsbpm_get(url)
+        if r.status_code != 200:
+            return None
         try:
-            r = requests.get(url, headers={"X-API-KEY": self.gsbpm_key}, timeout=12)
-            if r.status_code != 200:
-                return None
             data = (r.json() or {}).get("search") or []
-        except Exception:
+        except ValueError:
             return None
         if not data:
             return None
@@ -89,12 +120,12 @@ class BPMApiResolver:
 
         # Step 2: get the actual BPM data for the picked track
         url = f"{GETSONGBPM_BASE}/song/{picked_id}/"
+        r = self._gsbpm_get(url)
+        if r.status_code != 200:
+            return None
         try:
-            r = requests.get(url, headers={"X-API-KEY": self.gsbpm_key}, timeout=12)
-            if r.status_code != 200:
-                return None
             song_data = r.json() or {}
-        except Exception:
+        except ValueError:
             return None
 
         # Extract BPM - only return if it's a valid numeric tempo
@@ -112,17 +143,27 @@ if __name__ == "__main__":
     parser.add_argument("query", nargs="?", help="Search query (artist - title)")
     parser.add_argument("--uri", help="Spotify URI")
     parser.add_argument("--market", default="US", help="Market for Spotify search")
+    parser.add_argument("--file", help="Bulk mode: one query per line ('-' for stdin); prints query<TAB>bpm")
     
     args = parser.parse_args()
     
-    if not args.query and not args.uri:
-        print("Error: Must provide either query or --uri")
+    if not args.query and not args.uri and not args.file:
+        print("Error: Must provide a query, --uri or --file")
         sys.exit(1)
     
     try:
-        resolver = BPMApiResolver(market=args.market)
-        bpm = resolver.get_bpm(query=args.query, uri=args.uri)
-        print(bpm)
+        with span("BPMApiResolver()"):
+            resolver = BPMApiResolver(market=args.market)
+        if args.file:
+            lines = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+            with lines:
+                for line in lines:
+                    query = line.strip()
+                    if query:
+                        print(f"{query}\t{resolver.get_bpm(query=query)}", flush=True)
+        else:
+            bpm = resolver.get_bpm(query=args.query, uri=args.uri)
+            print(bpm)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -0,0 +1,62 @@
+"""
+simple_bpm_cache access and a process-wide BPMApiResolver.
+
+GetSongBPM answers are stored per Spotify id. A definitive "no BPM" answer
+is stored too (bpm NULL) and trusted for a week, so tracks GetSongBPM does
+not know are not looked up on every search.
+"""
+from __future__ import annotations
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional
+
+log = logging.getLogger(__name__)
+
+MISS_RETRY_DAYS = 7
+
+_resolver = None
+_resolver_failed = False
+_resolver_lock = threading.Lock()
+
+def get_resolver():
+    """Shared BPMApiResolver, or None when its credentials are not configured."""
+    global _resolver, _resolver_failed
+    if _resolver is not None or _resolver_failed:
+        return _resolver
+    with _resolver_lock:
+        if _resolver is None and not _resolver_failed:
+            from bpm_api_resolver import BPMApiResolver
+            try:
+                _resolver = BPMApiResolver()
+            except RuntimeError as e:
+                log.info("BPM lookups disabled: %s", e)
+                _resolver_failed = True
+    return _resolver
+
+def load_cached_bpms(conn: sqlite3.Connection, ids: Iterable[str]) -> Dict[str, Optional[float]]:
+    """Cached answers keyed by id; a None value means "known to have no BPM"."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    placeholders = ",".join("?" * len(ids))
+    rows = conn.execute(f"""
+        SELECT spotify_id, bpm FROM simple_bpm_cache
+        WHERE spotify_id IN ({placeholders})
+          AND (bpm IS NOT NULL OR created_at >= datetime('now', ?))
+    """, (*ids, f"-{MISS_RETRY_DAYS} days")).fetchall()
+    return {spotify_id: bpm for spotify_id, bpm in rows}
+
+def store_bpms(conn: sqlite3.Connection, bpms: Dict[str, Optional[float]], source: str = "getsongbpm") -> None:
+    conn.executemany("""
+        INSERT OR REPLACE INTO simple_bpm_cache (spotify_id, bpm, confidence, source, created_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, [(spotify_id, bpm, 1.0 if bpm is not None else 0.0, source) for spotify_id, bpm in bpms.items()])
+    conn.commit()
+
+def parse_bpm(value: str) -> Optional[float]:
+    """BPMApiResolver returns a numeric string or "-"."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,192 @@
+"""
+Per-upstream circuit breakers.
+
+After `failure_threshold` consecutive failures an upstream's breaker opens
+and calls fail immediately with CircuitOpenError instead of waiting out a
+timeout. Once `reset_timeout` seconds have passed, a single probe call is let
+through (half-open): success closes the breaker, failure re-opens it for
+another reset_timeout. Callers catch CircuitOpenError (or UpstreamError) and
+fall back to cached data.
+
+Only outages count as failures: transport errors, timeouts, UpstreamError,
+5xx and 429. A 4xx such as a 404 for an unknown id is the upstream working
+correctly, and any other exception (KeyError, TypeError, ...) is a bug that
+must reach the caller rather than be mistaken for an outage.
+"""
+from __future__ import annotations
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# name -> (failure_threshold, reset_timeout seconds)
+UPSTREAMS: Dict[str, Tuple[int, float]] = {
+    "spotify": (5, 30.0),
+    "getsongbpm": (3, 60.0),
+    "deezer": (5, 30.0),
+}
+
+class UpstreamError(Exception):
+    """An upstream is failing; callers should use cached data."""
+
+class CircuitOpenError(UpstreamError):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+def _transport_errors() -> Tuple[type, ...]:
+    errors: Tuple[type, ...] = (UpstreamError, ConnectionError, TimeoutError)
+    requests = sys.modules.get("requests")  # only its own errors can be in flight if it is loaded
+    if requests is not None:
+        errors += (requests.ConnectionError, requests.Timeout)
+    return errors
+
+def _http_status(exc: BaseException) -> Any:
+    status = getattr(exc, "http_status", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def is_outage(exc: BaseException) -> bool:
+    """5xx/429 responses, transport errors and UpstreamError; nothing else."""
+    status = _http_status(exc)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(exc, _transport_errors())
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._counts = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def _before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                self._counts["calls"] += 1
+                return
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self._counts["calls"] += 1
+                return
+            self._counts["rejected"] += 1
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a probe through; 0 when it would now."""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                log.info("%s: circuit closed", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """A call ended without telling us anything about the upstream."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counts["failures"] += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._counts["opened"] += 1
+                    log.warning("%s: circuit open for %.0fs after %d failures",
+                                self.name, self.reset_timeout, self._failures)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run fn through the breaker; raises CircuitOpenError without calling fn while open."""
+        try:
+            self._before_call()
+        except CircuitOpenError:
+            metrics.inc("mashlab_upstream_calls_total", upstream=self.name, outcome="rejected")
+            raise
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            outage = is_outage(e)
+            if outage:
+                self.record_failure()
+            elif _http_status(e) is not None:
+                self.record_success()  # the upstream answered, e.g. with a 404
+            else:
+                self.release_probe()
+            self._record_call(start, "outage" if outage else "error")
+            raise
+        self.record_success()
+        self._record_call(start, "ok")
+        return result
+
+    def _record_call(self, start: float, outcome: str) -> None:
+        metrics.observe("mashlab_upstream_call_seconds", time.perf_counter() - start, upstream=self.name)
+        metrics.inc("mashlab_upstream_calls_total", upstream=self.name, outcome=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._current_state(), "consecutive_failures": self._failures, **self._counts}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for an upstream, configured from UPSTREAMS."""
+    cb = _breakers.get(name)
+    if cb is None:
+        with _breakers_lock:
+            cb = _breakers.get(name)
+            if cb is None:
+                threshold, reset = UPSTREAMS.get(name, (5, 30.0))
+                cb = _breakers[name] = CircuitBreaker(name, threshold, reset)
+    return cb
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        return {name: cb.stats() for name, cb in _breakers.items()}
+
+def check_response(response: Any) -> Any:
+    """Raise UpstreamError for a 5xx/429 requests.Response so the breaker counts it."""
+    if response.status_code >= 500 or response.status_code == 429:
+        error = UpstreamError(f"HTTP {response.status_code} from {response.url}")
+        error.response = response  # type: ignore[attr-defined]
+        raise error
+    return response
@@ -0,0 +1,321 @@
+"""
+Versioned schema migrations for murphmixes.db.
+
+Every step runs once, in order, and records its version in
+PRAGMA user_version. ensure_schema() only reads that pragma after the first
+check in a process, so calling it on every Streamlit rerun is free.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+from typing import Callable, List, NamedTuple, Sequence, Tuple
+
+DB_PATH = "murphmixes.db"
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+    # False for steps that commit on their own (e.g. batched copies)
+    transactional: bool = True
+
+# ============ Helpers ============
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Sequence[Tuple[str, str]]) -> None:
+    """ALTER TABLE only for columns that are really missing (no try/except probing)."""
+    existing = set(_columns(conn, table))
+    for name, decl in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+# ============ Steps ============
+def _m001_tracks(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            track_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            bpm REAL,
+            key_int INTEGER,
+            mode_int INTEGER,
+            energy REAL,
+            camelot TEXT,
+            url TEXT,
+            album_art TEXT,
+            source TEXT,
+            tags TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Older databases predate some of these. SQLite refuses a non-constant
+    # DEFAULT on ADD COLUMN, so created_at is backfilled and then kept
+    # populated by a trigger instead.
+    had_created_at = "created_at" in _columns(conn, "tracks")
+    _add_missing_columns(conn, "tracks", [
+        ("bpm", "REAL"),
+        ("album_art", "TEXT"),
+        ("source", "TEXT"),
+        ("tags", "TEXT"),
+        ("created_at", "TIMESTAMP"),
+    ])
+    if not had_created_at:
+        conn.execute("UPDATE tracks SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_tracks_created_at
+            AFTER INSERT ON tracks WHEN NEW.created_at IS NULL
+            BEGIN
+                UPDATE tracks SET created_at = CURRENT_TIMESTAMP WHERE track_id = NEW.track_id;
+            END
+        """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_created_at ON tracks(created_at)")
+
+def _m002_mashups(conn: sqlite3.Connection) -> None:
+    # Runs outside a wrapping transaction: the v1.1 conversion commits in
+    # checkpointed batches so a large table never holds one long lock.
+    from migrate_db import migrate_mashups, needs_mashups_migration
+
+    if needs_mashups_migration(conn):
+        migrate_mashups(conn)
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mashups(
+          mashup_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+          left_id     TEXT NOT NULL,
+          right_id    TEXT NOT NULL,
+          score       REAL,
+          reason      TEXT,
+          created_at  TEXT DEFAULT CURRENT_TIMESTAMP,
+          tags        TEXT,
+          notes       TEXT,
+          UNIQUE(left_id, right_id)
+        )
+    """)
+
+def _m003_track_metrics(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS track_metrics (
+          spotify_id TEXT PRIMARY KEY,
+          bpm REAL,
+          bpm_low REAL,
+          bpm_high REAL,
+          key_num INTEGER,
+          mode INTEGER,
+          key_str TEXT,
+          source TEXT,
+          confidence REAL,
+          flags TEXT,
+          raw TEXT,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # lib/schema.sql creates a narrower table without the tempo columns
+    _add_missing_columns(conn, "track_metrics", [
+        ("bpm", "REAL"),
+        ("bpm_low", "REAL"),
+        ("bpm_high", "REAL"),
+        ("source", "TEXT"),
+        ("flags", "TEXT"),
+        ("raw", "TEXT"),
+        ("updated_at", "TIMESTAMP"),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_track_metrics_updated_at ON track_metrics(updated_at)")
+
+def _m004_track_sources(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS track_sources (
+          spotify_id TEXT PRIMARY KEY,
+          spotify_analysis TEXT,
+          spotify_features TEXT,
+          acousticbrainz TEXT,
+          preview_analysis TEXT,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _add_missing_columns(conn, "track_sources", [
+        ("preview_analysis", "TEXT"),
+        ("updated_at", "DATETIME"),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_track_sources_updated_at ON track_sources(updated_at)")
+
+def _m005_user_overrides(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_overrides (
+          spotify_id TEXT PRIMARY KEY,
+          bpm REAL,
+          key_num INTEGER,
+          mode INTEGER,
+          reason TEXT,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _add_missing_columns(conn, "user_overrides", [
+        ("bpm", "REAL"),
+        ("updated_at", "TIMESTAMP"),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_overrides_updated_at ON user_overrides(updated_at)")
+
+def _m006_simple_bpm_cache(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS simple_bpm_cache (
+            spotify_id TEXT PRIMARY KEY,
+            bpm REAL,
+            confidence REAL,
+            source TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _m007_playlists(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS playlists(
+          playlist_id TEXT PRIMARY KEY,
+          name        TEXT,
+          last_sync   TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS playlist_tracks(
+          playlist_id TEXT,
+          track_id    TEXT,
+          PRIMARY KEY (playlist_id, track_id)
+        )
+    """)
+
+def _m008_tracks_fts(conn: sqlite3.Connection) -> None:
+    from library_search import create_fts_index
+
+    create_fts_index(conn)
+
+def _tracks_metric_columns(conn: sqlite3.Connection) -> None:
+    # Pre-versioning tracks tables can lack the raw metric columns that
+    # effective_metrics falls back to. Part of step 9 rather than a step of
+    # its own: databases that failed step 9 without them are stuck at 8, and
+    # renumbering would re-run shipped steps.
+    _add_missing_columns(conn, "tracks", [
+        ("key_int", "INTEGER"),
+        ("mode_int", "INTEGER"),
+        ("energy", "REAL"),
+        ("camelot", "TEXT"),
+        ("url", "TEXT"),
+    ])
+
+def _m009_effective_metrics(conn: sqlite3.Connection) -> None:
+    from effective_metrics import create_effective_metrics
+
+    _tracks_metric_columns(conn)
+    create_effective_metrics(conn)
+
+def _m010_playlist_snapshots(conn: sqlite3.Connection) -> None:
+    _add_missing_columns(conn, "playlists", [("snapshot_id", "TEXT")])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_playlist_tracks_track ON playlist_tracks(track_id)")
+
+def _m011_artist_genres(conn: sqlite3.Connection) -> None:
+    from artist_genres import create_genre_tables
+
+    create_genre_tables(conn)
+
+def _m012_tracks_fts_triggers(conn: sqlite3.Connection) -> None:
+    from library_search import drop_before_insert_trigger
+
+    drop_before_insert_trigger(conn)
+
+def _m013_features_fetched_at(conn: sqlite3.Connection) -> None:
+    # updated_at moves on every write to any source column, so it cannot
+    # say how old spotify_features is. Existing rows start from updated_at.
+    if "features_fetched_at" not in _columns(conn, "track_sources"):
+        conn.execute("ALTER TABLE track_sources ADD COLUMN features_fetched_at TIMESTAMP")
+        conn.execute("""UPDATE track_sources SET features_fetched_at = updated_at
+                        WHERE spotify_features IS NOT NULL""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_track_sources_features_fetched_at "
+                 "ON track_sources(features_fetched_at)")
+
+# Ordered, append-only. Never renumber or edit a step that has shipped;
+# add a new one instead.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "tracks", _m001_tracks),
+    Migration(2, "mashups", _m002_mashups, transactional=False),
+    Migration(3, "track_metrics", _m003_track_metrics),
+    Migration(4, "track_sources", _m004_track_sources),
+    Migration(5, "user_overrides", _m005_user_overrides),
+    Migration(6, "simple_bpm_cache", _m006_simple_bpm_cache),
+    Migration(7, "playlists", _m007_playlists),
+    Migration(8, "tracks_fts", _m008_tracks_fts),
+    Migration(9, "effective_metrics", _m009_effective_metrics),
+    Migration(10, "playlist_snapshots", _m010_playlist_snapshots),
+    Migration(11, "artist_genres", _m011_artist_genres),
+    Migration(12, "tracks_fts_triggers", _m012_tracks_fts_triggers),
+    Migration(13, "features_fetched_at", _m013_features_fetched_at),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+# ============ Runner ============
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection, target: int = SCHEMA_VERSION) -> int:
+    """
+    Apply every pending step up to target. Each transactional step and its
+    user_version bump commit together, so a failure leaves the database at
+    the last completed version. Returns the resulting version.
+    """
+    current = schema_version(conn)
+    if current >= target:
+        return current
+
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # explicit BEGIN/COMMIT around each step
+    try:
+        for step in MIGRATIONS:
+            if step.version <= current or step.version > target:
+                continue
+            if not step.transactional:
+                # Resumable on its own; the version is only recorded once it finishes.
+                step.apply(conn)
+                conn.execute(f"PRAGMA user_version = {int(step.version)}")
+                current = step.version
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step.apply(conn)
+                conn.execute(f"PRAGMA user_version = {int(step.version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            current = step.version
+    finally:
+        conn.isolation_level = previous_isolation
+    return current
+
+_checked_paths: set = set()
+_checked_lock = threading.Lock()
+
+def ensure_schema(db_path: str = DB_PATH) -> None:
+    """Migrate db_path to SCHEMA_VERSION; after the first call per process this is a set lookup."""
+    key = os.path.abspath(db_path)
+    if key in _checked_paths:
+        return
+    with _checked_lock:
+        if key in _checked_paths:
+            return
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _checked_paths.add(key)
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(path)
+    before = schema_version(conn)
+    after = migrate(conn)
+    conn.close()
+    print(f"{path}: schema version {before} -> {after}")
@@ -0,0 +1,140 @@
+"""
+Materialized effective tempo/key per track.
+
+effective_metrics holds one precedence-resolved row per track:
+user_overrides beat track_metrics (resolver output), which beat the raw
+values on tracks. Each field falls through independently, so an override
+that only pins the BPM still picks up the resolver's key. Triggers on the
+three source tables refresh the affected row, so readers never need their
+own fallback chain.
+"""
+from __future__ import annotations
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+# {ids} is a subquery yielding one column named id.
+_RESOLVE_SQL = """
+    SELECT id, bpm, key_num, mode,
+           CASE WHEN key_num IS NULL OR mode IS NULL THEN NULL
+                ELSE ((key_num * 7 + CASE mode WHEN 1 THEN 7 ELSE 4 END) % 12 + 1)
+                     || CASE mode WHEN 1 THEN 'B' ELSE 'A' END
+           END,
+           energy, confidence, source, CURRENT_TIMESTAMP
+    FROM (
+        SELECT ids.id AS id,
+               COALESCE(o.bpm, m.bpm, t.bpm) AS bpm,
+               CASE WHEN o.key_num IS NOT NULL AND o.mode IS NOT NULL THEN o.key_num
+                    WHEN m.key_num IS NOT NULL AND m.mode IS NOT NULL THEN m.key_num
+                    ELSE t.key_int END AS key_num,
+               CASE WHEN o.key_num IS NOT NULL AND o.mode IS NOT NULL THEN o.mode
+                    WHEN m.key_num IS NOT NULL AND m.mode IS NOT NULL THEN m.mode
+                    ELSE t.mode_int END AS mode,
+               t.energy AS energy,
+               CASE WHEN o.spotify_id IS NOT NULL THEN 1.0
+                    WHEN m.spotify_id IS NOT NULL THEN m.confidence END AS confidence,
+               CASE WHEN o.spotify_id IS NOT NULL THEN 'user'
+                    WHEN m.spotify_id IS NOT NULL THEN COALESCE(m.source, 'resolver')
+                    ELSE COALESCE(t.source, 'tracks') END AS source
+        FROM {ids} ids
+        LEFT JOIN user_overrides o ON o.spotify_id = ids.id
+        LEFT JOIN track_metrics m ON m.spotify_id = ids.id
+        LEFT JOIN tracks t ON t.track_id = ids.id
+        WHERE o.spotify_id IS NOT NULL OR m.spotify_id IS NOT NULL OR t.track_id IS NOT NULL
+    )
+"""
+
+_COLUMNS = "spotify_id, bpm, key_num, mode, camelot, energy, confidence, source, updated_at"
+
+_ALL_IDS = """(
+    SELECT spotify_id AS id FROM user_overrides
+    UNION SELECT spotify_id FROM track_metrics
+    UNION SELECT track_id FROM tracks
+)"""
+
+# (table, id column) for every layer that feeds the view
+_SOURCES = [("user_overrides", "spotify_id"), ("track_metrics", "spotify_id"), ("tracks", "track_id")]
+
+def _refresh_one_sql(id_expr: str) -> str:
+    return (
+        f"DELETE FROM effective_metrics WHERE spotify_id = {id_expr};\n"
+        f"INSERT INTO effective_metrics ({_COLUMNS}) "
+        + _RESOLVE_SQL.format(ids=f"(SELECT {id_expr} AS id)") + ";"
+    )
+
+def create_effective_metrics(conn: sqlite3.Connection) -> None:
+    """Create the table and its refresh triggers, then populate it."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS effective_metrics (
+          spotify_id TEXT PRIMARY KEY,
+          bpm REAL,
+          key_num INTEGER,
+          mode INTEGER,
+          camelot TEXT,
+          energy REAL,
+          confidence REAL,
+          source TEXT,            -- 'user', the resolver's source, or tracks.source
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for table, id_col in _SOURCES:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_effective_ai AFTER INSERT ON {table} BEGIN
+                {_refresh_one_sql(f"NEW.{id_col}")}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_effective_au AFTER UPDATE ON {table} BEGIN
+                {_refresh_one_sql(f"OLD.{id_col}")}
+                {_refresh_one_sql(f"NEW.{id_col}")}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_effective_ad AFTER DELETE ON {table} BEGIN
+                {_refresh_one_sql(f"OLD.{id_col}")}
+            END
+        """)
+    refresh_effective_metrics(conn)
+
+def refresh_effective_metrics(conn: sqlite3.Connection, ids: Optional[Iterable[str]] = None) -> None:
+    """
+    Recompute rows for ids, or rebuild the whole table when ids is None.
+    Only needed after bulk writes made with triggers disabled.
+    """
+    if ids is None:
+        conn.execute("DELETE FROM effective_metrics")
+        conn.execute(f"INSERT INTO effective_metrics ({_COLUMNS}) " + _RESOLVE_SQL.format(ids=_ALL_IDS))
+        return
+    for track_id in ids:
+        conn.execute("DELETE FROM effective_metrics WHERE spotify_id = ?", (track_id,))
+        conn.execute(f"INSERT INTO effective_metrics ({_COLUMNS}) "
+                     + _RESOLVE_SQL.format(ids="(SELECT ? AS id)"), (track_id,))
+
+def _rows(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def get_effective_metrics(conn: sqlite3.Connection, ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Effective rows keyed by spotify id, for the given ids or every track."""
+    if ids is None:
+        cursor = conn.execute("SELECT * FROM effective_metrics")
+    else:
+        ids = list(ids)
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        cursor = conn.execute(f"SELECT * FROM effective_metrics WHERE spotify_id IN ({placeholders})", ids)
+    return {row["spotify_id"]: row for row in _rows(cursor)}
+
+LIBRARY_SELECT = """
+    SELECT t.track_id, t.title, t.artist,
+           e.bpm, e.key_num AS key_int, e.mode AS mode_int, t.energy, e.camelot,
+           t.url, t.album_art, t.source, t.tags, t.created_at,
+           e.confidence, e.source AS metrics_source
+    FROM tracks t
+    LEFT JOIN effective_metrics e ON e.spotify_id = t.track_id
+"""
+
+def list_library(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Library tracks, newest first, with bpm/key/camelot already resolved."""
+    cursor = conn.execute(LIBRARY_SELECT + " ORDER BY t.created_at DESC")
+    return _rows(cursor)
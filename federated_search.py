@@ -0,0 +1,146 @@
+"""
+Spotify + Deezer track search merged into one result list.
+
+Both providers are queried concurrently and each caches its own responses
+(Spotify through spotify_search.SEARCH_CACHE, Deezer through DEEZER_CACHE),
+so one slow or failing provider never invalidates the other's results. A
+provider that misses the per-request deadline is dropped from this
+response and reported as "timeout"; its call keeps running and lands in
+its cache for the next search.
+
+Results are deduplicated on (clean title, clean primary artist), or on the
+provider id when either normalizes to nothing. The first
+provider in PROVIDERS keeps its ordering and ids; a duplicate from a later
+provider only fills in fields the first one lacks (e.g. a preview URL).
+"""
+from __future__ import annotations
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from circuit_breaker import CircuitOpenError, UpstreamError, breaker, check_response
+from search_cache import TTLCache
+from search_pipeline import fan_out
+from spotify_clients import get_app_client, http_session
+from spotify_search import normalize_query, search_tracks_cached
+from track_keys import dedupe_key
+
+DEEZER_BASE = "https://api.deezer.com"
+DEEZER_CACHE = TTLCache(maxsize=1000, ttl=600, stale_ttl=6 * 3600, name="deezer_search")
+DEFAULT_DEADLINE = 2.0  # seconds for the whole fan-out
+
+# Separate from search enrichment's pool, so a hung provider cannot starve it
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="federated")
+
+Track = Dict[str, Any]
+
+def _spotify_track(item: Dict[str, Any]) -> Track:
+    images = (item.get("album") or {}).get("images") or []
+    return {
+        "id": item["id"],
+        "provider": "spotify",
+        "spotify_id": item["id"],
+        "title": item.get("name", ""),
+        "artist": ", ".join(a["name"] for a in item.get("artists") or []),
+        "album": (item.get("album") or {}).get("name", ""),
+        "cover_url": images[0]["url"] if images else None,
+        "preview_url": item.get("preview_url"),
+        "duration": round((item.get("duration_ms") or 0) / 1000),
+        "url": (item.get("external_urls") or {}).get("spotify", ""),
+    }
+
+def _deezer_track(item: Dict[str, Any]) -> Track:
+    album = item.get("album") or {}
+    return {
+        "id": f"deezer_{item['id']}",
+        "provider": "deezer",
+        "deezer_id": item["id"],
+        "title": item.get("title", ""),
+        "artist": (item.get("artist") or {}).get("name", ""),
+        "album": album.get("title", ""),
+        "cover_url": album.get("cover_medium") or album.get("cover"),
+        "preview_url": item.get("preview") or None,
+        "duration": item.get("duration", 0),
+        "url": item.get("link", ""),
+    }
+
+def search_spotify(query: str, limit: int) -> List[Track]:
+    sp = get_app_client()
+    if sp is None:
+        raise RuntimeError("Spotify credentials not configured")
+    return [_spotify_track(t) for t in search_tracks_cached(sp, query, limit=limit) if t.get("id")]
+
+def search_deezer(query: str, limit: int) -> List[Track]:
+    import requests
+
+    def get():
+        try:
+            r = http_session().get(f"{DEEZER_BASE}/search", params={"q": query, "limit": limit}, timeout=10)
+        except requests.RequestException as e:
+            raise UpstreamError(f"Deezer: {e}") from e
+        return check_response(r)
+
+    def load():
+        r = breaker("deezer").call(get)
+        r.raise_for_status()
+        body = r.json()
+        if "error" in body:  # Deezer reports errors with a 200
+            raise RuntimeError(f"Deezer: {body['error'].get('message', body['error'])}")
+        return [_deezer_track(t) for t in body.get("data") or [] if t.get("id")]
+
+    return DEEZER_CACHE.get_or_load((normalize_query(query), limit), load)
+
+PROVIDERS: Dict[str, Callable[[str, int], List[Track]]] = {
+    "spotify": search_spotify,
+    "deezer": search_deezer,
+}
+
+def merge_results(by_provider: Dict[str, List[Track]], limit: int) -> List[Track]:
+    """Dedupe in PROVIDERS order; later duplicates only fill missing fields."""
+    merged: Dict[tuple, Track] = {}
+    for name in PROVIDERS:
+        for track in by_provider.get(name) or []:
+            key = dedupe_key(track["title"], track["artist"])
+            if not all(key):  # nothing left to compare on: never merge it
+                key = (name, track["id"])
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = {**track, "sources": [name]}
+                continue
+            if name not in existing["sources"]:
+                existing["sources"].append(name)
+            for field, value in track.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+    return list(merged.values())[:limit]
+
+def federated_search(query: str, limit: int = 25, deadline: float = DEFAULT_DEADLINE,
+                     providers: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    {"results": [...], "providers": {name: {"status", "count", "ms"}},
+    "partial": bool}. status is "ok", "timeout", "unavailable" (circuit
+    open, no call made) or "error".
+    """
+    names = [n for n in (providers or PROVIDERS) if n in PROVIDERS]
+    started = time.perf_counter()
+    by_provider: Dict[str, List[Track]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    tasks = {name: (lambda fn=PROVIDERS[name]: fn(query, limit)) for name in names}
+    for name, result, error in fan_out(tasks, timeout=deadline, pool=_pool):
+        ms = round((time.perf_counter() - started) * 1000, 1)
+        if error is None:
+            by_provider[name] = result
+            report[name] = {"status": "ok", "count": len(result), "ms": ms}
+        else:
+            if isinstance(error, TimeoutError):
+                status = "timeout"
+            elif isinstance(error, CircuitOpenError):
+                status = "unavailable"
+            else:
+                status = "error"
+            report[name] = {"status": status, "count": 0, "ms": ms, "error": str(error)}
+    return {
+        "results": merge_results(by_provider, limit),
+        "providers": report,
+        "partial": any(r["status"] != "ok" for r in report.values()),
+    }
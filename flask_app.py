@@ -1,61 +1,288 @@
+from startup import profile_startup, span
+profile_startup()  # no-op unless MASHLAB_PROFILE_STARTUP=1
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import json
+import math
+import threading
+import time
 from datetime import datetime
 
+# This repo's modules are imported where they are first used, and the write
+# queue, thumbnail cache and metric descriptions are built on first use, so
+# importing the app (gunicorn workers, tests) does no work for routes that
+# are never hit.
+
 app = Flask(__name__)
 
 # Environment variables
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "*")
 PREVIEW_SHARED_SECRET = os.getenv("PREVIEW_SHARED_SECRET")
+PROFILE_HEADER = "x-ml-profile"  # request_profiler.PROFILE_HEADER, without importing it per request
+DB_PATH = os.getenv("MASHLAB_DB_PATH", "murphmixes.db")
 
 # CORS configuration
 CORS(app, resources={r"/api/*": {"origins": [FRONTEND_ORIGIN]}})
 
-# Middleware to verify shared secret
+_lock = threading.Lock()
+_write_queue = None
+_thumbnails = None
+_metrics_described = False
+
+def get_metrics():
+    """The metrics module, with this app's series described on first use."""
+    global _metrics_described
+    import metrics
+
+    if not _metrics_described:
+        with _lock:
+            if not _metrics_described:
+                _describe_metrics(metrics)
+                _metrics_described = True
+    return metrics
+
+def get_write_queue():
+    """All writes go through one background writer; handlers never hold a write lock."""
+    global _write_queue
+    if _write_queue is None:
+        with _lock:
+            if _write_queue is None:
+                from write_queue import WriteBehindQueue
+
+                with span("WriteBehindQueue"):
+                    _write_queue = WriteBehindQueue(DB_PATH)
+    return _write_queue
+
+def get_thumbnails():
+    global _thumbnails
+    if _thumbnails is None:
+        with _lock:
+            if _thumbnails is None:
+                from album_art import ThumbnailCache
+
+                _thumbnails = ThumbnailCache.from_env()
+    return _thumbnails
+
+# Request timing; registered first so rejected requests are measured too
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+# after_request hooks run in reverse registration order: registered before
+# record_request, this runs after it, so saving a profile is not timed
+@app.after_request
+def attach_profile(response):
+    """Store the request's profile; its id goes in a header, its summary into JSON bodies."""
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    route = request.url_rule.rule if request.url_rule else request.path
+    profile_id = profiler.save(route=route, method=request.method, status=response.status_code)
+    response.headers["X-ML-Profile-Id"] = profile_id
+    if request.headers.get("x-ml-profile-output", "summary") == "summary" and response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body["_profile"] = {"id": profile_id, **profiler.summary()}
+            response.set_data(json.dumps(body))
+    return response
+
+@app.after_request
+def record_request(response):
+    started = g.pop("started", None)
+    if started is not None:
+        metrics = get_metrics()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("mashlab_http_request_seconds", time.perf_counter() - started,
+                        route=route, method=request.method)
+        metrics.inc("mashlab_http_requests_total", route=route, method=request.method,
+                    status=f"{response.status_code // 100}xx")
+    return response
+
+# Middleware to verify shared secret; an authorized x-ml-profile header also
+# samples this one request (see request_profiler.py)
 @app.before_request
 def verify_secret():
     if request.path.startswith("/api/"):
         secret = request.headers.get("x-ml-preview-secret")
         if not secret or secret != PREVIEW_SHARED_SECRET:
             return jsonify({"error": "unauthorized"}), 401
+        profile = request.headers.get(PROFILE_HEADER)
+        if profile is not None and not request.path.startswith("/api/debug/"):
+            import request_profiler
+
+            if not request_profiler.authorized(profile):
+                return jsonify({"error": "profiling not authorized"}), 403
+            g.profiler = request_profiler.SamplingProfiler.start()
+
+@app.teardown_request
+def stop_profiler(error=None):
+    """after_request is skipped when an exception propagates; never leave the sampler running."""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+        route = request.url_rule.rule if request.url_rule else request.path
+        profiler.save(route=route, method=request.method, status=500,
+                      error=type(error).__name__ if error else None)
+
+@app.route("/api/debug/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    """A stored profile: ?format=folded (default, for flamegraph tools) or json."""
+    import request_profiler
+
+    if not request_profiler.authorized(request.headers.get(request_profiler.PROFILE_HEADER)):
+        return jsonify({"error": "profiling not authorized"}), 403
+    kind = request.args.get("format", "folded")
+    data = request_profiler.load(profile_id, kind)
+    if data is None:
+        return jsonify({"error": "profile not found"}), 404
+    return Response(data, mimetype="application/json" if kind == "json" else "text/plain")
 
 # Health check endpoint
 @app.route("/healthz")
 def healthz():
-    return {"ok": True}
+    from circuit_breaker import breaker_stats
+
+    return {"ok": True, "write_queue": get_write_queue().stats(), "breakers": breaker_stats()}
+
+# Prometheus-style text metrics: the shared secret, or a scraper address
+# listed in MASHLAB_METRICS_ALLOW. Loopback is not trusted implicitly, since
+# behind a reverse proxy on the same host every client arrives as loopback.
+METRICS_ALLOW = {a.strip() for a in os.getenv("MASHLAB_METRICS_ALLOW", "").split(",") if a.strip()}
+
+@app.route("/metrics")
+def metrics_endpoint():
+    secret = request.headers.get("x-ml-preview-secret")
+    authorized = bool(PREVIEW_SHARED_SECRET) and secret == PREVIEW_SHARED_SECRET
+    if not authorized and request.remote_addr not in METRICS_ALLOW:
+        return jsonify({"error": "unauthorized"}), 401
+    metrics = get_metrics()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Album art thumbnails, cached on disk by content hash. Not under /api/
+# because <img> tags cannot send the shared-secret header; only Spotify and
+# Deezer image hosts are proxied.
+@app.route("/thumb")
+def thumb():
+    from album_art import CACHE_MAX_AGE, is_allowed
+
+    url = request.args.get("u", "")
+    if not is_allowed(url):
+        return jsonify({"error": "image host not allowed"}), 400
+    thumbnails = get_thumbnails()
+    try:
+        digest, mime = thumbnails.get(url)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 502
+    response = send_file(thumbnails.blob_path(digest), mimetype=mime, etag=digest,
+                         max_age=CACHE_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
 
 # Database connection helper
+class TimedConnection(sqlite3.Connection):
+    """Records how long each statement takes to execute (up to its first row)."""
+
+    def execute(self, sql, parameters=()):
+        with get_metrics().timer("mashlab_db_query_seconds", op=_sql_op(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with get_metrics().timer("mashlab_db_query_seconds", op=_sql_op(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+def _sql_op(sql):
+    """'  SELECT ...' -> 'select'; 'empty' for blank statements."""
+    words = sql.split(None, 1) if isinstance(sql, str) else []
+    return words[0].lower() if words else "empty"
+
 def get_db_connection():
-    conn = sqlite3.connect('murphmixes.db')
+    from db_migrations import ensure_schema
+
+    ensure_schema(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _describe_metrics(metrics):
+    from circuit_breaker import CLOSED, breaker_stats
+    from search_cache import all_caches
+
+    metrics.describe("mashlab_http_request_seconds", "histogram", "Request latency by route template and method.")
+    metrics.describe("mashlab_http_requests_total", "counter", "Requests by route, method and status class.")
+    metrics.describe("mashlab_db_query_seconds", "histogram", "SQLite statement time by operation.")
+    metrics.describe("mashlab_db_write_batch_seconds", "histogram", "Write-behind batch commit time.")
+    metrics.describe("mashlab_write_queue", "gauge", "Write-behind queue depth and totals.")
+    metrics.describe("mashlab_cache_hit_ratio", "gauge", "Share of lookups served from cache (fresh or stale).")
+    metrics.describe("mashlab_cache_lookups", "gauge", "Cache lookups by result since start.")
+    metrics.describe("mashlab_circuit_open", "gauge", "1 while an upstream's circuit breaker is not closed.")
+    metrics.gauge("mashlab_write_queue", lambda: [
+        ({"stat": k}, v) for k, v in get_write_queue().stats().items() if k in ("depth", "enqueued", "committed", "failed")])
+    metrics.gauge("mashlab_cache_hit_ratio", lambda: [({"cache": c.name}, c.stats()["hit_rate"]) for c in all_caches()])
+    metrics.gauge("mashlab_cache_lookups", lambda: [
+        ({"cache": stats["name"], "result": k}, stats[k]) for stats in (c.stats() for c in all_caches())
+        for k in ("hits", "stale_hits", "misses")])
+    metrics.gauge("mashlab_circuit_open", lambda: [
+        ({"upstream": name}, 0 if stats["state"] == CLOSED else 1) for name, stats in breaker_stats().items()])
+
+def enqueue_write(sql, params=()):
+    from db_migrations import ensure_schema
+
+    ensure_schema(DB_PATH)
+    return get_write_queue().enqueue(sql, params)
+
+def wants_flush(data):
+    """Callers that need read-your-writes pass {"wait": true} or ?wait=1."""
+    return bool((data or {}).get("wait")) or request.args.get("wait") == "1"
+
+def queued_response(payload, data, seq):
+    """202 once queued, or 200 after write seq is committed when the caller waits."""
+    if wants_flush(data):
+        write_queue = get_write_queue()
+        if not write_queue.flush():
+            return jsonify({**payload, "error": "write not committed in time"}), 504
+        error = write_queue.failed(seq)
+        if error:
+            return jsonify({**payload, "ok": False, "committed": False, "error": error}), 500
+        return jsonify({**payload, "committed": True}), 200
+    return jsonify({**payload, "queued": True}), 202
+
 # Deezer search endpoint
 @app.route("/api/deezer/search", methods=["POST"])
 def deezer_search():
+    from circuit_breaker import CircuitOpenError
+    from federated_search import search_deezer
+
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         query = data.get("query", "")
+        if not query.strip():
+            return jsonify({"results": []})
         
-        # Mock Deezer search response for now
-        # In production, this would call the actual Deezer API
-        results = [
-            {
-                "id": f"deezer_{i}",
-                "title": f"Track {i}",
-                "artist": f"Artist {i}",
-                "album": f"Album {i}",
-                "cover_url": "https://via.placeholder.com/300x300/8A7CFF/FFFFFF",
-                "preview_url": f"https://example.com/preview/{i}",
-                "duration": 180
-            }
-            for i in range(1, 6)
-        ]
-        
+        results = search_deezer(query, int(data.get("limit", 25)))
         return jsonify({"results": results})
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(int(e.retry_in) + 1)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Federated Spotify + Deezer search; providers that miss the deadline are dropped
+@app.route("/api/search", methods=["POST"])
+def search_all():
+    from federated_search import DEFAULT_DEADLINE, federated_search
+
+    try:
+        data = request.get_json() or {}
+        query = data.get("query", "")
+        if not query.strip():
+            return jsonify({"error": "Missing query"}), 400
+        
+        limit = min(int(data.get("limit", 25)), 50)
+        deadline = float(data.get("deadline_ms", DEFAULT_DEADLINE * 1000)) / 1000
+        return jsonify(federated_search(query, limit=limit, deadline=deadline, providers=data.get("providers")))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -73,18 +300,160 @@ def enrich_track(track_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Genre enrichment endpoint
+# Genre enrichment (Spotify artist genres, cached in artist_genres)
+GENRE_BATCH_MAX = 1000
+GENRE_CONFIDENCE = 0.75  # artist-level genres applied to the track
+
+def lookup_genres(track_ids):
+    from artist_genres import track_genres
+    from spotify_clients import get_app_client
+
+    sp = get_app_client()
+    if sp is None:
+        return None
+    conn = get_db_connection()
+    try:
+        return track_genres(sp, conn, track_ids, write=get_write_queue().enqueue_many)
+    finally:
+        conn.close()
+
+def spotify_unavailable(payload):
+    """503 with Retry-After set to when the Spotify breaker next lets a call through."""
+    from circuit_breaker import breaker
+
+    retry_after = max(1, math.ceil(breaker("spotify").retry_in()))
+    return jsonify(payload), 503, {"Retry-After": str(retry_after)}
+
 @app.route("/api/meta/genre/<track_id>", methods=["GET"])
 def enrich_genre(track_id):
+    from artist_genres import GenresUnavailable
+
     try:
-        # Mock genre response
+        try:
+            genres = lookup_genres([track_id])
+        except GenresUnavailable:
+            return spotify_unavailable({"error": "Spotify unavailable"})
+        if genres is None:
+            return jsonify({"error": "Spotify credentials not configured"}), 503
+        if track_id not in genres:
+            return jsonify({"error": "Track not found"}), 404
         return jsonify({
-            "genres": ["pop", "electronic"],
-            "confidence": 0.75
+            "genres": genres[track_id],
+            "confidence": GENRE_CONFIDENCE if genres[track_id] else 0.0,
+            "source": "spotify_artists"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/meta/genre/batch", methods=["POST"])
+def enrich_genre_batch():
+    from artist_genres import GenresUnavailable
+
+    try:
+        data = request.get_json() or {}
+        track_ids = data.get("ids") or []
+        if not isinstance(track_ids, list) or not track_ids:
+            return jsonify({"error": "ids must be a non-empty list"}), 400
+        if len(track_ids) > GENRE_BATCH_MAX:
+            return jsonify({"error": f"at most {GENRE_BATCH_MAX} ids per request"}), 400
+
+        try:
+            genres = lookup_genres([str(t) for t in track_ids])
+        except GenresUnavailable as e:
+            # Resolved ids are still returned; clients retry the rest
+            return spotify_unavailable({
+                "error": "Spotify unavailable",
+                "genres": e.genres,
+                "unavailable": e.unresolved,
+                "source": "spotify_artists"
+            })
+        if genres is None:
+            return jsonify({"error": "Spotify credentials not configured"}), 503
+        return jsonify({
+            "genres": genres,
+            "missing": [t for t in track_ids if t not in genres],
+            "source": "spotify_artists"
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Library export: CSV streams batch by batch; Parquet/Arrow are spooled first
+@app.route("/api/library/export", methods=["GET"])
+def library_export():
+    from db_migrations import ensure_schema
+    from library_export import FORMATS, export_filename, export_library, export_mime, stream_csv
+
+    fmt = request.args.get("format", "csv").lower()
+    gzip = request.args.get("gzip") == "1"
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(FORMATS)}"}), 400
+    ensure_schema(DB_PATH)
+
+    if fmt == "csv":
+        headers = {"Content-Disposition": f'attachment; filename="{export_filename(fmt, gzip)}"'}
+        def generate():
+            conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
+            try:
+                yield from stream_csv(conn, gzip=gzip)
+            finally:
+                conn.close()
+        return Response(stream_with_context(generate()), mimetype=export_mime(fmt, gzip), headers=headers)
+
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
+    try:
+        out = export_library(conn, fmt)
+    except ImportError:
+        return jsonify({"error": f"{fmt} export needs pyarrow"}), 501
+    finally:
+        conn.close()
+    return send_file(out, mimetype=export_mime(fmt), as_attachment=True,
+                     download_name=export_filename(fmt))
+
+# Mashup save endpoint
+@app.route("/api/mashups/save", methods=["POST"])
+def mashups_save():
+    try:
+        data = request.get_json() or {}
+        left_id = data.get("seedId")
+        right_id = data.get("partnerId")
+        if not left_id or not right_id:
+            return jsonify({"error": "Missing required fields"}), 400
+
+        seq = enqueue_write("""
+            INSERT INTO mashups (left_id, right_id, score, reason, tags, notes)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(left_id, right_id) DO UPDATE SET
+              score = excluded.score, reason = excluded.reason,
+              tags = excluded.tags, notes = excluded.notes
+        """, (left_id, right_id, data.get("score"), data.get("reason"),
+              data.get("tags"), data.get("notes")))
+
+        return queued_response({"ok": True}, data, seq)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# User override endpoint (mirrors pages/api/qc/override.ts)
+@app.route("/api/qc/override", methods=["POST", "DELETE"])
+def qc_override():
+    try:
+        data = request.get_json() or {}
+        spotify_id = data.get("spotifyId")
+        if not spotify_id:
+            return jsonify({"error": "Missing spotifyId"}), 400
+
+        if request.method == "DELETE":
+            seq = enqueue_write("DELETE FROM user_overrides WHERE spotify_id = ?", (spotify_id,))
+        else:
+            seq = enqueue_write("""
+                INSERT OR REPLACE INTO user_overrides
+                (spotify_id, bpm, key_num, mode, reason, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (spotify_id, data.get("bpm"), data.get("key_num"), data.get("mode"), data.get("reason")))
+
+        return queued_response({"ok": True}, data, seq)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Mashups search endpoint
 @app.route("/api/mashups/search", methods=["POST"])
 def mashups_search():
@@ -154,9 +523,10 @@ def ai_clarify():
         updated_brief = { **brief, **answer }
         
         # Remove answered questions from missing
-        missing = Object.keys(answer).filter(key => 
-            not answer[key] or (isinstance(answer[key], list) and len(answer[key]) == 0)
-        )
+        missing = [
+            key for key, value in answer.items()
+            if not value or (isinstance(value, list) and len(value) == 0)
+        ]
         
         return jsonify({"brief": updated_brief, "missing": missing})
     except Exception as e:
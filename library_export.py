@@ -0,0 +1,164 @@
+"""
+Streaming Library export: CSV (optionally gzipped), Parquet and Arrow IPC.
+
+Rows are read with a keyset cursor over tracks.track_id in fixed-size batches,
+so memory stays flat however large the library is: each batch is encoded
+and handed on (a CSV chunk, a Parquet row group, an Arrow record batch)
+before the next one is read. All batches of one export are read inside a
+single read transaction, so concurrent writes never mix states or make
+keyset pages skip rows. Parquet and Arrow need pyarrow, which is optional
+and not in requirements.txt (`pip install pyarrow` to enable them).
+"""
+from __future__ import annotations
+import csv
+import io
+import sqlite3
+import tempfile
+import zlib
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Sequence, Tuple
+
+from effective_metrics import LIBRARY_SELECT
+
+BATCH_SIZE = 5000
+
+FORMATS: Dict[str, Tuple[str, str]] = {
+    # format -> (file extension, MIME type)
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+_FLOAT_COLUMNS = {"bpm", "energy", "confidence"}
+_INT_COLUMNS = {"key_int", "mode_int"}
+
+def iter_batches(conn: sqlite3.Connection, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[List[str], List[Sequence[Any]]]]:
+    """
+    (column names, rows) per batch in track_id order. Each batch is one
+    keyset query on the primary key, so late batches cost the same as early
+    ones (no OFFSET scan) and no cursor is held open between them.
+    """
+    last_id = ""
+    while True:
+        cursor = conn.execute(LIBRARY_SELECT + " WHERE t.track_id > ? ORDER BY t.track_id LIMIT ?",
+                              (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield [d[0] for d in cursor.description], rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection) -> Iterator[None]:
+    """Run the block in one read transaction, unless the caller already opened one."""
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN")
+    try:
+        yield
+    finally:
+        conn.execute("COMMIT")
+
+def library_columns(conn: sqlite3.Connection) -> List[str]:
+    return [d[0] for d in conn.execute(LIBRARY_SELECT + " LIMIT 0").description]
+
+def stream_csv(conn: sqlite3.Connection, gzip: bool = False, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """CSV as a sequence of encoded chunks, one per batch, gzipped on the fly if asked."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31 = gzip container
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    with read_snapshot(conn):
+        writer.writerow(library_columns(conn))
+        for _, rows in iter_batches(conn, batch_size):
+            writer.writerows(rows)
+            yield encode(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():  # empty library: header only
+        yield encode(buf.getvalue())
+    if compressor:
+        yield compressor.flush()
+
+def _arrow_schema(columns: Sequence[str]):
+    import pyarrow as pa
+
+    def field_type(name):
+        if name in _FLOAT_COLUMNS:
+            return pa.float64()
+        if name in _INT_COLUMNS:
+            return pa.int64()
+        return pa.string()
+
+    return pa.schema([(name, field_type(name)) for name in columns])
+
+def _record_batches(conn: sqlite3.Connection, schema, batch_size: int):
+    import pyarrow as pa
+
+    for columns, rows in iter_batches(conn, batch_size):
+        arrays = [pa.array([row[i] for row in rows], type=schema.field(name).type)
+                  for i, name in enumerate(columns)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_parquet(conn: sqlite3.Connection, sink: IO[bytes], batch_size: int = BATCH_SIZE) -> None:
+    """One Parquet row group per batch."""
+    import pyarrow.parquet as pq
+
+    with read_snapshot(conn):
+        schema = _arrow_schema(library_columns(conn))
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for batch in _record_batches(conn, schema, batch_size):
+                writer.write_batch(batch)
+
+def write_arrow(conn: sqlite3.Connection, sink: IO[bytes], batch_size: int = BATCH_SIZE) -> None:
+    """Arrow IPC file format (Feather v2), one record batch per batch."""
+    import pyarrow as pa
+
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with read_snapshot(conn):
+        schema = _arrow_schema(library_columns(conn))
+        with pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in _record_batches(conn, schema, batch_size):
+                writer.write_batch(batch)
+
+def export_library(conn: sqlite3.Connection, fmt: str = "csv", gzip: bool = False,
+                   batch_size: int = BATCH_SIZE) -> IO[bytes]:
+    """
+    Write the export to a spooled temporary file (in memory up to 8 MB, on
+    disk beyond) and return it rewound. gzip applies to CSV only; Parquet
+    and Arrow are zstd-compressed internally.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {sorted(FORMATS)}")
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    if fmt == "csv":
+        for chunk in stream_csv(conn, gzip=gzip, batch_size=batch_size):
+            out.write(chunk)
+    elif fmt == "parquet":
+        write_parquet(conn, out, batch_size)
+    else:
+        write_arrow(conn, out, batch_size)
+    out.seek(0)
+    return out
+
+def export_library_bytes(conn: sqlite3.Connection, fmt: str = "csv", gzip: bool = False,
+                         batch_size: int = BATCH_SIZE) -> bytes:
+    """
+    The whole export as bytes, for st.download_button: Streamlit accepts
+    bytes or BytesIO but rejects the spooled file export_library returns.
+    """
+    with export_library(conn, fmt, gzip=gzip, batch_size=batch_size) as out:
+        return out.read()
+
+def export_filename(fmt: str, gzip: bool = False, stem: str = "mashlab_library") -> str:
+    return f"{stem}.{FORMATS[fmt][0]}{'.gz' if gzip and fmt == 'csv' else ''}"
+
+def export_mime(fmt: str, gzip: bool = False) -> str:
+    return "application/gzip" if gzip and fmt == "csv" else FORMATS[fmt][1]
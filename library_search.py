@@ -0,0 +1,81 @@
+"""
+FTS5 full-text index over the local tracks library.
+
+tracks_fts is an external-content FTS5 table (it stores only the index and
+reads title/artist back from tracks), kept in sync by triggers on insert,
+update and delete. INSERT OR REPLACE removes the old row without firing
+DELETE triggers unless PRAGMA recursive_triggers is on, so connections that
+replace tracks rows must call enable_replace_triggers() first; otherwise the
+replaced row's index entry goes stale until the next rebuild.
+"""
+from __future__ import annotations
+import re
+import sqlite3
+from typing import Any, Dict, List
+
+FTS_TABLE = "tracks_fts"
+
+def create_fts_index(conn: sqlite3.Connection) -> None:
+    """Create tracks_fts plus its sync triggers and index every existing row."""
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            title, artist,
+            content='tracks', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_ai AFTER INSERT ON tracks BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, artist) VALUES (NEW.rowid, NEW.title, NEW.artist);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_ad AFTER DELETE ON tracks BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, artist) VALUES ('delete', OLD.rowid, OLD.title, OLD.artist);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_au AFTER UPDATE OF title, artist ON tracks BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, artist) VALUES ('delete', OLD.rowid, OLD.title, OLD.artist);
+            INSERT INTO {FTS_TABLE}(rowid, title, artist) VALUES (NEW.rowid, NEW.title, NEW.artist);
+        END
+    """)
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def drop_before_insert_trigger(conn: sqlite3.Connection) -> None:
+    """
+    Remove the old BEFORE INSERT sync trigger and rebuild the index. It
+    dropped the existing entry even when the insert was then ignored
+    (INSERT OR IGNORE, upserts), so tracks silently vanished from search.
+    """
+    conn.execute("DROP TRIGGER IF EXISTS trg_tracks_fts_bi")
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def enable_replace_triggers(conn: sqlite3.Connection) -> None:
+    """Make INSERT OR REPLACE fire the DELETE triggers for the rows it replaces."""
+    conn.execute("PRAGMA recursive_triggers = ON")
+
+def match_expression(query: str) -> str:
+    """'the weeknd blind' -> '"the"* AND "weeknd"* AND "blind"*' (every term a prefix)."""
+    terms = re.findall(r"\w+", query.lower())
+    return " AND ".join(f'"{t}"*' for t in terms)
+
+def search_local(conn: sqlite3.Connection, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Prefix search over title and artist, best matches first. Title hits are
+    weighted above artist hits. Returns full tracks rows as dicts.
+    """
+    expr = match_expression(query or "")
+    if not expr:
+        return []
+    cursor = conn.execute(f"""
+        SELECT t.*
+        FROM {FTS_TABLE} f
+        JOIN tracks t ON t.rowid = f.rowid
+        WHERE {FTS_TABLE} MATCH ?
+        ORDER BY bm25({FTS_TABLE}, 2.0, 1.0)
+        LIMIT ?
+    """, (expr, limit))
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,127 @@
+"""
+Process-wide, change-aware snapshot of the library.
+
+The full list_library() result is loaded once into column arrays and reused
+until the database changes. Changes are detected with PRAGMA data_version
+on a long-lived watcher connection: SQLite bumps it whenever another
+connection (any Streamlit session, Flask, the Next.js routes) commits, so
+checking costs one pragma per rerun instead of a full query.
+
+The rows are held in a TrackStore. The Library tab pages through it with
+LibrarySnapshot.page() and the Recommender tab ranks it with
+compat.rank_library_partners(), so one load serves both. Exports stream
+straight from SQLite instead (library_export.py), in one read transaction.
+"""
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from effective_metrics import LIBRARY_SELECT
+from track_store import TrackStore
+
+# Sortable columns for LibrarySnapshot.page()
+LIBRARY_SORTS = ("created_at", "title", "artist", "bpm", "camelot", "energy")
+
+def _fold(text: str) -> str:
+    """Lowercase without accents, like the FTS index's remove_diacritics."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+class LibrarySnapshot:
+    """The library as a TrackStore, tagged with the data_version it was loaded at."""
+
+    def __init__(self, version: int, columns: Sequence[str], rows: Sequence[Sequence[Any]]):
+        self.version = version
+        self.column_names = list(columns)
+        self.store = TrackStore.from_columns(
+            {name: [row[i] for row in rows] for i, name in enumerate(self.column_names)})
+        self._words: Optional[List[Tuple[str, ...]]] = None
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def index(self) -> Dict[str, int]:
+        return self.store.index
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self.store.to_dicts()
+
+    def _search_words(self) -> List[Tuple[str, ...]]:
+        # Built on the first filtered page; the snapshot is replaced, not
+        # mutated, when the library changes
+        if self._words is None:
+            self._words = [tuple(re.findall(r"\w+", _fold(f"{title or ''} {artist or ''}")))
+                           for title, artist in zip(self.store.columns["title"], self.store.columns["artist"])]
+        return self._words
+
+    def page(self, search: str = "", sort: str = "created_at", descending: bool = True,
+             bpm_range: Optional[Tuple[float, float]] = None, limit: int = 100,
+             offset: int = 0) -> Tuple[TrackStore, int]:
+        """
+        One page of rows, filtered (every search term a prefix of a title or
+        artist word, BPM range) and sorted with missing values last.
+        Returns (page as a TrackStore, total matches).
+        """
+        matches = range(len(self.store))
+        terms = re.findall(r"\w+", _fold(search or ""))
+        if terms:
+            words = self._search_words()
+            matches = [i for i in matches
+                       if all(any(w.startswith(t) for w in words[i]) for t in terms)]
+        values = self.store.values(sort if sort in LIBRARY_SORTS else "created_at")
+        if bpm_range:
+            bpm = self.store.values("bpm")
+            matches = [i for i in matches if bpm[i] is not None and bpm_range[0] <= bpm[i] <= bpm_range[1]]
+        if sort in ("title", "artist"):
+            values = [v.casefold() if isinstance(v, str) else v for v in values]
+        present = [i for i in matches if values[i] is not None]
+        present.sort(key=values.__getitem__, reverse=descending)
+        order = present + [i for i in matches if values[i] is None]
+        return self.store[np.array(order[offset:offset + limit], dtype=np.intp)], len(order)
+
+class _Watcher:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        self.snapshot: Optional[LibrarySnapshot] = None
+        self.loads = 0
+
+    def data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+_watchers: Dict[str, _Watcher] = {}
+_watchers_lock = threading.Lock()
+
+def _watcher(db_path: str) -> _Watcher:
+    key = os.path.abspath(db_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            watcher = _watchers[key] = _Watcher(db_path)
+        return watcher
+
+def get_snapshot(db_path: str = "murphmixes.db") -> LibrarySnapshot:
+    """Current library snapshot; reloaded only when data_version has moved."""
+    watcher = _watcher(db_path)
+    with watcher.lock:
+        version = watcher.data_version()
+        if watcher.snapshot is None or watcher.snapshot.version != version:
+            cursor = watcher.conn.execute(LIBRARY_SELECT + " ORDER BY t.created_at DESC")
+            columns = [d[0] for d in cursor.description]
+            watcher.snapshot = LibrarySnapshot(version, columns, cursor.fetchall())
+            watcher.loads += 1
+        return watcher.snapshot
+
+def snapshot_version(db_path: str = "murphmixes.db") -> int:
+    """Cheap change token, e.g. as an st.cache_data key for derived views."""
+    watcher = _watcher(db_path)
+    with watcher.lock:
+        return watcher.data_version()
@@ -2,100 +2,183 @@
 """
 Database migration script for MurphMixes CrateMate v1.2
 Updates the old schema to the new v1.2 schema
+
+The mashups table is copied in keyset-ordered batches into a shadow table,
+with progress checkpointed after every batch. An interrupted run resumes
+from the last checkpoint, and the old and new tables are swapped in a single
+transaction at the end, so readers never see a half-migrated table.
 """
 
-import sqlite3
+import argparse
+import logging
 import os
+import sqlite3
+import time
+
+log = logging.getLogger(__name__)
+
+SHADOW_TABLE = "mashups_v12_shadow"
+CHECKPOINT_TABLE = "migration_checkpoints"
+CHECKPOINT_NAME = "mashups_v12"
+DEFAULT_BATCH_SIZE = 5000
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _create_shadow(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {SHADOW_TABLE}(
+      mashup_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+      left_id     TEXT NOT NULL,
+      right_id    TEXT NOT NULL,
+      score       REAL,
+      reason      TEXT,
+      created_at  TEXT DEFAULT CURRENT_TIMESTAMP,
+      tags        TEXT,
+      notes       TEXT,
+      UNIQUE(left_id, right_id)
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE}(
+      name        TEXT PRIMARY KEY,
+      last_rowid  INTEGER NOT NULL,
+      rows_copied INTEGER NOT NULL,
+      updated_at  TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _load_checkpoint(conn):
+    row = conn.execute(
+        f"SELECT last_rowid, rows_copied FROM {CHECKPOINT_TABLE} WHERE name = ?",
+        (CHECKPOINT_NAME,)
+    ).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+def _copy_batch(conn, after_rowid, batch_size):
+    """Copy up to batch_size legacy rows with rowid > after_rowid; returns (last_rowid, count)."""
+    # old row: (id, seed_track_id, partner_track_id, title, note, created_at)
+    rows = conn.execute("""
+        SELECT rowid, seed_track_id, partner_track_id, note, created_at
+        FROM mashups WHERE rowid > ? ORDER BY rowid LIMIT ?
+    """, (after_rowid, batch_size)).fetchall()
+    if not rows:
+        return after_rowid, 0
+    conn.executemany(f"""
+        INSERT OR IGNORE INTO {SHADOW_TABLE} (left_id, right_id, score, reason, created_at, tags, notes)
+        VALUES (?, ?, 0.5, 'Migrated from v1.1', ?, '', ?)
+    """, [(seed, partner, created_at, note or "") for _rowid, seed, partner, note, created_at in rows])
+    return rows[-1][0], len(rows)
+
+def needs_mashups_migration(conn):
+    """
+    True while mashups still has the v1.1 layout. An interrupted run leaves
+    it that way (the swap is the last step), and migrate_mashups() picks up
+    from its row in migration_checkpoints.
+    """
+    cols = _columns(conn, "mashups")
+    return bool(cols) and "mashup_id" not in cols
+
+def migrate_mashups(conn, batch_size=DEFAULT_BATCH_SIZE, progress=log.info):
+    """
+    Copy v1.1 mashups into the v1.2 layout in batches and swap tables atomically.
+    Safe to re-run after an interruption. Returns the number of rows copied by
+    this run. Progress lines go to progress (the log by default; the CLI prints).
+    """
+    if not needs_mashups_migration(conn):
+        return 0
+
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # one short transaction per batch
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _create_shadow(conn)
+        conn.execute("COMMIT")
+
+        last_rowid, total = _load_checkpoint(conn)
+        if last_rowid:
+            progress(f"↩️  Resuming after rowid {last_rowid} ({total} rows already copied)")
 
-def migrate_database():
+        copied = 0
+        started = time.perf_counter()
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_rowid, count = _copy_batch(conn, last_rowid, batch_size)
+                total += count
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, last_rowid, rows_copied, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, (CHECKPOINT_NAME, last_rowid, total))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if count == 0:
+                break
+            copied += count
+            elapsed = time.perf_counter() - started
+            rate = copied / elapsed if elapsed > 0 else float("inf")
+            progress(f"   {total} rows copied ({rate:,.0f} rows/s)")
+
+        # Final swap. Rows written to the old table since the last batch are
+        # picked up inside the same transaction, so nothing is lost.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                last_rowid, count = _copy_batch(conn, last_rowid, batch_size)
+                if count == 0:
+                    break
+                copied += count
+                total += count
+            conn.execute("ALTER TABLE mashups RENAME TO mashups_v11_old")
+            conn.execute(f"ALTER TABLE {SHADOW_TABLE} RENAME TO mashups")
+            conn.execute("DROP TABLE mashups_v11_old")
+            conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE name = ?", (CHECKPOINT_NAME,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        elapsed = time.perf_counter() - started
+        rate = copied / elapsed if elapsed > 0 else float("inf")
+        progress(f"🔁 Swapped tables: {total} rows in mashups ({copied} this run, {rate:,.0f} rows/s)")
+        return copied
+    finally:
+        conn.isolation_level = previous_isolation
+
+def migrate_database(db_path="murphmixes.db", batch_size=DEFAULT_BATCH_SIZE):
     """Migrate the database from v1.1 to v1.2 schema"""
-    
-    db_path = "murphmixes.db"
-    
+
     if not os.path.exists(db_path):
         print("No database file found. Creating new database with v1.2 schema...")
         return
-    
-    print("🔄 Migrating database from v1.1 to v1.2...")
-    
-    # Connect to database
-    conn = sqlite3.connect(db_path)
-    
+
+    conn = sqlite3.connect(db_path, timeout=30)
+
     try:
-        # Check current schema
-        cursor = conn.execute("PRAGMA table_info(mashups)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'mashup_id' in columns:
+        if not needs_mashups_migration(conn):
             print("✅ Database already has v1.2 schema")
             return
-        
-        print("📋 Current mashups table columns:", columns)
-        
-        # Backup old data
-        print("💾 Backing up old mashup data...")
-        old_mashups = conn.execute("SELECT * FROM mashups").fetchall()
-        print(f"   Found {len(old_mashups)} existing mashups")
-        
-        # Drop old table
-        print("🗑️  Dropping old mashups table...")
-        conn.execute("DROP TABLE mashups")
-        
-        # Create new table with v1.2 schema
-        print("🏗️  Creating new mashups table...")
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS mashups(
-          mashup_id   INTEGER PRIMARY KEY AUTOINCREMENT,
-          left_id     TEXT NOT NULL,
-          right_id    TEXT NOT NULL,
-          score       REAL,
-          reason      TEXT,
-          created_at  TEXT DEFAULT CURRENT_TIMESTAMP,
-          tags        TEXT,
-          notes       TEXT,
-          UNIQUE(left_id, right_id)
-        );
-        """)
-        
-        # Migrate old data to new schema
-        print("🔄 Migrating data...")
-        for old_mashup in old_mashups:
-            # old_mashup structure: (id, seed_track_id, partner_track_id, title, note, created_at)
-            old_id, seed_id, partner_id, title, note, created_at = old_mashup
-            
-            # Convert to new schema
-            # Use default score and reason since we don't have them
-            score = 0.5  # Default score
-            reason = "Migrated from v1.1"  # Default reason
-            tags = ""  # No tags in old schema
-            notes = note if note else ""  # Convert old note to new notes
-            
-            try:
-                conn.execute("""
-                INSERT INTO mashups (left_id, right_id, score, reason, created_at, tags, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (seed_id, partner_id, score, reason, created_at, tags, notes))
-            except sqlite3.IntegrityError:
-                print(f"   ⚠️  Skipped duplicate mashup: {seed_id} × {partner_id}")
-        
-        # Commit changes
-        conn.commit()
-        
-        # Verify migration
+
+        print("🔄 Migrating database from v1.1 to v1.2...")
+        print("📋 Current mashups table columns:", _columns(conn, "mashups"))
+
+        migrate_mashups(conn, batch_size=batch_size, progress=print)
+
         new_count = conn.execute("SELECT COUNT(*) FROM mashups").fetchone()[0]
         print(f"✅ Migration complete! {new_count} mashups migrated")
-        
-        # Show new schema
-        cursor = conn.execute("PRAGMA table_info(mashups)")
-        new_columns = [row[1] for row in cursor.fetchall()]
-        print("📋 New mashups table columns:", new_columns)
-        
+        print("📋 New mashups table columns:", _columns(conn, "mashups"))
+
     except Exception as e:
-        print(f"❌ Migration failed: {e}")
-        conn.rollback()
+        print(f"❌ Migration failed: {e} (re-run to resume from the last checkpoint)")
         raise
     finally:
         conn.close()
 
 if __name__ == "__main__":
-    migrate_database()
+    parser = argparse.ArgumentParser(description="Migrate murphmixes.db mashups to the v1.2 schema")
+    parser.add_argument("db_path", nargs="?", default="murphmixes.db")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    migrate_database(args.db_path, batch_size=args.batch_size)
@@ -0,0 +1,125 @@
+"""
+Incremental sync of the user's Spotify playlists into playlists/playlist_tracks.
+
+Spotify changes a playlist's snapshot_id whenever its contents change, so a
+playlist whose stored snapshot_id matches the listing is skipped without
+fetching a single track page. For a changed playlist every page is fetched
+concurrently, the track-id set is diffed against playlist_tracks, and only
+the added/removed rows are written, together with the new snapshot_id, in
+one transaction.
+"""
+from __future__ import annotations
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+LIST_PAGE_SIZE = 50     # /me/playlists maximum
+TRACK_PAGE_SIZE = 100   # /playlists/{id}/tracks maximum
+MAX_WORKERS = 8
+
+def list_playlists(sp) -> List[Dict[str, Any]]:
+    """Every playlist the user follows or owns: id, name, snapshot_id, total."""
+    playlists, offset = [], 0
+    while True:
+        page = sp.current_user_playlists(limit=LIST_PAGE_SIZE, offset=offset)
+        for item in page.get("items") or []:
+            if item and item.get("id"):
+                playlists.append({
+                    "id": item["id"],
+                    "name": item.get("name", ""),
+                    "snapshot_id": item.get("snapshot_id"),
+                    "total": (item.get("tracks") or {}).get("total", 0),
+                })
+        if not page.get("next"):
+            return playlists
+        offset += LIST_PAGE_SIZE
+
+def _fetch_page(sp, playlist_id: str, offset: int) -> Tuple[List[str], bool]:
+    """Track ids on one page (local files and episodes have no track id)."""
+    page = sp.playlist_items(playlist_id, fields="items(track(id)),next", limit=TRACK_PAGE_SIZE,
+                             offset=offset, additional_types=("track",))
+    ids = [item["track"]["id"] for item in page.get("items") or []
+           if item and item.get("track") and item["track"].get("id")]
+    return ids, bool(page.get("next"))
+
+def stored_snapshots(conn: sqlite3.Connection) -> Dict[str, Optional[str]]:
+    return dict(conn.execute("SELECT playlist_id, snapshot_id FROM playlists"))
+
+def apply_diff(conn: sqlite3.Connection, playlist: Dict[str, Any], track_ids: Set[str]) -> Tuple[int, int]:
+    """
+    Bring playlist_tracks for one playlist to track_ids and record its
+    snapshot_id, all in one transaction. Returns (added, removed).
+    """
+    playlist_id = playlist["id"]
+    with conn:
+        existing = {row[0] for row in conn.execute(
+            "SELECT track_id FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))}
+        added, removed = track_ids - existing, existing - track_ids
+        conn.executemany("DELETE FROM playlist_tracks WHERE playlist_id = ? AND track_id = ?",
+                         [(playlist_id, t) for t in removed])
+        conn.executemany("INSERT OR IGNORE INTO playlist_tracks (playlist_id, track_id) VALUES (?, ?)",
+                         [(playlist_id, t) for t in added])
+        conn.execute("""
+            INSERT INTO playlists (playlist_id, name, snapshot_id, last_sync)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(playlist_id) DO UPDATE SET
+                name = excluded.name, snapshot_id = excluded.snapshot_id, last_sync = excluded.last_sync
+        """, (playlist_id, playlist["name"], playlist["snapshot_id"]))
+    return len(added), len(removed)
+
+def sync_playlists(sp, conn: sqlite3.Connection, playlist_ids: Optional[Iterable[str]] = None,
+                   max_workers: int = MAX_WORKERS) -> Dict[str, int]:
+    """
+    Sync the user's playlists (or only playlist_ids) and return counts:
+    checked, unchanged, synced, failed, tracks_added, tracks_removed.
+    """
+    playlists = list_playlists(sp)
+    if playlist_ids is not None:
+        wanted = set(playlist_ids)
+        playlists = [p for p in playlists if p["id"] in wanted]
+
+    known = stored_snapshots(conn)
+    changed, unchanged = [], []
+    for p in playlists:
+        (unchanged if p["snapshot_id"] and known.get(p["id"]) == p["snapshot_id"] else changed).append(p)
+    report = {"checked": len(playlists), "unchanged": len(unchanged), "synced": 0, "failed": 0,
+              "tracks_added": 0, "tracks_removed": 0}
+
+    with conn:
+        conn.executemany("UPDATE playlists SET last_sync = CURRENT_TIMESTAMP WHERE playlist_id = ?",
+                         [(p["id"],) for p in unchanged])
+    if not changed:
+        return report
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="playlist-sync") as pool:
+        # Totals come from the listing, so every page can be requested up front
+        pages = {p["id"]: [pool.submit(_fetch_page, sp, p["id"], offset)
+                           for offset in range(0, max(p["total"], 1), TRACK_PAGE_SIZE)]
+                 for p in changed}
+        for playlist in changed:
+            try:
+                track_ids: Set[str] = set()
+                has_next = False
+                for future in pages[playlist["id"]]:
+                    ids, has_next = future.result()
+                    track_ids.update(ids)
+                # Grew since it was listed: read the rest sequentially
+                offset = len(pages[playlist["id"]]) * TRACK_PAGE_SIZE
+                while has_next:
+                    ids, has_next = _fetch_page(sp, playlist["id"], offset)
+                    track_ids.update(ids)
+                    offset += TRACK_PAGE_SIZE
+                # Stores the listed snapshot_id: if the playlist changed again
+                # mid-fetch, the next sync simply diffs it once more
+                added, removed = apply_diff(conn, playlist, track_ids)
+            except Exception as e:
+                report["failed"] += 1
+                log.warning("sync of playlist %s failed: %s", playlist["id"], e)
+                continue
+            report["synced"] += 1
+            report["tracks_added"] += added
+            report["tracks_removed"] += removed
+    return report
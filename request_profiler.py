@@ -0,0 +1,136 @@
+"""
+On-demand sampling profiler for single Flask requests.
+
+A request carrying `x-ml-profile: <MASHLAB_PROFILE_SECRET>` (on top of the
+usual shared secret) is sampled: a daemon thread reads the request
+thread's stack from sys._current_frames() every MASHLAB_PROFILE_INTERVAL
+seconds (default 5 ms) until the response is ready. Nothing is started for
+other requests, so they pay only for one header lookup.
+
+Each profile is stored in MASHLAB_PROFILE_DIR as collapsed stacks
+(<id>.folded, the input format of flamegraph.pl and speedscope) next to
+a JSON summary (<id>.json); only the newest MAX_STORED are kept.
+"""
+from __future__ import annotations
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILE_HEADER = "x-ml-profile"
+DEFAULT_INTERVAL = 0.005
+MAX_STORED = 50
+TOP_N = 15
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+def authorized(header_value: Optional[str]) -> bool:
+    """True when MASHLAB_PROFILE_SECRET is set and the header matches it."""
+    secret = os.getenv("MASHLAB_PROFILE_SECRET")
+    return bool(secret and header_value and hmac.compare_digest(secret, header_value))
+
+def profile_dir() -> str:
+    return os.getenv("MASHLAB_PROFILE_DIR", ".profiles")
+
+class SamplingProfiler:
+    """Samples one thread's stack on a timer; start() on that thread, then stop()."""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or float(os.getenv("MASHLAB_PROFILE_INTERVAL", DEFAULT_INTERVAL))
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._started = 0.0
+        self.wall_ms = 0.0
+
+    @classmethod
+    def start(cls, interval: Optional[float] = None) -> "SamplingProfiler":
+        profiler = cls(interval)
+        profiler._started = time.perf_counter()
+        profiler._thread.start()
+        return profiler
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack: List[Frame] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        self.wall_ms = (time.perf_counter() - self._started) * 1000
+        return self
+
+    def folded(self) -> str:
+        """Collapsed stacks, root first: 'a (f.py:1);b (g.py:9) 12' per line."""
+        return "".join(f"{';'.join(_label(f) for f in stack)} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = TOP_N) -> Dict[str, Any]:
+        """Top functions by self samples (on top of the stack) and by total samples (anywhere in it)."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        ms = self.wall_ms / self.samples if self.samples else 0.0
+
+        def rows(counter: Counter) -> List[Dict[str, Any]]:
+            return [{"function": _label(f), "samples": n, "approx_ms": round(n * ms, 1)}
+                    for f, n in counter.most_common(top)]
+
+        return {"wall_ms": round(self.wall_ms, 1), "samples": self.samples,
+                "interval_ms": self.interval * 1000, "self": rows(own), "cumulative": rows(total)}
+
+    def save(self, directory: Optional[str] = None, **meta: Any) -> str:
+        """Store the folded stacks and summary; returns the profile id."""
+        directory = directory or profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"  # sorts oldest first
+        with open(os.path.join(directory, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        with open(os.path.join(directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({"id": profile_id, **meta, **self.summary()}, f)
+        _prune(directory)
+        return profile_id
+
+def load(profile_id: str, kind: str = "folded", directory: Optional[str] = None) -> Optional[str]:
+    """A stored profile's folded stacks or JSON summary, or None for unknown ids."""
+    if kind not in ("folded", "json") or not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(directory or profile_dir(), f"{profile_id}.{kind}")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def _prune(directory: str) -> None:
+    summaries = sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+    for name in summaries[:-MAX_STORED]:
+        stem = name[:-len(".json")]
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(directory, stem + ext))
+            except OSError:
+                pass
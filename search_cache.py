@@ -0,0 +1,143 @@
+"""
+Process-wide TTL/LRU cache with stale-while-revalidate.
+
+Entries are fresh for `ttl` seconds. After that they are still served for
+up to `stale_ttl` seconds while a background thread reloads them, so a
+repeat lookup never waits on the network. The least recently used entry is
+evicted once `maxsize` is reached.
+"""
+from __future__ import annotations
+import json
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Set
+
+log = logging.getLogger(__name__)
+
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_instances: "weakref.WeakSet[TTLCache]" = weakref.WeakSet()
+
+def approx_size(value: Any) -> int:
+    """Rough in-memory footprint: serialized length for JSON-able values."""
+    try:
+        return len(json.dumps(value, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+class _Entry(NamedTuple):
+    value: Any
+    fresh_until: float
+    stale_until: float
+    size: int
+
+class TTLCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 600.0, stale_ttl: float = 3600.0,
+                 name: str = "cache", sizer: Callable[[Any], int] = approx_size):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._sizer = sizer
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: Set[Hashable] = set()
+        self._bytes = 0
+        self._counts = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+        _instances.add(self)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Fresh value for key or None; never loads or refreshes."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() < entry.fresh_until:
+                self._data.move_to_end(key)
+                return entry.value
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        entry = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl, self._sizer(value))
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._data[key] = entry
+            self._bytes += entry.size
+            while len(self._data) > self.maxsize:
+                _key, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.size
+                self._counts["evictions"] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Fresh hit: return it. Stale hit: return it and reload in the
+        background. Miss or expired: load inline and cache the result.
+        The returned value is shared by every caller; copy before mutating.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now >= entry.stale_until:
+                self._data.pop(key)
+                self._bytes -= entry.size
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+                if now < entry.fresh_until:
+                    self._counts["hits"] += 1
+                    return entry.value
+                self._counts["stale_hits"] += 1
+                schedule = key not in self._refreshing
+                if schedule:
+                    self._refreshing.add(key)
+            else:
+                self._counts["misses"] += 1
+        if entry is not None:
+            if schedule:
+                _refresh_pool.submit(self._refresh, key, loader)
+            return entry.value
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            self.set(key, loader())
+            with self._lock:
+                self._counts["refreshes"] += 1
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries
+            with self._lock:
+                self._counts["refresh_errors"] += 1
+            log.warning("%s: background refresh failed: %s", self.name, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            entries, size = len(self._data), self._bytes
+        lookups = counts["hits"] + counts["stale_hits"] + counts["misses"]
+        served = counts["hits"] + counts["stale_hits"]
+        return {
+            "name": self.name,
+            "entries": entries,
+            "approx_bytes": size,
+            "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+            **counts,
+        }
+
+def all_caches() -> List[TTLCache]:
+    """Every live TTLCache in the process, e.g. for metrics."""
+    return sorted(_instances, key=lambda cache: cache.name)
@@ -0,0 +1,108 @@
+"""
+Process-wide Spotify client management.
+
+- One pooled requests.Session (keep-alive, retries for GET/HEAD) shared by every client.
+- One client-credentials client per app id for the whole process; its token
+  lives in memory and is reused until it expires.
+- One user client per Streamlit session, rebuilt only when that session's
+  access token changes.
+
+No client is "tested" with an extra API call; failures surface on first use.
+requests and spotipy are imported on first use, not at import time.
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import requests
+    from spotipy import Spotify
+
+POOL_MAXSIZE = int(os.getenv("SPOTIFY_POOL_MAXSIZE", "32"))
+REQUESTS_TIMEOUT = 10
+MAX_USER_CLIENTS = 256
+
+_lock = threading.RLock()
+_session: Optional[requests.Session] = None
+_app_clients: Dict[str, Spotify] = {}
+_user_clients: "OrderedDict[str, Tuple[str, Spotify]]" = OrderedDict()
+
+def http_session() -> requests.Session:
+    """The shared, connection-pooled HTTP session."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                # Idempotent reads only: a retried POST/PUT/DELETE could apply a playlist write twice
+                retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset(["GET", "HEAD"]),
+                              respect_retry_after_header=True)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get_app_client(client_id: Optional[str] = None, client_secret: Optional[str] = None) -> Optional[Spotify]:
+    """
+    Client-credentials client, one per app id per process. Defaults to
+    SPOTIPY_CLIENT_ID/SECRET, falling back to SPOTIFY_CLIENT_ID/SECRET.
+    Returns None when credentials are missing.
+    """
+    cid = client_id or os.getenv("SPOTIPY_CLIENT_ID") or os.getenv("SPOTIFY_CLIENT_ID")
+    sec = client_secret or os.getenv("SPOTIPY_CLIENT_SECRET") or os.getenv("SPOTIFY_CLIENT_SECRET")
+    if not cid or not sec:
+        return None
+    sp = _app_clients.get(cid)
+    if sp is not None:
+        return sp
+    with _lock:
+        sp = _app_clients.get(cid)
+        if sp is None:
+            from spotipy import Spotify
+            from spotipy.cache_handler import MemoryCacheHandler
+            from spotipy.oauth2 import SpotifyClientCredentials
+
+            session = http_session()
+            auth_manager = SpotifyClientCredentials(
+                client_id=cid,
+                client_secret=sec,
+                requests_session=session,
+                requests_timeout=REQUESTS_TIMEOUT,
+                cache_handler=MemoryCacheHandler(),
+            )
+            sp = Spotify(auth_manager=auth_manager, requests_session=session, requests_timeout=REQUESTS_TIMEOUT)
+            _app_clients[cid] = sp
+    return sp
+
+def get_user_client(session_key: str, access_token: Optional[str]) -> Optional[Spotify]:
+    """Client for one user session, reused until its access token changes."""
+    if not access_token:
+        drop_user_client(session_key)
+        return None
+    with _lock:
+        cached = _user_clients.get(session_key)
+        if cached is not None and cached[0] == access_token:
+            _user_clients.move_to_end(session_key)
+            return cached[1]
+    from spotipy import Spotify
+
+    sp = Spotify(auth=access_token, requests_session=http_session(), requests_timeout=REQUESTS_TIMEOUT)
+    with _lock:
+        _user_clients[session_key] = (access_token, sp)
+        _user_clients.move_to_end(session_key)
+        while len(_user_clients) > MAX_USER_CLIENTS:
+            _user_clients.popitem(last=False)
+    return sp
+
+def drop_user_client(session_key: str) -> None:
+    """Forget a session's client (e.g. on logout)."""
+    with _lock:
+        _user_clients.pop(session_key, None)
@@ -1,14 +1,31 @@
 import os
 import json
+import threading
 import time
 import streamlit as st
-from requests_oauthlib import OAuth2Session
 from urllib.parse import urlencode
 import base64
-from dotenv import load_dotenv
+from startup import load_env
+from token_manager import EncryptedTokenStore, TokenManager
+
+# Browser cookie holding the token session id; kept out of the URL so it
+# never ends up in shared links, history or Referer headers.
+#
+# Limitation: Streamlit cannot set response headers, so the cookie is written
+# by injected JavaScript and therefore can never be HttpOnly. Any script
+# running on the page can read it, so an XSS bug would leak the sid (not the
+# Spotify tokens, which stay server-side). The idle timeout and logout limit
+# how long a leaked sid is useful.
+SID_COOKIE = "mashlab_sid"
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
+
+def _oauth_session(**kwargs):
+    """requests_oauthlib is only needed for login, logout and refresh."""
+    from requests_oauthlib import OAuth2Session
+
+    return OAuth2Session(**kwargs)
 
 class SpotifyOAuth:
     def __init__(self):
@@ -33,7 +50,7 @@ class SpotifyOAuth:
         
     def get_authorization_url(self):
         """Generate authorization URL for Spotify OAuth"""
-        oauth = OAuth2Session(
+        oauth = _oauth_session(
             client_id=self.client_id,
             redirect_uri=self.redirect_uri,
             scope=self.scope
@@ -44,7 +61,7 @@ class SpotifyOAuth:
     
     def get_token_from_code(self, authorization_response):
         """Exchange authorization code for access token"""
-        oauth = OAuth2Session(
+        oauth = _oauth_session(
             client_id=self.client_id,
             redirect_uri=self.redirect_uri
         )
@@ -64,7 +81,7 @@ class SpotifyOAuth:
     
     def refresh_token(self, refresh_token):
         """Refresh access token using refresh token"""
-        oauth = OAuth2Session(client_id=self.client_id)
+        oauth = _oauth_session(client_id=self.client_id)
         
         # Create basic auth header
         basic_auth = base64.b64encode(
@@ -86,45 +103,63 @@ def init_spotify_auth():
     
     return st.session_state.spotify_oauth
 
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+def get_token_manager():
+    """Process-wide token manager: background refresh plus the encrypted token store"""
+    global _token_manager
+    with _token_manager_lock:
+        if _token_manager is None:
+            oauth = SpotifyOAuth()
+            _token_manager = TokenManager(oauth.refresh_token, EncryptedTokenStore.from_env())
+    return _token_manager
+
+def _write_sid_cookie(sid, max_age):
+    """
+    Set (or with max_age=0 clear) the session cookie. Streamlit can only
+    read cookies, so this goes through JavaScript and cannot be HttpOnly.
+    """
+    import streamlit.components.v1 as components
+
+    components.html(f"""<script>
+    const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+    window.parent.document.cookie = "{SID_COOKIE}={sid}; Path=/; Max-Age={int(max_age)}; SameSite=Lax" + secure;
+    </script>""", height=0)
+
+def current_token_sid():
+    """Token session id for this browser tab, restored from the session cookie after a reload"""
+    if 'spotify_sid' not in st.session_state:
+        # None after logout, so the stale cookie this session started with is not reused
+        st.session_state.spotify_sid = st.context.cookies.get(SID_COOKIE)
+    return st.session_state.spotify_sid
+
 def get_user_token():
-    """Get valid user access token, refreshing if necessary"""
-    oauth = init_spotify_auth()
+    """Get valid user access token (refreshed ahead of expiry in the background)"""
+    sid = current_token_sid()
+    if not sid:
+        return None
     
-    # Check if we have a token in session
-    if 'spotify_token' in st.session_state:
-        token = st.session_state.spotify_token
-        expires_at = token.get('expires_at', 0)
-        
-        # Check if token is expired (with 60 second buffer)
-        if time.time() < expires_at - 60:
-            return token['access_token']
-        
-        # Token expired, try to refresh
-        if 'refresh_token' in token:
-            try:
-                new_token = oauth.refresh_token(token['refresh_token'])
-                st.session_state.spotify_token = new_token
-                return new_token['access_token']
-            except Exception as e:
-                st.error(f"Failed to refresh token: {str(e)}")
-                # Clear invalid token
-                if 'spotify_token' in st.session_state:
-                    del st.session_state.spotify_token
-    
-    return None
+    token = get_token_manager().get_access_token(sid)
+    if token is None:
+        # Unknown, expired or revoked session: forget it
+        st.session_state.spotify_sid = None
+    return token
 
 def handle_oauth_callback():
     """Handle OAuth callback and store token"""
     oauth = init_spotify_auth()
+    if st.session_state.pop('clear_sid_cookie', False):
+        _write_sid_cookie("", 0)
     
     # Get the current URL parameters
-    query_params = st.experimental_get_query_params()
+    query_params = st.query_params
     
     if 'code' in query_params:
         try:
             # Reconstruct the authorization response URL
-            code = query_params['code'][0]
-            state = query_params.get('state', [''])[0]
+            code = query_params['code']
+            state = query_params.get('state', '')
             
             # Create the authorization response URL
             auth_response = f"{oauth.redirect_uri}?code={code}"
@@ -134,18 +169,20 @@ def handle_oauth_callback():
             # Exchange code for token
             token = oauth.get_token_from_code(auth_response)
             
-            # Store token in session
-            st.session_state.spotify_token = token
+            # Hand the token to the manager; the browser keeps only its session id
+            manager = get_token_manager()
+            sid = manager.login(token)
+            st.session_state.spotify_sid = sid
+            _write_sid_cookie(sid, manager.idle_timeout)
             
-            # Clear URL parameters
-            st.experimental_set_query_params()
+            # Drop the code/state parameters from the URL
+            query_params.clear()
             
             st.success("Successfully authenticated with Spotify!")
-            st.rerun()
             
         except Exception as e:
             st.error(f"Authentication failed: {str(e)}")
-            st.experimental_set_query_params()
+            query_params.clear()
 
 def show_login_button():
     """Show Spotify login button"""
@@ -167,11 +204,14 @@ def show_login_button():
 def show_logout_button():
     """Show logout button"""
     if st.button("🚪 Logout"):
+        get_token_manager().logout(current_token_sid())
+        # Cleared on the next run; an element sent now would not survive st.rerun()
+        st.session_state.clear_sid_cookie = True
+        
         # Clear all Spotify-related session state
-        keys_to_clear = ['spotify_token', 'oauth_state']
-        for key in keys_to_clear:
-            if key in st.session_state:
-                del st.session_state[key]
+        st.session_state.spotify_sid = None
+        if 'oauth_state' in st.session_state:
+            del st.session_state['oauth_state']
         
         st.success("Logged out successfully!")
         st.rerun()
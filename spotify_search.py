@@ -0,0 +1,100 @@
+"""
+Spotify track search shared by every Streamlit session in the process.
+
+Results are cached by (normalized query, market, limit, offset) so a search
+another DJ ran a moment ago returns instantly, and stale entries are
+refreshed in the background rather than on the user's click.
+
+prefetch_next_page() warms the cache (and the audio-features cache) for the
+page after the one on screen, so "Show More" is a cache hit. Prefetching is
+bounded by a per-query depth and a process-wide rate so idle sessions
+cannot spend API quota.
+"""
+from __future__ import annotations
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from circuit_breaker import breaker
+from search_cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+SEARCH_CACHE = TTLCache(maxsize=1000, ttl=600, stale_ttl=6 * 3600, name="spotify_search")
+
+PREFETCH_MAX_OFFSET = 100        # never prefetch beyond the 5th page of 20
+PREFETCH_MAX_PER_MINUTE = 30     # process-wide cap on speculative requests
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-prefetch")
+_prefetch_lock = threading.Lock()
+_prefetch_inflight: Set[Tuple] = set()
+_prefetch_times: List[float] = []
+_prefetch_counts = {"scheduled": 0, "skipped_cached": 0, "skipped_cap": 0, "failed": 0}
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a query."""
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+def search_tracks_cached(sp, query: str, limit: int = 25, market: Optional[str] = "US",
+                         offset: int = 0) -> List[Dict[str, Any]]:
+    """Track items for query, from the shared cache when possible."""
+    key = (normalize_query(query), market, limit, offset)
+
+    def load():
+        results = breaker("spotify").call(sp.search, q=query, type="track", limit=limit, offset=offset, market=market)
+        return results["tracks"]["items"]
+
+    return SEARCH_CACHE.get_or_load(key, load)
+
+def _take_prefetch_slot() -> bool:
+    """Sliding one-minute window over prefetch starts."""
+    now = time.monotonic()
+    while _prefetch_times and now - _prefetch_times[0] > 60:
+        _prefetch_times.pop(0)
+    if len(_prefetch_times) >= PREFETCH_MAX_PER_MINUTE:
+        return False
+    _prefetch_times.append(now)
+    return True
+
+def prefetch_next_page(sp, query: str, limit: int, offset: int, market: Optional[str] = "US",
+                       enrich: Optional[Callable[[List[str]], Any]] = None) -> bool:
+    """
+    Fetch the page at offset in the background, then pass its track ids to
+    enrich (e.g. the audio-features service). Returns True if scheduled.
+    """
+    key = (normalize_query(query), market, limit, offset)
+    if not key[0]:
+        return False
+    if SEARCH_CACHE.get(key) is not None:
+        _prefetch_counts["skipped_cached"] += 1
+        return False
+    with _prefetch_lock:
+        if key in _prefetch_inflight:
+            return False
+        if offset > PREFETCH_MAX_OFFSET or not _take_prefetch_slot():
+            _prefetch_counts["skipped_cap"] += 1
+            return False
+        _prefetch_inflight.add(key)
+        _prefetch_counts["scheduled"] += 1
+
+    def run():
+        try:
+            items = search_tracks_cached(sp, query, limit=limit, market=market, offset=offset)
+            ids = [t["id"] for t in items if t.get("id")]
+            if enrich and ids:
+                enrich(ids)
+        except Exception as e:
+            _prefetch_counts["failed"] += 1
+            log.warning("prefetch of %r offset %s failed: %s", query, offset, e)
+        finally:
+            with _prefetch_lock:
+                _prefetch_inflight.discard(key)
+
+    _prefetch_pool.submit(run)
+    return True
+
+def search_cache_stats() -> Dict[str, Any]:
+    return {**SEARCH_CACHE.stats(), "prefetch": dict(_prefetch_counts)}
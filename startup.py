@@ -0,0 +1,155 @@
+"""
+Process start-up helpers shared by the entry points (app.py, flask_app.py,
+bpm_api_resolver.py).
+
+load_env() reads .env once per process, however many modules ask for it
+(twice at most, if one of them asks for .env to override the environment).
+
+Startup profiling: with MASHLAB_PROFILE_STARTUP=1, profile_startup() hooks
+the import system so every module import is timed, and span() times named
+initialization steps. report() (run at exit, or on demand) prints each
+module's own import time and each span, slowest first, to stderr.
+Without the variable nothing is hooked. This module only imports the
+standard library so it can be loaded before anything else.
+"""
+from __future__ import annotations
+import atexit
+import importlib.abc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+PROFILE_ENV = "MASHLAB_PROFILE_STARTUP"
+
+_env_lock = threading.Lock()
+_env_loaded = False
+_env_overridden = False
+
+def load_env(override: bool = False) -> None:
+    """
+    load_dotenv() once per process. By default variables already in the
+    environment win; with override=True .env wins, and that load still
+    happens once if a plain load came first.
+    """
+    global _env_loaded, _env_overridden
+    if _env_overridden or (_env_loaded and not override):
+        return
+    with _env_lock:
+        if _env_overridden or (_env_loaded and not override):
+            return
+        from dotenv import load_dotenv
+
+        load_dotenv(override=override)
+        _env_loaded = True
+        _env_overridden = override
+
+class _Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, List[float]] = {}  # module -> [total seconds, own seconds]
+        self.local_modules: List[str] = []  # modules from this repo, in import order
+        self.spans: List[Tuple[str, float]] = []
+        self.local = threading.local()  # .stack: child seconds per in-progress import
+        self.lock = threading.Lock()
+
+_profile: Optional[_Profile] = None
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        profile = _profile
+        stack = profile.local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            with profile.lock:
+                profile.imports[self._name] = [total, total - children]
+                if os.path.dirname(getattr(module, "__file__", None) or "") == _HERE:
+                    profile.local_modules.append(self._name)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Wraps whatever loader the remaining finders return with a timer."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, fullname)
+                return spec
+        return None
+
+def profiling() -> bool:
+    return _profile is not None
+
+def profile_startup(force: bool = False) -> bool:
+    """Start timing imports if MASHLAB_PROFILE_STARTUP=1 (or force). Returns whether profiling is on."""
+    global _profile
+    if _profile is not None:
+        return True
+    if not force and os.getenv(PROFILE_ENV) != "1":
+        return False
+    _profile = _Profile()
+    sys.meta_path.insert(0, _TimingFinder())
+    atexit.register(report)
+    return True
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time an initialization step; free when profiling is off."""
+    if _profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _profile.lock:
+            _profile.spans.append((name, time.perf_counter() - start))
+
+def report(out: Optional[TextIO] = None, top: int = 25) -> None:
+    """
+    Print this repo's modules in import order (total includes whatever they
+    imported), then the slowest imports by own time, then the spans.
+    """
+    profile = _profile
+    if profile is None:
+        return
+    out = out or sys.stderr
+    with profile.lock:
+        imports = dict(profile.imports)
+        local_modules = list(profile.local_modules)
+        spans = list(profile.spans)
+    elapsed = time.perf_counter() - profile.started
+    print(f"startup profile: {elapsed * 1000:.1f} ms since profiling began, "
+          f"{len(imports)} modules imported", file=out)
+    print(f"{'own ms':>9} {'total ms':>9}  module", file=out)
+    for name in local_modules:
+        total, own = imports[name]
+        print(f"{own * 1000:9.1f} {total * 1000:9.1f}  {name}", file=out)
+    print(f"-- slowest {top} by own time", file=out)
+    for name, (total, own) in sorted(imports.items(), key=lambda kv: kv[1][1], reverse=True)[:top]:
+        print(f"{own * 1000:9.1f} {total * 1000:9.1f}  {name}", file=out)
+    for name, seconds in spans:
+        print(f"{'':>9} {seconds * 1000:9.1f}  [{name}]", file=out)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for album art selection and the thumbnail cache (album_art.py)
+Run with: python test_album_art.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append('.')
+
+from album_art import ThumbnailCache, album_art_url, pick_image, thumbnail_url
+
+SPOTIFY_IMAGES = [
+    {"url": "https://i.scdn.co/image/640", "width": 640, "height": 640},
+    {"url": "https://i.scdn.co/image/300", "width": 300, "height": 300},
+    {"url": "https://i.scdn.co/image/64", "width": 64, "height": 64},
+]
+
+def test_smallest_image_covering_display_size():
+    assert pick_image(SPOTIFY_IMAGES) == "https://i.scdn.co/image/64"
+    assert pick_image(SPOTIFY_IMAGES, min_px=100) == "https://i.scdn.co/image/300"
+    assert pick_image(SPOTIFY_IMAGES, min_px=1000) == "https://i.scdn.co/image/640"
+    assert pick_image([{"url": "https://i.scdn.co/image/x", "width": None, "height": None}]) == "https://i.scdn.co/image/x"
+    assert pick_image([]) is None and album_art_url({"album": None}) is None
+    assert album_art_url({"album": {"images": SPOTIFY_IMAGES}}) == "https://i.scdn.co/image/64"
+
+def test_thumbnail_url_only_proxies_allowed_hosts():
+    os.environ.pop("MASHLAB_THUMB_PROXY", None)
+    assert thumbnail_url("https://i.scdn.co/image/64") == "https://i.scdn.co/image/64"
+    os.environ["MASHLAB_THUMB_PROXY"] = "http://localhost:5000/thumb"
+    try:
+        assert thumbnail_url("https://i.scdn.co/image/64") == \
+            "http://localhost:5000/thumb?u=https%3A%2F%2Fi.scdn.co%2Fimage%2F64"
+        assert thumbnail_url("https://evil.example/x.jpg") == "https://evil.example/x.jpg"
+        assert thumbnail_url(None) == ""
+    finally:
+        del os.environ["MASHLAB_THUMB_PROXY"]
+
+def test_cache_fetches_once_and_dedupes_by_content():
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        return b"same-bytes", "image/jpeg"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ThumbnailCache(tmp, fetch=fetch)
+        first = cache.get("https://i.scdn.co/image/a")
+        assert cache.get("https://i.scdn.co/image/a") == first and len(calls) == 1
+        assert cache.get("https://mosaic.scdn.co/b")[0] == first[0]
+        assert os.listdir(os.path.join(tmp, "blobs")) == [first[0]]
+        with open(cache.blob_path(first[0]), "rb") as f:
+            assert f.read() == b"same-bytes"
+        try:
+            cache.get("http://i.scdn.co/image/a")
+            assert False, "plain http must be rejected"
+        except ValueError:
+            pass
+
+def test_cache_prunes_least_recently_served_blobs():
+    def fetch(url):
+        return url.encode() * 10, "image/jpeg"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ThumbnailCache(tmp, fetch=fetch, max_bytes=700)
+        a = cache.get("https://i.scdn.co/image/a")[0]
+        b = cache.get("https://i.scdn.co/image/b")[0]
+        os.utime(cache.blob_path(a), (1, 1))
+        os.utime(cache.blob_path(b), (2, 2))
+        cache.get("https://i.scdn.co/image/b")  # served again: now the newest
+        c = cache.get("https://i.scdn.co/image/c")[0]
+        assert sorted(os.listdir(os.path.join(tmp, "blobs"))) == sorted([b, c])
+        assert cache._lookup("https://i.scdn.co/image/a") is None
+
+def test_redirects_off_the_allowed_hosts_are_refused():
+    import album_art
+
+    class Redirect:
+        is_redirect = True
+        headers = {"Location": "https://evil.example/x.jpg"}
+
+        def close(self):
+            pass
+
+    class Session:
+        def get(self, url, **kwargs):
+            assert kwargs["allow_redirects"] is False
+            return Redirect()
+
+    import spotify_clients
+    saved = spotify_clients.http_session
+    spotify_clients.http_session = lambda: Session()
+    try:
+        album_art._http_fetch("https://i.scdn.co/image/a")
+        assert False, "redirect to another host must be refused"
+    except ValueError as e:
+        assert "not allowed" in str(e)
+    finally:
+        spotify_clients.http_session = saved
+
+if __name__ == "__main__":
+    for test in [test_smallest_image_covering_display_size, test_thumbnail_url_only_proxies_allowed_hosts,
+                 test_cache_fetches_once_and_dedupes_by_content, test_cache_prunes_least_recently_served_blobs,
+                 test_redirects_off_the_allowed_hosts_are_refused]:
+        test()
+        print(f"✅ {test.__name__}")
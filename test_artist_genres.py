@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk artist/genre enrichment (artist_genres.py)
+Run with: python test_artist_genres.py
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+import circuit_breaker
+from db_migrations import migrate
+from artist_genres import GenresUnavailable, track_genres
+
+def tid(prefix, i):
+    """22-character Spotify-style id"""
+    return f"{prefix}{i:04d}".ljust(22, "x")
+
+class FakeSpotify:
+    """Track i is by artist i % 70 (primary) and the shared artist 'feat'"""
+    def __init__(self):
+        self.track_calls = []
+        self.artist_calls = []
+
+    def tracks(self, ids):
+        self.track_calls.append(len(ids))
+        return {"tracks": [None if t.startswith("gone") else
+                           {"id": t, "artists": [{"id": tid("a", int(t[1:5]) % 70)}, {"id": tid("feat", 0)}]}
+                           for t in ids]}
+
+    def artists(self, ids):
+        self.artist_calls.append(len(ids))
+        return {"artists": [{"id": a, "name": a, "genres": ["house"] if a.startswith("feat") else [f"g-{a[:5]}", "house"]}
+                            for a in ids]}
+
+def test_batch_uses_50_id_endpoints_then_cache():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    sp = FakeSpotify()
+    ids = [tid("t", i) for i in range(1, 121)] + [tid("gone", 1), "deezer_123"]
+    genres = track_genres(sp, conn, ids)
+    assert sp.track_calls == [50, 50, 21]            # "deezer_123" is never sent
+    assert sorted(sp.artist_calls) == [21, 50]       # 70 primary artists + 1 shared
+    assert len(genres) == 120 and tid("gone", 1) not in genres
+    assert genres[tid("t", 1)] == ["g-a0001", "house"]  # primary artist first, deduplicated
+
+    sp.track_calls.clear()
+    sp.artist_calls.clear()
+    assert track_genres(sp, conn, ids) == genres
+    assert sp.track_calls == [1] and sp.artist_calls == []  # only the unknown track is retried
+
+class FlakySpotify(FakeSpotify):
+    """/artists fails with a connection error while the breaker is still closed"""
+    def artists(self, ids):
+        raise ConnectionError("reset by peer")
+
+def _fresh_spotify_breaker():
+    saved = dict(circuit_breaker._breakers)
+    circuit_breaker._breakers.pop("spotify", None)
+    return saved
+
+def _restore_breakers(saved):
+    circuit_breaker._breakers.clear()
+    circuit_breaker._breakers.update(saved)
+
+def test_outage_is_reported_not_mistaken_for_no_genres():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    cached = tid("t", 1)
+    track_genres(FakeSpotify(), conn, [cached])
+    saved = _fresh_spotify_breaker()
+    try:
+        try:
+            track_genres(FlakySpotify(), conn, [cached, tid("t", 2)])
+        except GenresUnavailable as e:
+            assert e.unresolved == [tid("t", 2)]
+            assert e.genres == {cached: ["g-a0001", "house"]}
+        else:
+            raise AssertionError("expected GenresUnavailable")
+        assert circuit_breaker.breaker("spotify").state == circuit_breaker.CLOSED
+    finally:
+        _restore_breakers(saved)
+
+def test_routes_answer_503_with_remaining_retry_after():
+    os.environ.setdefault("PREVIEW_SHARED_SECRET", "s3cret")
+    import flask_app
+
+    def unavailable(track_ids):
+        raise GenresUnavailable({}, list(track_ids), ConnectionError("reset by peer"))
+
+    saved = _fresh_spotify_breaker()
+    lookup = flask_app.lookup_genres
+    flask_app.lookup_genres = unavailable
+    try:
+        client = flask_app.app.test_client()
+        headers = {"x-ml-preview-secret": flask_app.PREVIEW_SHARED_SECRET}
+        response = client.get(f"/api/meta/genre/{tid('t', 1)}", headers=headers)
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+
+        spotify = circuit_breaker.breaker("spotify")
+        for _ in range(spotify.failure_threshold):
+            spotify.record_failure()
+        spotify._opened_at -= 20
+        response = client.post("/api/meta/genre/batch", json={"ids": [tid("t", 1)]}, headers=headers)
+        assert response.status_code == 503 and response.get_json()["unavailable"] == [tid("t", 1)]
+        assert 1 <= int(response.headers["Retry-After"]) <= spotify.reset_timeout - 19
+    finally:
+        flask_app.lookup_genres = lookup
+        _restore_breakers(saved)
+
+if __name__ == "__main__":
+    for test in [test_batch_uses_50_id_endpoints_then_cache, test_outage_is_reported_not_mistaken_for_no_genres,
+                 test_routes_answer_503_with_remaining_retry_after]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the chunked, cached audio-features service in audio_features.py
+Run with: python test_audio_features.py
+"""
+
+import sqlite3
+import sys
+import threading
+
+sys.path.append('.')
+
+from test_support import temp_db
+from audio_features import get_audio_features
+
+class RecordingClient:
+    """Stands in for spotipy.Spotify; records every audio_features() call."""
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def audio_features(self, ids):
+        with self.lock:
+            self.calls.append(list(ids))
+        assert len(ids) <= 100
+        return [{"id": i, "tempo": 120.0, "key": 5, "mode": 1} if not i.endswith("x") else None for i in ids]
+
+def test_chunking_and_persistence():
+    """250 ids become 3 requests the first time and none the second"""
+    with temp_db() as path:
+        ids = [f"id{i}" for i in range(250)]
+        sp = RecordingClient()
+        features = get_audio_features(sp, ids, db_path=path)
+        assert len(features) == 250 and features["id7"]["key"] == 5
+        assert sorted(len(c) for c in sp.calls) == [50, 100, 100]
+
+        sp2 = RecordingClient()
+        again = get_audio_features(sp2, ids + ["id0"], db_path=path)
+        assert sp2.calls == [] and again == features
+
+def test_freshness_and_partial_cache():
+    """Stale rows are refetched; other sources on the row are preserved"""
+    with temp_db() as path:
+        conn = sqlite3.connect(path)
+        conn.execute("""INSERT INTO track_sources (spotify_id, spotify_analysis, spotify_features, features_fetched_at)
+                        VALUES ('old', '{"a": 1}', '{"id": "old", "key": 0}', datetime('now', '-60 days'))""")
+        conn.commit()
+
+        sp = RecordingClient()
+        features = get_audio_features(sp, ["old", "new", "nox"], db_path=path)
+        assert sp.calls == [["old", "new", "nox"]]
+        assert features["old"]["key"] == 5 and "nox" not in features
+        assert conn.execute("SELECT spotify_analysis FROM track_sources WHERE spotify_id='old'").fetchone()[0] == '{"a": 1}'
+        conn.close()
+
+def test_other_source_writes_do_not_refresh_features():
+    """Bumping updated_at for another column leaves old features stale"""
+    with temp_db() as path:
+        conn = sqlite3.connect(path)
+        conn.execute("""INSERT INTO track_sources (spotify_id, spotify_features, features_fetched_at)
+                        VALUES ('old', '{"id": "old", "key": 0}', datetime('now', '-60 days'))""")
+        conn.execute("""UPDATE track_sources SET spotify_analysis = '{"a": 1}', updated_at = CURRENT_TIMESTAMP
+                        WHERE spotify_id = 'old'""")
+        conn.commit()
+        conn.close()
+
+        sp = RecordingClient()
+        assert get_audio_features(sp, ["old"], db_path=path)["old"]["key"] == 5
+        assert sp.calls == [["old"]]
+
+def test_missing_features_are_cached_briefly():
+    """Ids without features are not refetched until MISSING_FOR_DAYS passes"""
+    with temp_db() as path:
+        sp = RecordingClient()
+        get_audio_features(sp, ["nox", "new"], db_path=path)
+        assert list(get_audio_features(sp, ["nox", "new"], db_path=path)) == ["new"]
+        assert sp.calls == [["nox", "new"]]
+
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE track_sources SET features_fetched_at = datetime('now', '-2 days') WHERE spotify_id = 'nox'")
+        conn.commit()
+        conn.close()
+        get_audio_features(sp, ["nox", "new"], db_path=path)
+        assert sp.calls == [["nox", "new"], ["nox"]]
+
+if __name__ == "__main__":
+    for test in [test_chunking_and_persistence, test_freshness_and_partial_cache,
+                 test_other_source_writes_do_not_refresh_features, test_missing_features_are_cached_briefly]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for per-upstream circuit breakers (circuit_breaker.py)
+Run with: python test_circuit_breaker.py
+"""
+
+import sqlite3
+import sys
+import time
+
+sys.path.append('.')
+
+import circuit_breaker
+from audio_features import get_audio_features, store_features
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from db_migrations import ensure_schema
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.http_status = status
+
+def flaky(error):
+    def fn():
+        raise error
+    return fn
+
+def test_opens_after_threshold_and_fails_fast():
+    cb = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        try:
+            cb.call(flaky(ConnectionError("down")))
+        except ConnectionError:
+            pass
+    assert cb.state == OPEN
+    started = time.perf_counter()
+    try:
+        cb.call(lambda: time.sleep(5))
+        assert False, "call should have been rejected"
+    except CircuitOpenError as e:
+        assert e.retry_in > 50
+    assert time.perf_counter() - started < 0.05
+    assert cb.stats()["rejected"] == 1
+
+def test_client_errors_do_not_count():
+    """A 404 is the upstream answering, not an outage"""
+    cb = CircuitBreaker("test", failure_threshold=1)
+    try:
+        cb.call(flaky(HTTPError(404)))
+    except HTTPError:
+        pass
+    assert cb.state == CLOSED
+    try:
+        cb.call(flaky(HTTPError(503)))
+    except HTTPError:
+        pass
+    assert cb.state == OPEN
+
+def test_programming_errors_are_not_outages():
+    """A bug in the wrapped call is re-raised and never opens the breaker"""
+    cb = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    for error in (KeyError("id"), TypeError("bad")):
+        try:
+            cb.call(flaky(error))
+            assert False, "bug should propagate"
+        except (KeyError, TypeError):
+            pass
+    assert cb.state == CLOSED and not circuit_breaker.is_outage(ValueError())
+    assert circuit_breaker.is_outage(circuit_breaker.UpstreamError("down"))
+
+def test_half_open_allows_one_probe():
+    cb = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    try:
+        cb.call(flaky(TimeoutError()))
+    except TimeoutError:
+        pass
+    time.sleep(0.06)
+    assert cb.state == HALF_OPEN
+    try:
+        cb.call(flaky(TimeoutError()))  # the probe fails: open again
+    except TimeoutError:
+        pass
+    assert cb.state == OPEN
+    time.sleep(0.06)
+    assert cb.call(lambda: "ok") == "ok"
+    assert cb.state == CLOSED
+
+def test_audio_features_fall_back_to_stale_cache():
+    """With Spotify down, rows older than the freshness window are served instead of nothing"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/t.db"
+        ensure_schema(path)
+        conn = sqlite3.connect(path)
+        store_features(conn, [{"id": "old", "tempo": 120.0}])
+        conn.execute("UPDATE track_sources SET updated_at = datetime('now', '-90 days')")
+        conn.commit()
+        conn.close()
+
+        class DownSpotify:
+            def audio_features(self, ids):
+                raise ConnectionError("down")
+
+        saved = dict(circuit_breaker._breakers)
+        circuit_breaker._breakers.pop("spotify", None)
+        try:
+            assert get_audio_features(DownSpotify(), ["old", "new"], db_path=path) == {"old": {"id": "old", "tempo": 120.0}}
+        finally:
+            circuit_breaker._breakers.clear()
+            circuit_breaker._breakers.update(saved)
+
+if __name__ == "__main__":
+    for test in [test_opens_after_threshold_and_fails_fast, test_client_errors_do_not_count,
+                 test_programming_errors_are_not_outages, test_half_open_allows_one_probe, test_audio_features_fall_back_to_stale_cache]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the effective_metrics view
+Run with: python test_effective_metrics.py
+"""
+
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+from compat import to_camelot
+from db_migrations import migrate
+from effective_metrics import get_effective_metrics, list_library, refresh_effective_metrics
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO tracks (track_id, title, artist, bpm, key_int, mode_int, energy, source) VALUES (?, ?, ?, ?, ?, ?, ?, 'spotify')",
+        [("a", "A", "X", 120.0, 0, 1, 0.8), ("b", "B", "Y", 121.0, 7, 1, 0.7), ("c", "C", "Z", 90.0, 3, 0, 0.2)],
+    )
+    conn.commit()
+    return conn
+
+def test_precedence():
+    """Overrides beat resolver output, which beats raw track values"""
+    conn = _db()
+    row = get_effective_metrics(conn, ["a"])["a"]
+    assert (row["bpm"], row["key_num"], row["mode"], row["camelot"], row["source"]) == (120.0, 0, 1, "8B", "spotify")
+
+    conn.execute("INSERT INTO track_metrics (spotify_id, bpm, key_num, mode, confidence, source) VALUES ('a', 124.0, 9, 0, 0.9, 'resolver:v1')")
+    row = get_effective_metrics(conn, ["a"])["a"]
+    assert (row["bpm"], row["camelot"], row["confidence"], row["source"]) == (124.0, "8A", 0.9, "resolver:v1")
+
+    # An override that only pins BPM keeps the resolver's key
+    conn.execute("INSERT OR REPLACE INTO user_overrides (spotify_id, bpm) VALUES ('a', 128.0)")
+    row = get_effective_metrics(conn, ["a"])["a"]
+    assert (row["bpm"], row["key_num"], row["mode"], row["confidence"], row["source"]) == (128.0, 9, 0, 1.0, "user")
+
+    conn.execute("DELETE FROM user_overrides WHERE spotify_id = 'a'")
+    conn.execute("UPDATE track_metrics SET bpm = 125.0 WHERE spotify_id = 'a'")
+    assert get_effective_metrics(conn, ["a"])["a"]["bpm"] == 125.0
+
+    conn.execute("DELETE FROM tracks WHERE track_id = 'c'")
+    assert "c" not in get_effective_metrics(conn)
+
+def test_full_refresh_matches_triggers():
+    """A full rebuild produces the same rows the triggers maintained"""
+    conn = _db()
+    conn.execute("INSERT INTO user_overrides (spotify_id, key_num, mode) VALUES ('b', 2, 1)")
+    before = {k: {c: v for c, v in r.items() if c != "updated_at"} for k, r in get_effective_metrics(conn).items()}
+    refresh_effective_metrics(conn)
+    after = {k: {c: v for c, v in r.items() if c != "updated_at"} for k, r in get_effective_metrics(conn).items()}
+    assert before == after
+
+def test_library_reads_effective_rows():
+    """list_library sees the resolved values"""
+    conn = _db()
+    conn.execute("INSERT INTO user_overrides (spotify_id, bpm) VALUES ('c', 119.0)")
+    library = {t["track_id"]: t for t in list_library(conn)}
+    assert library["c"]["bpm"] == 119.0 and library["c"]["metrics_source"] == "user"
+
+def test_sql_camelot_matches_the_app():
+    """Library (SQL) and Search (compat.to_camelot) show the same code for all 24 keys"""
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executemany("INSERT INTO tracks (track_id, title, artist, key_int, mode_int) VALUES (?, 't', 'a', ?, ?)",
+                     [(f"{k}-{m}", k, m) for k in range(12) for m in (0, 1)])
+    rows = get_effective_metrics(conn)
+    assert len(rows) == 24
+    assert all(row["camelot"] == to_camelot(row["key_num"], row["mode"]) for row in rows.values())
+
+if __name__ == "__main__":
+    for test in [test_precedence, test_full_refresh_matches_triggers, test_library_reads_effective_rows,
+                 test_sql_camelot_matches_the_app]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for federated Spotify + Deezer search (federated_search.py)
+Run with: python test_federated_search.py
+"""
+
+import sys
+import threading
+import time
+
+sys.path.append('.')
+
+import federated_search
+from federated_search import federated_search as search, merge_results
+from track_keys import dedupe_key
+
+def track(provider, title, artist, **extra):
+    return {"id": f"{provider}:{title}", "provider": provider, "title": title, "artist": artist,
+            "preview_url": None, **extra}
+
+def test_dedupe_key_normalizes_like_the_bpm_resolver():
+    assert dedupe_key("Blinding Lights (Remastered)", "The Weeknd, Daft Punk") == \
+        dedupe_key("blinding lights", "The Weeknd")
+
+def test_dedupe_key_keeps_non_latin_titles_apart():
+    assert dedupe_key("Группа крови", "Кино") != dedupe_key("Кукла колдуна", "Король и Шут")
+    assert dedupe_key("ГРУППА КРОВИ", "Кино") == dedupe_key("Группа крови (Remastered)", "Кино")
+    assert dedupe_key("Beyoncé", "Ｂｅｙｏｎｃé") == ("beyonce", "beyonce")
+
+def test_unmatchable_keys_fall_back_to_the_provider_id():
+    merged = merge_results({"spotify": [track("spotify", "???", "!!!")],
+                            "deezer": [track("deezer", "...", "!!!")]}, limit=10)
+    assert len(merged) == 2
+
+def test_merge_keeps_first_provider_and_fills_gaps():
+    merged = merge_results({
+        "spotify": [track("spotify", "One More Time", "Daft Punk"), track("spotify", "Aerodynamic", "Daft Punk")],
+        "deezer": [track("deezer", "One More Time (Radio Edit)", "Daft Punk", preview_url="https://cdn/p.mp3"),
+                   track("deezer", "Digital Love", "Daft Punk")],
+    }, limit=10)
+    assert [m["title"] for m in merged] == ["One More Time", "Aerodynamic", "Digital Love"]
+    assert merged[0]["id"] == "spotify:One More Time" and merged[0]["sources"] == ["spotify", "deezer"]
+    assert merged[0]["preview_url"] == "https://cdn/p.mp3"
+
+def test_slow_provider_is_dropped_at_the_deadline():
+    release = threading.Event()
+
+    def slow(query, limit):
+        release.wait(2)
+        return [track("deezer", "Late", "X")]
+
+    saved = dict(federated_search.PROVIDERS)
+    federated_search.PROVIDERS.update({"spotify": lambda q, n: [track("spotify", "Fast", "Y")], "deezer": slow})
+    try:
+        started = time.perf_counter()
+        response = search("q", deadline=0.2)
+        assert time.perf_counter() - started < 1
+    finally:
+        release.set()
+        federated_search.PROVIDERS.update(saved)
+    assert [r["title"] for r in response["results"]] == ["Fast"]
+    assert response["partial"] and response["providers"]["deezer"]["status"] == "timeout"
+    assert response["providers"]["spotify"] == {**response["providers"]["spotify"], "status": "ok", "count": 1}
+
+if __name__ == "__main__":
+    for test in [test_dedupe_key_normalizes_like_the_bpm_resolver, test_dedupe_key_keeps_non_latin_titles_apart,
+                 test_unmatchable_keys_fall_back_to_the_provider_id, test_merge_keeps_first_provider_and_fills_gaps,
+                 test_slow_provider_is_dropped_at_the_deadline]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -11,129 +11,7 @@ import os
 # Add the current directory to the path
 sys.path.append('.')
 
-# Import only the core functions we need to test
-def to_camelot(key_int, mode_int):
-    """Convert key_int and mode_int to Camelot notation."""
-    KEYS = ["C","C♯/D♭","D","D♯/E♭","E","F","F♯/G♭","G","G♯/A♭","A","A♯/B♭","B"]
-    CAMELOT_MAJOR = {0:"8B",1:"3B",2:"10B",3:"5B",4:"12B",5:"7B",6:"2B",7:"9B",8:"4B",9:"11B",10:"6B",11:"1B"}
-    CAMELOT_MINOR = {0:"5A",1:"12A",2:"7A",3:"2A",4:"9A",5:"4A",6:"11A",7:"6A",8:"1A",9:"8A",10:"3A",11:"10A"}
-    
-    if key_int is None or mode_int is None: 
-        return ""
-    return (CAMELOT_MAJOR if mode_int==1 else CAMELOT_MINOR).get(key_int, "")
-
-def camelot_neighbors(cam):
-    """Get harmonic neighbors of a Camelot key."""
-    if not cam: 
-        return set()
-    num = int(cam[:-1]); let = cam[-1]
-    left = 12 if num==1 else num-1
-    right = 1 if num==12 else num+1
-    return {f"{left}{let}", f"{right}{let}", f"{num}{'B' if let=='A' else 'A'}"}
-
-def key_score(a, b, mode):
-    """Calculate key compatibility score between two tracks."""
-    if not a or not b:
-        return 0.0 if mode != "Ignore" else 1.0
-    
-    a_cam = to_camelot(a[0], a[1])
-    b_cam = to_camelot(b[0], b[1])
-    
-    if not a_cam or not b_cam:
-        return 0.0 if mode != "Ignore" else 1.0
-    
-    if mode == "Ignore":
-        return 1.0
-    elif mode == "Exact":
-        return 1.0 if a_cam == b_cam else 0.0
-    elif mode == "Harmonic":
-        if a_cam == b_cam:
-            return 1.0
-        if b_cam in camelot_neighbors(a_cam):
-            return 0.9
-        # Parallel/relative keys
-        n1, n2 = int(a_cam[:-1]), int(b_cam[:-1])
-        if (abs(n1-n2)==2 or abs((n1+12)-n2)==2 or abs(n1-(n2+12))==2) and (a_cam[-1]==b_cam[-1]):
-            return 0.75
-        # Same pitch class, different mode
-        if a[0] == b[0] and a[1] != b[1]:
-            return 0.4
-        return 0.0
-    
-    return 0.0
-
-def tempo_score(a_bpm, b_bpm, pct_tol):
-    """Calculate tempo compatibility score between two tracks."""
-    if not a_bpm or not b_bpm:
-        return 0.0
-    
-    # Calculate percentage difference
-    pct_diff = abs(a_bpm - b_bpm) / a_bpm
-    
-    if pct_diff <= pct_tol / 100.0:
-        return 1.0
-    elif pct_diff <= 2 * pct_tol / 100.0:
-        # Linear decay from 1.0 to 0.0
-        return max(0.0, 1.0 - (pct_diff - pct_tol / 100.0) / (pct_tol / 100.0))
-    else:
-        return 0.0
-
-def energy_score(e1, e2):
-    """Calculate energy compatibility score between two tracks."""
-    if e1 is None or e2 is None: 
-        return 0.0
-    return 1.0 - min(1.0, abs(e1-e2)/0.5)
-
-def compat(a, b, pct_tol, key_mode, w=(0.5,0.35,0.15)):
-    """Calculate overall compatibility score and reason between two tracks."""
-    # Tempo score
-    t_score = tempo_score(a.get("bpm"), b.get("bpm"), pct_tol)
-    
-    # Key score
-    a_key = (a.get("key_int"), a.get("mode_int")) if (a.get("key_int") is not None and a.get("mode_int") is not None) else None
-    b_key = (b.get("key_int"), b.get("mode_int")) if (b.get("key_int") is not None and b.get("mode_int") is not None) else None
-    k_score = key_score(a_key, b_key, key_mode)
-    
-    # Energy score
-    e_score = energy_score(a.get("energy"), b.get("energy"))
-    
-    # Overall score
-    score = round(w[0] * t_score + w[1] * k_score + w[2] * e_score, 3)
-    
-    # Generate reason string
-    reason_parts = []
-    
-    # Tempo reason
-    if a.get("bpm") and b.get("bpm"):
-        pct_diff = abs(a["bpm"] - b["bpm"]) / a["bpm"] * 100
-        if pct_diff <= pct_tol:
-            reason_parts.append(f"Same tempo ({round(a['bpm'], 1)} BPM)")
-        else:
-            direction = "+" if b["bpm"] > a["bpm"] else "-"
-            reason_parts.append(f"{direction}{round(pct_diff, 1)}% tempo")
-    
-    # Key reason
-    if a_key and b_key:
-        a_cam = to_camelot(a_key[0], a_key[1])
-        b_cam = to_camelot(b_key[0], b_key[1])
-        if a_cam == b_cam:
-            reason_parts.append(f"Same key {a_cam}")
-        elif key_mode == "Harmonic" and b_cam in camelot_neighbors(a_cam):
-            reason_parts.append(f"Harmonic {a_cam} → {b_cam}")
-        elif key_mode == "Harmonic" and k_score >= 0.75:
-            reason_parts.append(f"Relative keys {a_cam} → {b_cam}")
-    
-    # Energy reason
-    if a.get("energy") is not None and b.get("energy") is not None:
-        e_diff = abs(a["energy"] - b["energy"])
-        if e_diff <= 0.1:
-            reason_parts.append("Energy close")
-        else:
-            reason_parts.append(f"Energy {round(a['energy'], 2)} vs {round(b['energy'], 2)}")
-    
-    reason = "; ".join(reason_parts) if reason_parts else "Basic compatibility"
-    
-    return score, reason
+from compat import compat, key_score, tempo_score, to_camelot
 
 def test_to_camelot():
     """Test Camelot key conversion for all 24 keys"""
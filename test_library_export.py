@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming Library export (library_export.py)
+Run with: python test_library_export.py
+"""
+
+import csv
+import gzip
+import io
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append('.')
+
+from db_migrations import ensure_schema
+from effective_metrics import list_library
+from library_export import export_library, export_library_bytes, iter_batches, stream_csv
+
+def _library(tmp, n=23):
+    path = f"{tmp}/lib.db"
+    ensure_schema(path)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO tracks (track_id, title, artist, bpm, key_int, mode_int, energy) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"t{i:03d}", f"Song, \"{i}\"", "Artist", 100.0 + i if i % 5 else None, i % 12, i % 2, 0.5)
+         for i in range(n)])
+    conn.commit()
+    return conn
+
+def test_batches_cover_every_row_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp)
+        batches = [rows for _, rows in iter_batches(conn, batch_size=5)]
+        assert [len(b) for b in batches] == [5, 5, 5, 5, 3]
+        assert [r[0] for b in batches for r in b] == [f"t{i:03d}" for i in range(23)]
+        conn.close()
+
+def test_csv_chunks_match_library_and_gzip_round_trips():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp)
+        chunks = list(stream_csv(conn, batch_size=10))
+        assert len(chunks) == 3
+        plain = b"".join(chunks)
+        rows = list(csv.DictReader(io.StringIO(plain.decode())))
+        assert len(rows) == 23 and rows[1]["title"] == 'Song, "1"' and rows[0]["bpm"] == ""
+        assert {r["track_id"] for r in rows} == {r["track_id"] for r in list_library(conn)}
+
+        assert gzip.decompress(b"".join(stream_csv(conn, gzip=True, batch_size=10))) == plain
+        conn.close()
+
+def test_empty_library_exports_header_only():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp, n=0)
+        assert b"".join(stream_csv(conn)).decode().startswith("track_id,title,artist")
+        conn.close()
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_formats_round_trip(fmt):
+    pa = pytest.importorskip("pyarrow")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp)
+        out = export_library(conn, fmt, batch_size=10)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(out)
+            assert pq.ParquetFile(io.BytesIO(export_library(conn, fmt, batch_size=10).read())).num_row_groups == 3
+        else:
+            table = pa.ipc.open_file(out).read_all()
+        assert table.num_rows == 23
+        assert table.schema.field("bpm").type == pa.float64()
+        assert table.column("bpm").to_pylist()[:2] == [None, 101.0]
+        conn.close()
+
+def test_export_reads_one_snapshot_during_writes():
+    """Rows written mid-export never appear in, or shift, later batches"""
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp)
+        conn.execute("PRAGMA journal_mode=WAL")  # lets the writer commit while the export reads
+        expected = b"".join(stream_csv(conn, batch_size=5))
+        chunks = stream_csv(conn, batch_size=5)
+        exported = next(chunks)
+        writer = sqlite3.connect(f"{tmp}/lib.db")
+        writer.execute("INSERT INTO tracks (track_id, title, artist) VALUES ('t020a', 'Late', 'Artist')")
+        writer.execute("DELETE FROM tracks WHERE track_id = 't022'")
+        writer.commit()
+        writer.close()
+        exported += b"".join(chunks)
+        assert exported == expected and not conn.in_transaction
+
+def test_download_button_accepts_export():
+    """The Library tab's download button gets data Streamlit can convert"""
+    download = pytest.importorskip("streamlit.runtime.download_data_util")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _library(tmp)
+        data, _mime = download.convert_data_to_bytes_and_infer_mime(
+            export_library_bytes(conn, "csv", gzip=True), RuntimeError("unsupported"))
+        assert gzip.decompress(data) == b"".join(stream_csv(conn))
+        with pytest.raises(RuntimeError):
+            download.convert_data_to_bytes_and_infer_mime(export_library(conn), RuntimeError("unsupported"))
+        conn.close()
+
+if __name__ == "__main__":
+    for test in [test_batches_cover_every_row_once, test_csv_chunks_match_library_and_gzip_round_trips,
+                 test_empty_library_exports_header_only, test_export_reads_one_snapshot_during_writes,
+                 test_download_button_accepts_export]:
+        test()
+        print(f"✅ {test.__name__}")
+    for fmt in ["parquet", "arrow"]:
+        test_columnar_formats_round_trip(fmt)
+        print(f"✅ test_columnar_formats_round_trip[{fmt}]")
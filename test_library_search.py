@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the FTS5 local library search in library_search.py
+Run with: python test_library_search.py
+"""
+
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+from db_migrations import migrate
+from library_search import enable_replace_triggers, search_local
+
+def _library():
+    conn = sqlite3.connect(":memory:")
+    enable_replace_triggers(conn)
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO tracks (track_id, title, artist) VALUES (?, ?, ?)",
+        [
+            ("t1", "Blinding Lights", "The Weeknd"),
+            ("t2", "Levitating", "Dua Lipa"),
+            ("t3", "Save Your Tears", "The Weeknd"),
+            ("t4", "Lights Up", "Harry Styles"),
+        ],
+    )
+    conn.commit()
+    return conn
+
+def _ids(hits):
+    return [h["track_id"] for h in hits]
+
+def test_prefix_and_ranking():
+    """Partial words match, and title hits outrank artist-only hits"""
+    conn = _library()
+    assert set(_ids(search_local(conn, "weekn"))) == {"t1", "t3"}
+    assert _ids(search_local(conn, "blind weeknd")) == ["t1"]
+    assert _ids(search_local(conn, "light"))[0] in {"t1", "t4"}
+    assert search_local(conn, "   ") == []
+
+def test_triggers_keep_index_in_sync():
+    """Replace, update and delete on tracks are reflected in the index"""
+    conn = _library()
+    conn.execute("INSERT OR REPLACE INTO tracks (track_id, title, artist) VALUES ('t2', 'Physical', 'Dua Lipa')")
+    assert _ids(search_local(conn, "levitating")) == []
+    assert _ids(search_local(conn, "physical")) == ["t2"]
+
+    conn.execute("UPDATE tracks SET title = 'Starboy' WHERE track_id = 't1'")
+    assert _ids(search_local(conn, "blinding")) == []
+    assert _ids(search_local(conn, "starb")) == ["t1"]
+
+    conn.execute("DELETE FROM tracks WHERE track_id = 't3'")
+    assert _ids(search_local(conn, "weeknd")) == ["t1"]
+    conn.execute("INSERT INTO tracks_fts(tracks_fts) VALUES ('integrity-check')")
+
+def test_ignored_insert_keeps_index_entry():
+    """INSERT OR IGNORE and upserts of an existing track leave it searchable"""
+    conn = _library()
+    conn.execute("INSERT OR IGNORE INTO tracks (track_id, title, artist) VALUES ('t2', 'Other', 'Dua Lipa')")
+    assert _ids(search_local(conn, "levitating")) == ["t2"]
+    conn.execute("""INSERT INTO tracks (track_id, title, artist) VALUES ('t2', 'Levitating', 'Dua Lipa')
+                    ON CONFLICT(track_id) DO UPDATE SET bpm = 103""")
+    assert _ids(search_local(conn, "levitating")) == ["t2"]
+    conn.execute("INSERT INTO tracks_fts(tracks_fts) VALUES ('integrity-check')")
+
+if __name__ == "__main__":
+    for test in [test_prefix_and_ranking, test_triggers_keep_index_in_sync, test_ignored_insert_keeps_index_entry]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the change-aware library snapshot (library_snapshot.py)
+Run with: python test_library_snapshot.py
+"""
+
+import sqlite3
+import sys
+import tempfile
+
+sys.path.append('.')
+
+from compat import rank_library_partners
+from db_migrations import ensure_schema
+from library_snapshot import _watcher, get_snapshot
+
+def _add(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO tracks (track_id, title, artist, bpm, key_int, mode_int, energy) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def test_reused_until_another_connection_commits():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/lib.db"
+        ensure_schema(path)
+        _add(path, [("a", "A", "X", 120.0, 0, 1, 0.8), ("b", "B", "Y", 121.0, 7, 1, 0.7)])
+        first = get_snapshot(path)
+        assert get_snapshot(path) is first and _watcher(path).loads == 1
+        assert len(first) == 2 and first.store.row("a")["bpm"] == 120.0
+
+        _add(path, [("c", "C", "Z", 90.0, 3, 0, 0.2)])
+        second = get_snapshot(path)
+        assert second is not first and len(second) == 3 and _watcher(path).loads == 2
+
+def test_rows_and_compat_share_the_snapshot():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/lib.db"
+        ensure_schema(path)
+        _add(path, [("a", "A", "X", 120.0, 0, 1, 0.8), ("b", "B", "Y", 121.0, 7, 1, 0.7), ("c", "C", "Z", 90.0, 3, 0, 0.2)])
+        snap = get_snapshot(path)
+        assert {r["track_id"] for r in snap.rows()} == {"a", "b", "c"}
+
+        ranked = rank_library_partners(snap, "a", pct_tol=8.0, key_mode="Harmonic")
+        assert [track_id for track_id, _score, _reason in ranked] == ["b", "c"]
+        assert rank_library_partners(snap, "missing") == []
+
+def test_page_filters_sorts_and_pages():
+    """Effective BPM drives sorting and the BPM filter; total counts every match"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/lib.db"
+        ensure_schema(path)
+        _add(path, [("a", "Ágape", "X", 120.0, 0, 1, 0.8), ("b", "B", "Yazoo", 121.0, 7, 1, 0.7),
+                    ("c", "C", "Z", 90.0, 3, 0, 0.2), ("d", "D", "Z", None, None, None, None)])
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO user_overrides (spotify_id, bpm) VALUES ('c', 125.0)")
+        conn.commit()
+        conn.close()
+        snap = get_snapshot(path)
+
+        rows, total = snap.page(sort="bpm", descending=False, limit=2)
+        assert total == 4 and rows.values("track_id") == ["a", "b"]
+        rows, _total = snap.page(sort="bpm", descending=True, limit=2, offset=2)
+        assert rows.values("track_id") == ["a", "d"]
+        rows, total = snap.page(bpm_range=(121.0, 130.0), sort="title", descending=True)
+        assert total == 2 and rows.values("track_id") == ["c", "b"]
+        assert snap.page(search="ya")[0].values("track_id") == ["b"]
+        assert snap.page(search="agap x")[0].values("track_id") == ["a"]
+        assert snap.page(search="y z")[1] == 0
+        # Unknown sort keys fall back to newest first
+        assert snap.page(sort="bpm; DROP TABLE tracks")[1] == 4
+
+if __name__ == "__main__":
+    for test in [test_reused_until_another_connection_commits, test_rows_and_compat_share_the_snapshot,
+                 test_page_filters_sorts_and_pages]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned schema migrations in db_migrations.py
+Run with: python test_migrations.py
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+from test_support import temp_db
+import db_migrations
+from db_migrations import SCHEMA_VERSION, Migration, ensure_schema, migrate, schema_version
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def test_fresh_database():
+    """A new database ends up at the latest version with every table present"""
+    with temp_db(schema=False) as path:
+        conn = sqlite3.connect(path)
+        assert migrate(conn) == SCHEMA_VERSION
+        assert schema_version(conn) == SCHEMA_VERSION
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for name in ("tracks", "mashups", "track_metrics", "track_sources", "user_overrides", "simple_bpm_cache"):
+            assert name in tables, name
+        conn.close()
+
+def test_legacy_database_upgrade():
+    """Pre-versioning tables gain missing columns and v1.1 mashups are converted"""
+    with temp_db(schema=False) as path:
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE tracks(track_id TEXT PRIMARY KEY, title TEXT, artist TEXT, key_int INTEGER)")
+        conn.execute("INSERT INTO tracks VALUES ('t1', 'Song', 'Artist', 5)")
+        conn.execute("""CREATE TABLE mashups(id INTEGER PRIMARY KEY, seed_track_id TEXT, partner_track_id TEXT,
+                        title TEXT, note TEXT, created_at TEXT)""")
+        conn.execute("INSERT INTO mashups VALUES (1, 'a', 'b', 'x', 'nice', '2024-01-01')")
+        conn.execute("INSERT INTO mashups VALUES (2, 'a', 'b', 'dup', NULL, '2024-01-02')")
+        conn.execute("CREATE TABLE user_overrides(spotify_id TEXT PRIMARY KEY, key_num INTEGER, mode INTEGER)")
+        conn.commit()
+
+        migrate(conn)
+
+        assert {"bpm", "album_art", "source", "tags", "created_at"} <= _columns(conn, "tracks")
+        assert {"mode_int", "energy", "camelot", "url"} <= _columns(conn, "tracks")
+        assert conn.execute("SELECT key_num FROM effective_metrics WHERE spotify_id='t1'").fetchone()[0] == 5
+        assert conn.execute("SELECT created_at FROM tracks WHERE track_id='t1'").fetchone()[0] is not None
+        conn.execute("INSERT INTO tracks (track_id, title, artist) VALUES ('t2', 'New', 'Artist')")
+        assert conn.execute("SELECT created_at FROM tracks WHERE track_id='t2'").fetchone()[0] is not None
+
+        rows = conn.execute("SELECT left_id, right_id, notes FROM mashups").fetchall()
+        assert rows == [("a", "b", "nice")]
+        assert "bpm" in _columns(conn, "user_overrides")
+        conn.close()
+
+def test_failed_step_rolls_back():
+    """A failing step leaves user_version at the last completed step"""
+    with temp_db(schema=False) as path:
+        conn = sqlite3.connect(path)
+        original = list(db_migrations.MIGRATIONS)
+
+        def boom(c):
+            c.execute("CREATE TABLE half_done(x)")
+            raise RuntimeError("boom")
+
+        db_migrations.MIGRATIONS[:] = original[:2] + [Migration(3, "boom", boom)]
+        try:
+            try:
+                migrate(conn, target=3)
+                assert False, "expected failure"
+            except RuntimeError:
+                pass
+            assert schema_version(conn) == 2
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            assert "half_done" not in tables
+        finally:
+            db_migrations.MIGRATIONS[:] = original
+        conn.close()
+
+def test_batched_mashups_migration_resumes():
+    """An interrupted v1.1 -> v1.2 copy resumes from its checkpoint and swaps once"""
+    from migrate_db import CHECKPOINT_TABLE, SHADOW_TABLE, migrate_mashups
+
+    with temp_db(schema=False) as path:
+        conn = sqlite3.connect(path)
+        conn.execute("""CREATE TABLE mashups(id INTEGER PRIMARY KEY, seed_track_id TEXT, partner_track_id TEXT,
+                        title TEXT, note TEXT, created_at TEXT)""")
+        conn.executemany("INSERT INTO mashups VALUES (?, ?, ?, '', ?, '2024-01-01')",
+                         [(i, f"s{i}", f"p{i}", f"n{i}") for i in range(1, 251)])
+        conn.commit()
+
+        class Interrupted(Exception):
+            pass
+
+        def stop_after_first_batch(message):
+            raise Interrupted(message)
+
+        try:
+            migrate_mashups(conn, batch_size=100, progress=stop_after_first_batch)
+            assert False, "expected interruption"
+        except Interrupted:
+            pass
+        assert conn.execute(f"SELECT last_rowid FROM {CHECKPOINT_TABLE}").fetchone()[0] == 100
+        assert conn.execute(f"SELECT COUNT(*) FROM {SHADOW_TABLE}").fetchone()[0] == 100
+
+        messages = []
+        copied = migrate_mashups(conn, batch_size=100, progress=messages.append)
+        assert copied == 150
+        assert any("rows/s" in m for m in messages)
+        assert conn.execute("SELECT COUNT(*) FROM mashups").fetchone()[0] == 250
+        assert conn.execute("SELECT notes FROM mashups WHERE left_id = 's250'").fetchone()[0] == "n250"
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        assert SHADOW_TABLE not in tables
+        assert conn.execute(f"SELECT COUNT(*) FROM {CHECKPOINT_TABLE}").fetchone()[0] == 0
+        conn.close()
+
+def test_ensure_schema_once_per_process():
+    """The second ensure_schema() call does not touch the database"""
+    with temp_db(schema=False) as path:
+        ensure_schema(path)
+    ensure_schema(path)  # cached; would recreate the file if it ran again
+    assert not os.path.exists(path)
+
+if __name__ == "__main__":
+    tests = [test_fresh_database, test_legacy_database_upgrade,
+             test_failed_step_rolls_back, test_batched_mashups_migration_resumes,
+             test_ensure_schema_once_per_process]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental playlist sync (playlist_sync.py)
+Run with: python test_playlist_sync.py
+"""
+
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+from db_migrations import migrate
+from playlist_sync import sync_playlists
+
+class FakeSpotify:
+    """Serves playlists from a dict: id -> (snapshot_id, [track ids])"""
+    def __init__(self, playlists):
+        self.playlists = playlists
+        self.item_calls = 0
+
+    def current_user_playlists(self, limit, offset):
+        ids = sorted(self.playlists)[offset:offset + limit]
+        return {
+            "items": [{"id": pid, "name": pid.upper(), "snapshot_id": self.playlists[pid][0],
+                       "tracks": {"total": len(self.playlists[pid][1])}} for pid in ids],
+            "next": "more" if offset + limit < len(self.playlists) else None,
+        }
+
+    def playlist_items(self, playlist_id, fields, limit, offset, additional_types):
+        self.item_calls += 1
+        tracks = self.playlists[playlist_id][1]
+        items = [{"track": {"id": t}} for t in tracks[offset:offset + limit]]
+        return {"items": items, "next": "more" if offset + limit < len(tracks) else None}
+
+def playlist_rows(conn, playlist_id):
+    return {r[0] for r in conn.execute("SELECT track_id FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))}
+
+def test_first_sync_then_unchanged_skips_track_pages():
+    """Unchanged snapshot_ids cost only the listing calls"""
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    sp = FakeSpotify({f"p{i}": ("s1", [f"t{i}-{j}" for j in range(150)]) for i in range(120)})
+    report = sync_playlists(sp, conn)
+    assert report["synced"] == 120 and report["tracks_added"] == 120 * 150
+    assert sp.item_calls == 120 * 2
+    assert playlist_rows(conn, "p7") == {f"t7-{j}" for j in range(150)}
+
+    sp.item_calls = 0
+    report = sync_playlists(sp, conn)
+    assert report["unchanged"] == 120 and report["synced"] == 0 and sp.item_calls == 0
+
+def test_changed_playlist_applies_only_the_diff():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    sp = FakeSpotify({"a": ("s1", ["x", "y", "z"]), "b": ("s1", ["q"])})
+    sync_playlists(sp, conn)
+    sp.playlists["a"] = ("s2", ["y", "z", "w"])
+    report = sync_playlists(sp, conn)
+    assert report["synced"] == 1 and report["unchanged"] == 1
+    assert report["tracks_added"] == 1 and report["tracks_removed"] == 1
+    assert playlist_rows(conn, "a") == {"y", "z", "w"}
+    assert conn.execute("SELECT snapshot_id FROM playlists WHERE playlist_id = 'a'").fetchone()[0] == "s2"
+
+if __name__ == "__main__":
+    for test in [test_first_sync_then_unchanged_skips_track_pages, test_changed_playlist_applies_only_the_diff]:
+        test()
+        print(f"✅ {test.__name__}")
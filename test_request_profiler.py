@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-request sampling profiler (request_profiler.py)
+Run with: python test_request_profiler.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+
+import request_profiler
+from request_profiler import SamplingProfiler, authorized, load
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+def test_samples_attribute_time_to_the_busy_function():
+    profiler = SamplingProfiler.start(interval=0.001)
+    busy_loop(0.2)
+    profiler.stop()
+    summary = profiler.summary()
+    assert summary["samples"] > 10 and summary["wall_ms"] >= 200
+    assert summary["cumulative"][0]["samples"] == summary["samples"]  # the test function itself
+    assert any(row["function"].startswith("busy_loop (") for row in summary["self"][:2])
+    line = profiler.folded().splitlines()[0]
+    assert "busy_loop (test_request_profiler.py:" in line and line.rsplit(" ", 1)[1].isdigit()
+
+def test_store_load_and_prune():
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = SamplingProfiler.start(interval=0.001)
+        busy_loop(0.02)
+        profiler.stop()
+        ids = [profiler.save(tmp, route="/x") for _ in range(request_profiler.MAX_STORED + 2)]
+        assert len([n for n in os.listdir(tmp) if n.endswith(".json")]) == request_profiler.MAX_STORED
+        assert json.loads(load(ids[-1], "json", tmp))["route"] == "/x"
+        assert load(ids[-1], "folded", tmp) == profiler.folded()
+        assert load("../../etc/passwd", "folded", tmp) is None and load(ids[-1], "exe", tmp) is None
+
+def test_authorization_needs_a_configured_secret():
+    os.environ.pop("MASHLAB_PROFILE_SECRET", None)
+    assert not authorized("anything") and not authorized(None)
+    os.environ["MASHLAB_PROFILE_SECRET"] = "p"
+    try:
+        assert authorized("p") and not authorized("q")
+    finally:
+        del os.environ["MASHLAB_PROFILE_SECRET"]
+
+def test_flask_profiles_only_requests_with_the_header():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ.setdefault("MASHLAB_DB_PATH", path)
+    os.environ.setdefault("PREVIEW_SHARED_SECRET", "s3cret")
+    import flask_app
+
+    client = flask_app.app.test_client()
+    headers = {"x-ml-preview-secret": flask_app.PREVIEW_SHARED_SECRET}
+    plain = client.post("/api/mashups/search", json={"seed": "a"}, headers=headers)
+    assert "X-ML-Profile-Id" not in plain.headers and "_profile" not in plain.get_json()
+    assert client.post("/api/mashups/search", json={"seed": "a"},
+                       headers={**headers, "x-ml-profile": "guess"}).status_code == 403
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MASHLAB_PROFILE_SECRET"] = "p"
+        os.environ["MASHLAB_PROFILE_DIR"] = tmp
+        try:
+            profiled = {**headers, "x-ml-profile": "p"}
+            res = client.post("/api/mashups/search", json={"seed": "a"}, headers=profiled)
+            body = res.get_json()
+            profile_id = res.headers["X-ML-Profile-Id"]
+            assert body["total"] == 5 and body["_profile"]["id"] == profile_id
+            res = client.post("/api/mashups/search", json={"seed": "a"},
+                              headers={**profiled, "x-ml-profile-output": "flamegraph"})
+            assert "_profile" not in res.get_json()
+            stored = client.get(f"/api/debug/profiles/{profile_id}?format=json", headers=profiled)
+            assert stored.status_code == 200 and stored.get_json()["route"] == "/api/mashups/search"
+            assert client.get(f"/api/debug/profiles/{profile_id}", headers=headers).status_code == 403
+        finally:
+            del os.environ["MASHLAB_PROFILE_SECRET"], os.environ["MASHLAB_PROFILE_DIR"]
+
+def test_flask_profiler_stops_when_the_request_fails():
+    """Teardown stops the sampler even when after_request never ran; saving is not timed"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ.setdefault("MASHLAB_DB_PATH", path)
+    os.environ.setdefault("PREVIEW_SHARED_SECRET", "s3cret")
+    import flask_app
+    from flask import g
+
+    hooks = flask_app.app.after_request_funcs[None]
+    assert hooks.index(flask_app.attach_profile) < hooks.index(flask_app.record_request)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MASHLAB_PROFILE_DIR"] = tmp
+        try:
+            with flask_app.app.test_request_context("/api/mashups/search", method="POST"):
+                profiler = g.profiler = SamplingProfiler.start()
+                flask_app.app.do_teardown_request(RuntimeError("boom"))
+            assert not profiler._thread.is_alive()
+            saved = [n for n in os.listdir(tmp) if n.endswith(".json")]
+            assert json.loads(load(saved[0][:-5], "json", tmp))["error"] == "RuntimeError"
+        finally:
+            del os.environ["MASHLAB_PROFILE_DIR"]
+
+if __name__ == "__main__":
+    for test in [test_samples_attribute_time_to_the_busy_function, test_store_load_and_prune,
+                 test_authorization_needs_a_configured_secret, test_flask_profiles_only_requests_with_the_header,
+                 test_flask_profiler_stops_when_the_request_fails]:
+        test()
+        print(f"✅ {test.__name__}")
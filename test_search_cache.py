@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared TTL/LRU search cache (search_cache.py, spotify_search.py)
+Run with: python test_search_cache.py
+"""
+
+import sys
+import threading
+import time
+
+sys.path.append('.')
+
+from search_cache import TTLCache
+from spotify_search import SEARCH_CACHE, normalize_query, search_tracks_cached
+
+def test_lru_bound_and_stats():
+    """Old keys are evicted and hit rate / size are reported"""
+    cache = TTLCache(maxsize=2, ttl=60, stale_ttl=60)
+    cache.get_or_load("a", lambda: [1])
+    cache.get_or_load("b", lambda: [2])
+    cache.get_or_load("a", lambda: [99])  # hit, and refreshes recency
+    cache.get_or_load("c", lambda: [3])   # evicts b
+    assert cache.get("b") is None and cache.get("a") == [1]
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["hit_rate"] == 0.25
+    assert stats["approx_bytes"] == len("[1]") + len("[3]")
+
+def test_stale_while_revalidate():
+    """A stale entry is returned immediately and refreshed in the background"""
+    cache = TTLCache(maxsize=10, ttl=0.01, stale_ttl=60)
+    cache.get_or_load("q", lambda: "v1")
+    time.sleep(0.02)
+    refreshed = threading.Event()
+
+    def slow_loader():
+        refreshed.wait(1)
+        return "v2"
+
+    started = time.perf_counter()
+    assert cache.get_or_load("q", slow_loader) == "v1"
+    assert time.perf_counter() - started < 0.5
+    refreshed.set()
+    for _ in range(100):
+        if cache.stats()["refreshes"] == 1:
+            break
+        time.sleep(0.01)
+    assert cache.stats()["refreshes"] == 1 and cache.stats()["stale_hits"] == 1
+    assert cache._data["q"].value == "v2"
+
+def test_search_key_is_normalized():
+    """Whitespace and case variants share one Spotify call"""
+    class Client:
+        calls = 0
+        def search(self, **kwargs):
+            Client.calls += 1
+            return {"tracks": {"items": [{"id": "x", "q": kwargs["q"]}]}}
+
+    SEARCH_CACHE.clear()
+    sp = Client()
+    assert normalize_query("  The  Weeknd ") == "the weeknd"
+    first = search_tracks_cached(sp, "The Weeknd", limit=5)
+    second = search_tracks_cached(sp, "  the   weeknd", limit=5)
+    assert first is second and Client.calls == 1
+    search_tracks_cached(sp, "the weeknd", limit=10)
+    assert Client.calls == 2
+
+def test_prefetch_warms_next_page_within_cap():
+    """Prefetch fills the cache and enriches ids, but respects the rate cap"""
+    import spotify_search
+
+    class Client:
+        def search(self, **kwargs):
+            return {"tracks": {"items": [{"id": f"t{kwargs['offset']}"}]}}
+
+    SEARCH_CACHE.clear()
+    enriched = []
+    done = threading.Event()
+
+    def enrich(ids):
+        enriched.extend(ids)
+        done.set()
+
+    assert spotify_search.prefetch_next_page(Client(), "daft punk", 20, 20, enrich=enrich)
+    assert done.wait(2)
+    assert enriched == ["t20"]
+    assert SEARCH_CACHE.get(("daft punk", "US", 20, 20)) == [{"id": "t20"}]
+    assert not spotify_search.prefetch_next_page(Client(), "daft punk", 20, 20)  # already cached
+    assert not spotify_search.prefetch_next_page(Client(), "daft punk", 20, 10_000)  # too deep
+
+    saved = list(spotify_search._prefetch_times)
+    spotify_search._prefetch_times[:] = [time.monotonic()] * spotify_search.PREFETCH_MAX_PER_MINUTE
+    try:
+        assert not spotify_search.prefetch_next_page(Client(), "other", 20, 20)
+    finally:
+        spotify_search._prefetch_times[:] = saved
+
+if __name__ == "__main__":
+    for test in [test_lru_bound_and_stats, test_stale_while_revalidate, test_search_key_is_normalized,
+                 test_prefetch_warms_next_page_within_cap]:
+        test()
+        print(f"✅ {test.__name__}")
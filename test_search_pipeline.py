@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for concurrent search enrichment (search_pipeline.py, bpm_cache.py)
+Run with: python test_search_pipeline.py
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.append('.')
+
+from bpm_cache import load_cached_bpms, parse_bpm, store_bpms
+from db_migrations import migrate
+from search_pipeline import fan_out
+
+def test_fan_out_yields_in_completion_order():
+    """Fast tasks are yielded before slow ones, errors are reported per task"""
+    release = threading.Event()
+
+    def slow():
+        release.wait(2)
+        return "slow"
+
+    def broken():
+        raise ValueError("boom")
+
+    results = []
+    for name, result, error in fan_out({"slow": slow, "fast": lambda: "fast", "broken": broken}, timeout=5):
+        results.append((name, result, type(error).__name__ if error else None))
+        if len(results) == 2:
+            release.set()
+    assert sorted(results[:2]) == [("broken", None, "ValueError"), ("fast", "fast", None)]
+    assert results[2] == ("slow", "slow", None)
+
+def test_fan_out_total_time_is_the_slowest_call():
+    """Calls overlap instead of running one after another"""
+    started = time.perf_counter()
+    list(fan_out({i: (lambda: time.sleep(0.2)) for i in range(5)}))
+    assert time.perf_counter() - started < 0.6
+
+def test_fan_out_runs_a_full_search_page_in_one_round():
+    """26 enrichments (25 BPM lookups + features) cost one call, not several rounds"""
+    started = time.perf_counter()
+    results = list(fan_out({i: (lambda: time.sleep(0.2)) for i in range(26)}, timeout=5))
+    assert len(results) == 26 and not any(error for _name, _result, error in results)
+    assert time.perf_counter() - started < 0.35
+
+def test_fan_out_timeout():
+    """Tasks still running at the deadline come back as TimeoutError"""
+    release = threading.Event()
+    results = list(fan_out({"hang": lambda: release.wait(2), "ok": lambda: 1}, timeout=0.2))
+    release.set()
+    assert results[0] == ("ok", 1, None)
+    assert results[1][0] == "hang" and isinstance(results[1][2], TimeoutError)
+
+def test_fan_out_cancels_queued_tasks_at_the_timeout():
+    """Work still queued at the deadline is dropped instead of holding a worker later"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    release = threading.Event()
+    ran = []
+    pool = ThreadPoolExecutor(max_workers=1)
+    results = list(fan_out({"hang": lambda: release.wait(2), "queued": lambda: ran.append(1)},
+                           timeout=0.1, pool=pool))
+    release.set()
+    pool.shutdown(wait=True)
+    assert {name for name, _result, error in results if isinstance(error, TimeoutError)} == {"hang", "queued"}
+    assert ran == []
+
+def test_bpm_cache_hits_and_miss_window():
+    """Known BPMs are always hits; "no BPM" answers expire after the retry window"""
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    store_bpms(conn, {"a": parse_bpm("128"), "b": parse_bpm("-")})
+    assert load_cached_bpms(conn, ["a", "b", "c"]) == {"a": 128.0, "b": None}
+    conn.execute("UPDATE simple_bpm_cache SET created_at = datetime('now', '-30 days')")
+    assert load_cached_bpms(conn, ["a", "b"]) == {"a": 128.0}
+
+if __name__ == "__main__":
+    for test in [test_fan_out_yields_in_completion_order, test_fan_out_total_time_is_the_slowest_call,
+                 test_fan_out_runs_a_full_search_page_in_one_round, test_fan_out_timeout, test_fan_out_cancels_queued_tasks_at_the_timeout,
+                 test_bpm_cache_hits_and_miss_window]:
+        test()
+        print(f"✅ {test.__name__}")
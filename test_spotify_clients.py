@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared Spotify client layer in spotify_clients.py (no network)
+Run with: python test_spotify_clients.py
+"""
+
+import sys
+
+sys.path.append('.')
+
+import spotify_clients
+from spotify_clients import drop_user_client, get_app_client, get_user_client, http_session
+
+def test_app_client_is_shared():
+    """Every caller gets the same client and the same pooled session"""
+    a = get_app_client("cid", "secret")
+    b = get_app_client("cid", "secret")
+    assert a is b
+    assert a._session is http_session()
+    assert a.auth_manager._session is http_session()
+
+def test_user_clients_per_session():
+    """A session's client is reused until its token changes"""
+    first = get_user_client("session-1", "token-a")
+    assert get_user_client("session-1", "token-a") is first
+    assert get_user_client("session-2", "token-a") is not first
+    refreshed = get_user_client("session-1", "token-b")
+    assert refreshed is not first and refreshed._auth == "token-b"
+    assert get_user_client("session-1", None) is None
+    assert "session-1" not in spotify_clients._user_clients
+    drop_user_client("session-2")
+
+def test_only_idempotent_requests_are_retried():
+    retry = http_session().get_adapter("https://api.spotify.com").max_retries
+    assert retry.is_retry("GET", 503) and not retry.is_retry("POST", 503)
+
+if __name__ == "__main__":
+    for test in [test_app_client_is_shared, test_user_clients_per_session, test_only_idempotent_requests_are_retried]:
+        test()
+        print(f"✅ {test.__name__}")
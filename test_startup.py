@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for start-up helpers and deferred imports (startup.py)
+Run with: python test_startup.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.append('.')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _run(code, **env):
+    result = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True,
+                            env={**os.environ, **env}, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result
+
+def test_bpm_cli_imports_no_http_or_spotify_stack():
+    out = _run(
+        "import sys; import bpm_api_resolver as b; b.BPMApiResolver();"
+        "print(sorted(m for m in ('requests', 'spotipy', 'numpy', 'pandas') if m in sys.modules))",
+        SPOTIFY_CLIENT_ID="id", SPOTIFY_CLIENT_SECRET="secret", GETSONGBPM_API_KEY="key").stdout
+    assert out.strip() == "[]"
+
+def test_flask_app_defers_spotipy_and_requests():
+    with tempfile.TemporaryDirectory() as tmp:
+        out = _run("import sys, flask_app; print('spotipy' in sys.modules, 'requests' in sys.modules)",
+                   MASHLAB_DB_PATH=os.path.join(tmp, "lib.db")).stdout
+    assert out.strip() == "False False"
+
+def test_flask_app_import_builds_nothing():
+    """Local modules, the write queue and the thumbnail cache wait for first use"""
+    local = ("metrics", "album_art", "artist_genres", "federated_search", "library_export",
+             "request_profiler", "spotify_clients", "write_queue")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = _run(f"import sys, flask_app; print([m for m in {local!r} if m in sys.modules],"
+                   "flask_app._write_queue, flask_app._thumbnails)",
+                   MASHLAB_DB_PATH=os.path.join(tmp, "lib.db"), MASHLAB_THUMB_CACHE=os.path.join(tmp, "thumbs")).stdout
+    assert out.strip() == "[] None None"
+
+def test_override_load_still_happens_after_a_plain_load():
+    import dotenv
+    import startup
+
+    calls = []
+    saved = dotenv.load_dotenv, startup._env_loaded, startup._env_overridden
+    dotenv.load_dotenv = lambda override=False: calls.append(override)
+    startup._env_loaded = startup._env_overridden = False
+    try:
+        startup.load_env()
+        startup.load_env()
+        startup.load_env(override=True)
+        startup.load_env(override=True)
+        startup.load_env()
+        assert calls == [False, True]
+    finally:
+        dotenv.load_dotenv, startup._env_loaded, startup._env_overridden = saved
+
+def test_profile_reports_local_modules_and_spans():
+    err = _run("from startup import profile_startup, span\n"
+               "profile_startup()\n"
+               "with span('warm-up'):\n"
+               "    import track_keys\n",
+               MASHLAB_PROFILE_STARTUP="1").stderr
+    assert "startup profile:" in err and "track_keys" in err and "[warm-up]" in err
+
+def test_profiling_is_off_by_default():
+    out = _run("import sys, startup; print(startup.profile_startup(), len(sys.meta_path))",
+               MASHLAB_PROFILE_STARTUP="").stdout.split()
+    assert out[0] == "False"
+
+if __name__ == "__main__":
+    for test in [test_bpm_cli_imports_no_http_or_spotify_stack, test_flask_app_defers_spotipy_and_requests,
+                 test_flask_app_import_builds_nothing, test_override_load_still_happens_after_a_plain_load,
+                 test_profile_reports_local_modules_and_spans, test_profiling_is_off_by_default]:
+        test()
+        print(f"✅ {test.__name__}")
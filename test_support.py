@@ -0,0 +1,22 @@
+"""
+Helpers shared by the test_*.py scripts; holds no tests itself.
+"""
+import contextlib
+import os
+import tempfile
+from typing import Iterator
+
+@contextlib.contextmanager
+def temp_db(schema: bool = True) -> Iterator[str]:
+    """
+    Path to a new SQLite file, migrated to the current schema unless
+    schema=False. The file and any -wal/-shm/-journal files next to it are
+    removed afterwards, even if the test fails.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "test.db")
+        if schema:
+            from db_migrations import ensure_schema
+
+            ensure_schema(path)
+        yield path
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for proactive Spotify token refresh (token_manager.py)
+Run with: python test_token_manager.py
+"""
+
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append('.')
+
+import token_manager
+from token_manager import EncryptedTokenStore, TokenManager
+
+class Refresher:
+    def __init__(self, delay=0.0, expires_in=3600):
+        self.calls = 0
+        self.delay = delay
+        self.expires_in = expires_in
+
+    def __call__(self, refresh_token):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"access_token": f"access-{self.calls}", "expires_in": self.expires_in}
+
+def test_refreshes_ahead_of_expiry_in_background():
+    """The timer refreshes before expiry and keeps the refresh token"""
+    refresher = Refresher()
+    manager = TokenManager(refresher, refresh_margin=3599.8)
+    sid = manager.login({"access_token": "initial", "refresh_token": "r", "expires_in": 3600})
+    assert manager.get_access_token(sid) == "initial"
+    for _ in range(100):
+        if refresher.calls:
+            break
+        time.sleep(0.01)
+    assert manager.get_access_token(sid) == "access-1"
+    assert manager._tokens[sid]["refresh_token"] == "r"
+    manager.logout(sid)
+    assert manager.get_access_token(sid) is None
+
+def test_concurrent_expired_reads_refresh_once():
+    """Many reruns hitting an expired token share one refresh"""
+    refresher = Refresher(delay=0.1)
+    manager = TokenManager(refresher, refresh_margin=60)
+    sid = manager.login({"access_token": "old", "refresh_token": "r", "expires_at": time.time() + 3600})
+    manager._timers[sid].cancel()
+    manager._tokens[sid]["expires_at"] = time.time() - 1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_access_token(sid))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert refresher.calls == 1 and results == ["access-1"] * 8
+
+def test_failed_refresh_of_expired_token_signs_out():
+    def broken(refresh_token):
+        raise RuntimeError("invalid_grant")
+
+    manager = TokenManager(broken)
+    sid = manager.login({"access_token": "old", "refresh_token": "r", "expires_at": time.time() - 1})
+    assert manager.get_access_token(sid) is None
+
+def test_encrypted_store_survives_restart():
+    """Tokens are reloaded by a new manager and never stored in plain text"""
+    import pytest
+    fernet = pytest.importorskip("cryptography.fernet")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EncryptedTokenStore(f"{tmp}/tokens.enc", fernet.Fernet.generate_key())
+        sid = TokenManager(Refresher(), store).login({"access_token": "secret-token", "refresh_token": "r"})
+        with open(store.path, "rb") as f:
+            assert b"secret-token" not in f.read()
+        assert TokenManager(Refresher(), store).get_access_token(sid) == "secret-token"
+
+def test_store_without_key_is_memory_only():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EncryptedTokenStore(f"{tmp}/tokens.enc", None)
+        TokenManager(Refresher(), store).login({"access_token": "a", "refresh_token": "r"})
+        assert not store.persistent and store.load() == {}
+
+def test_idle_session_is_dropped_instead_of_refreshed():
+    """An abandoned session's timer signs it out rather than refreshing forever"""
+    refresher = Refresher()
+    manager = TokenManager(refresher, idle_timeout=60)
+    sid = manager.login({"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    manager._timers[sid].cancel()
+    manager._tokens[sid]["last_used"] = time.time() - 120
+    manager._background_refresh(sid)
+    assert refresher.calls == 0 and sid not in manager._tokens and sid not in manager._timers
+
+def test_least_recently_used_session_is_evicted():
+    manager = TokenManager(Refresher(), max_sessions=2)
+    first = manager.login({"access_token": "1", "refresh_token": "r"})
+    second = manager.login({"access_token": "2", "refresh_token": "r"})
+    manager._tokens[second]["last_used"] = 0
+    manager.get_access_token(first)
+    manager.login({"access_token": "3", "refresh_token": "r"})
+    assert manager.get_access_token(second) is None and manager.get_access_token(first) == "1"
+
+def test_logout_drops_the_cached_spotify_client():
+    import spotify_clients
+
+    manager = TokenManager(Refresher())
+    sid = manager.login({"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    client = spotify_clients.get_user_client(sid, manager.get_access_token(sid))
+    assert spotify_clients.get_user_client(sid, "a") is client
+    manager.logout(sid)
+    assert sid not in spotify_clients._user_clients
+
+def test_key_file_created_by_another_process_is_reused():
+    import pytest
+    pytest.importorskip("cryptography.fernet")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/token.key"
+        with open(path, "wb") as f:
+            f.write(b"existing-key\n")
+        assert token_manager._load_or_create_key(path) == b"existing-key"
+
+if __name__ == "__main__":
+    for test in [test_refreshes_ahead_of_expiry_in_background, test_concurrent_expired_reads_refresh_once,
+                 test_failed_refresh_of_expired_token_signs_out, test_encrypted_store_survives_restart,
+                 test_store_without_key_is_memory_only, test_idle_session_is_dropped_instead_of_refreshed,
+                 test_least_recently_used_session_is_evicted, test_logout_drops_the_cached_spotify_client,
+                 test_key_file_created_by_another_process_is_reused]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for timing spans and the JSONL trace log (tracing.py)
+Run with: python test_tracing.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append('.')
+
+from search_pipeline import fan_out
+from tracing import TRACE_FILE_ENV, span, start_trace, traced
+
+@traced()
+def lookup(x):
+    with span("db.query", rows=x):
+        return x * 2
+
+def test_spans_nest_and_are_free_outside_a_trace():
+    assert lookup(2) == 4  # no active trace: plain call
+    with start_trace("rerun", page="test") as trace:
+        lookup(1)
+        with span("html"):
+            pass
+    tree = trace.to_dict()
+    assert tree["name"] == "rerun" and tree["attrs"] == {"page": "test"}
+    assert [c["name"] for c in tree["children"]] == ["lookup", "html"]
+    query = tree["children"][0]["children"][0]
+    assert query["name"] == "db.query" and query["attrs"] == {"rows": 1}
+    assert trace.lines()[1].endswith("  lookup")
+
+def test_errors_are_recorded_and_fan_out_workers_nest():
+    with start_trace("rerun") as trace:
+        try:
+            with span("boom"):
+                raise ValueError("x")
+        except ValueError:
+            pass
+        with span("enrich"):
+            results = list(fan_out({i: traced("task")(lambda i=i: lookup(i)) for i in range(3)}, timeout=5))
+    assert sorted(r for _, r, _ in results) == [0, 2, 4]
+    boom, enrich = trace.root.children
+    assert boom.error == "ValueError"
+    assert [c.name for c in enrich.children] == ["task"] * 3
+    assert all(c.children[0].name == "lookup" for c in enrich.children)
+
+def test_traces_append_to_rotating_jsonl():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.jsonl")
+        os.environ[TRACE_FILE_ENV] = path
+        try:
+            for i in range(3):
+                with start_trace("rerun", n=i):
+                    lookup(i)
+        finally:
+            del os.environ[TRACE_FILE_ENV]
+        with start_trace("not-logged"):
+            pass
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["attrs"]["n"] for line in lines] == [0, 1, 2]
+        assert lines[0]["children"][0]["name"] == "lookup" and "ts" in lines[0]
+
+if __name__ == "__main__":
+    for test in [test_spans_nest_and_are_free_outside_a_trace, test_errors_are_recorded_and_fan_out_workers_nest,
+                 test_traces_append_to_rotating_jsonl]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the struct-of-arrays TrackStore (track_store.py)
+Run with: python test_track_store.py
+"""
+
+import sys
+
+import numpy as np
+
+sys.path.append('.')
+
+from compat import rank_library_partners
+from track_store import TrackStore
+
+ROWS = [
+    {"track_id": "a", "title": "A", "artist": "Daft Punk", "bpm": 120.0, "key_int": 0, "mode_int": 1, "energy": 0.8},
+    {"track_id": "b", "title": "B", "artist": "Daft Punk", "bpm": None, "key_int": None, "mode_int": None, "energy": None},
+    {"track_id": "c", "title": "C", "artist": "Justice", "bpm": 121.0, "key_int": 7, "mode_int": 1, "energy": 0.7},
+]
+
+def test_row_views_round_trip_and_write_through():
+    store = TrackStore.from_rows(ROWS)
+    assert store.to_dicts() == ROWS
+    assert store.columns["bpm"].dtype == np.float64 and store.columns["key_int"].dtype == np.int8
+    row = store.row("b")
+    assert row["bpm"] is None and row.get("missing_column", "x") == "x"
+    row["bpm"] = 99.5
+    row["key_int"] = 4
+    assert store.columns["bpm"][1] == 99.5 and store[1]["key_int"] == 4
+
+def test_strings_are_interned():
+    store = TrackStore.from_rows(ROWS)
+    artists = store.columns["artist"]
+    assert artists[0] is artists[1]
+
+def test_slices_share_memory():
+    store = TrackStore.from_rows(ROWS)
+    head = store[:2]
+    assert len(head) == 2 and np.shares_memory(head.columns["bpm"], store.columns["bpm"])
+    head[0]["bpm"] = 125.0
+    assert store[0]["bpm"] == 125.0
+    assert [r["track_id"] for r in store[np.array([2, 0])]] == ["c", "a"]
+
+def test_compat_reads_row_views():
+    store = TrackStore.from_rows(ROWS)
+    ranked = rank_library_partners(store, "a", limit=None)
+    assert [track_id for track_id, _, _ in ranked] == ["c", "b"]
+
+if __name__ == "__main__":
+    for test in [test_row_views_round_trip_and_write_through, test_strings_are_interned, test_slices_share_memory,
+                 test_compat_reads_row_views]:
+        test()
+        print(f"✅ {test.__name__}")
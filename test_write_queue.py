@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-behind queue in write_queue.py and its Flask wiring
+Run with: python test_write_queue.py
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+
+sys.path.append('.')
+
+from test_support import temp_db
+from write_queue import WriteBehindQueue
+
+def test_concurrent_writers_are_batched():
+    """Many threads enqueue at once; everything lands in a few transactions"""
+    with temp_db() as path:
+        wq = WriteBehindQueue(path)
+
+        def writer(n):
+            for i in range(50):
+                wq.enqueue("INSERT INTO user_overrides (spotify_id, bpm) VALUES (?, ?)", (f"{n}-{i}", 120.0))
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert wq.flush(timeout=10)
+
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM user_overrides").fetchone()[0] == 400
+        conn.close()
+        stats = wq.stats()
+        assert stats["committed"] == 400 and stats["failed"] == 0 and stats["depth"] == 0
+        assert stats["batches"] < 400
+        wq.close()
+
+def test_bad_mutation_does_not_sink_batch():
+    """A failing statement is isolated and counted; its neighbours still commit"""
+    with temp_db() as path:
+        wq = WriteBehindQueue(path)
+        ok = wq.enqueue("INSERT INTO user_overrides (spotify_id) VALUES (?)", ("ok-1",))
+        bad = wq.enqueue("INSERT INTO no_such_table VALUES (?)", (1,))
+        wq.enqueue("INSERT INTO user_overrides (spotify_id) VALUES (?)", ("ok-2",))
+        assert wq.flush(timeout=10)
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM user_overrides").fetchone()[0] == 2
+        conn.close()
+        assert wq.stats()["failed"] == 1
+        assert "no_such_table" in wq.failed(bad) and wq.failed(ok) is None
+        wq.close()
+
+def test_failed_batch_is_bisected_in_one_transaction():
+    """One bad row in 500 is isolated under savepoints; the rest commit once"""
+    with temp_db() as path:
+        wq = WriteBehindQueue(path)
+        insert = "INSERT INTO user_overrides (spotify_id, bpm) VALUES (?, ?)"
+        batch = [(i, insert, (f"id-{i}", 120.0)) for i in range(1, 501)]
+        batch[321] = (322, insert, ("id-1", 120.0))  # duplicate primary key
+        conn = sqlite3.connect(path, isolation_level=None)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        wq._commit(conn, batch)
+        assert statements.count("COMMIT") == 1
+        assert sum(s.startswith("SAVEPOINT") for s in statements) <= 2 * 9 + 1
+        assert list(wq._failed) == [322] and wq.stats()["committed"] == 499
+        assert conn.execute("SELECT COUNT(*) FROM user_overrides").fetchone()[0] == 499
+        conn.close()
+
+def test_locked_database_does_not_kill_the_writer():
+    """A batch whose BEGIN times out is reported failed and the writer keeps going"""
+    with temp_db() as path:
+        wq = WriteBehindQueue(path, timeout=0.05)
+        blocker = sqlite3.connect(path, isolation_level=None)
+        blocker.execute("BEGIN EXCLUSIVE")
+        seq = wq.enqueue("INSERT INTO user_overrides (spotify_id) VALUES (?)", ("locked",))
+        assert wq.flush(timeout=10) and "locked" in wq.failed(seq)
+        blocker.execute("ROLLBACK")
+        blocker.close()
+        seq = wq.enqueue("INSERT INTO user_overrides (spotify_id) VALUES (?)", ("later",))
+        assert wq.flush(timeout=10) and wq.failed(seq) is None
+        wq.close()
+
+def test_flask_override_read_your_writes():
+    """POST with wait=true returns only after the override is committed"""
+    with temp_db() as path:
+        os.environ.setdefault("PREVIEW_SHARED_SECRET", "s3cret")
+        import flask_app
+
+        # The queue is built on first use from DB_PATH; swap both for this test
+        saved = flask_app.DB_PATH, flask_app._write_queue
+        flask_app.DB_PATH, flask_app._write_queue = path, WriteBehindQueue(path)
+        try:
+            client = flask_app.app.test_client()
+            headers = {"x-ml-preview-secret": flask_app.PREVIEW_SHARED_SECRET}
+            res = client.post("/api/qc/override", json={"spotifyId": "abc", "bpm": 100, "wait": True}, headers=headers)
+            assert res.status_code == 200 and res.get_json()["committed"]
+            conn = sqlite3.connect(path)
+            assert conn.execute("SELECT bpm FROM user_overrides WHERE spotify_id = 'abc'").fetchone()[0] == 100
+            conn.execute("CREATE TRIGGER reject BEFORE INSERT ON mashups BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+            conn.commit()
+            conn.close()
+
+            res = client.post("/api/mashups/save", json={"seedId": "a", "partnerId": "b"}, headers=headers)
+            assert res.status_code == 202
+            res = client.post("/api/mashups/save", json={"seedId": "a", "partnerId": "c", "wait": True}, headers=headers)
+            assert res.status_code == 500 and res.get_json()["committed"] is False
+            assert "write_queue" in client.get("/healthz").get_json()
+        finally:
+            flask_app._write_queue.close()
+            flask_app.DB_PATH, flask_app._write_queue = saved
+
+if __name__ == "__main__":
+    for test in [test_concurrent_writers_are_batched, test_bad_mutation_does_not_sink_batch,
+                 test_failed_batch_is_bisected_in_one_transaction,
+                 test_locked_database_does_not_kill_the_writer, test_flask_override_read_your_writes]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,265 @@
+"""
+Spotify user tokens, refreshed ahead of expiry and kept across restarts.
+
+Each login gets an opaque session id (sid). The TokenManager keeps the
+token for every sid in memory and schedules a background refresh
+`refresh_margin` seconds before it expires, so a Streamlit rerun never
+waits on the token endpoint. Refreshes are serialized by a lock and
+double-checked, so concurrent reruns near the boundary trigger one refresh.
+
+A session unused for `idle_timeout` seconds (MASHLAB_SESSION_IDLE_SECONDS,
+default 14 days) is signed out when its next refresh comes due, which also
+stops its timer; past MAX_SESSIONS the least recently used one is dropped.
+Every sign-out also drops the session's cached Spotify client
+(spotify_clients), so a dropped token cannot be used through it.
+
+Tokens are persisted with EncryptedTokenStore (Fernet, from the optional
+`cryptography` package). Without it, or without a key, tokens stay in
+memory only; they are never written to disk in plain text.
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from spotify_clients import drop_user_client
+from tracing import start_trace, traced
+
+log = logging.getLogger(__name__)
+
+Token = Dict[str, Any]
+
+REFRESH_MARGIN = 300      # refresh five minutes before expiry
+RETRY_DELAY = 30          # after a failed background refresh
+EXPIRY_SLACK = 30         # a token this close to expiry is refreshed inline
+IDLE_TIMEOUT = 14 * 24 * 3600
+MAX_SESSIONS = 1000
+
+class EncryptedTokenStore:
+    """All tokens in one Fernet-encrypted JSON file, rewritten atomically."""
+
+    def __init__(self, path: str, key: Optional[bytes]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fernet = None
+        if key is None:
+            return
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            log.warning("cryptography is not installed; Spotify tokens will not survive a restart")
+            return
+        self._fernet = Fernet(key)
+
+    @classmethod
+    def from_env(cls) -> "EncryptedTokenStore":
+        """
+        MASHLAB_TOKEN_STORE is the file, MASHLAB_TOKEN_KEY the Fernet key. If
+        no key is set, one is generated once into MASHLAB_TOKEN_KEY_FILE.
+        """
+        path = os.getenv("MASHLAB_TOKEN_STORE", ".mashlab_tokens.enc")
+        key = os.getenv("MASHLAB_TOKEN_KEY")
+        if key:
+            return cls(path, key.encode())
+        return cls(path, _load_or_create_key(os.getenv("MASHLAB_TOKEN_KEY_FILE", ".mashlab_token.key")))
+
+    @property
+    def persistent(self) -> bool:
+        return self._fernet is not None
+
+    def load(self) -> Dict[str, Token]:
+        if not self.persistent or not os.path.exists(self.path):
+            return {}
+        from cryptography.fernet import InvalidToken
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(self._fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError) as e:
+            log.warning("ignoring unreadable token store %s: %s", self.path, e)
+            return {}
+
+    def save(self, tokens: Dict[str, Token]) -> None:
+        if not self.persistent:
+            return
+        data = self._fernet.encrypt(json.dumps(tokens).encode())
+        tmp = f"{self.path}.tmp"
+        with self._lock:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+
+def _load_or_create_key(path: str) -> Optional[bytes]:
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        return None
+    key = Fernet.generate_key()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _read_key(path)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+def _read_key(path: str, attempts: int = 50) -> bytes:
+    """An existing key file; waits briefly if another process is still writing it."""
+    for _ in range(attempts):
+        with open(path, "rb") as f:
+            key = f.read().strip()
+        if key:
+            return key
+        time.sleep(0.02)
+    raise RuntimeError(f"token key file {path} is empty")
+
+class TokenManager:
+    def __init__(self, refresher: Callable[[str], Token], store: Optional[EncryptedTokenStore] = None,
+                 refresh_margin: float = REFRESH_MARGIN, idle_timeout: Optional[float] = None,
+                 max_sessions: int = MAX_SESSIONS):
+        self._refresher = refresher
+        self._store = store
+        self.refresh_margin = refresh_margin
+        self.idle_timeout = idle_timeout or float(os.getenv("MASHLAB_SESSION_IDLE_SECONDS", IDLE_TIMEOUT))
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()           # guards _tokens and _timers
+        self._refresh_lock = threading.Lock()   # one refresh at a time
+        self._tokens: Dict[str, Token] = store.load() if store else {}
+        self._timers: Dict[str, threading.Timer] = {}
+        self.refreshes = 0
+        for token in self._tokens.values():
+            token.setdefault("last_used", time.time())  # stores written before idle expiry
+        for sid in list(self._tokens):
+            if self._idle(self._tokens[sid]):
+                self.logout(sid)
+            else:
+                self._schedule(sid)
+
+    def login(self, token: Token) -> str:
+        """Register a freshly issued token and return its new session id."""
+        sid = secrets.token_urlsafe(24)
+        token = _with_expires_at(token)
+        token["last_used"] = time.time()
+        self._put(sid, token)
+        self._evict_oldest()
+        return sid
+
+    def get_access_token(self, sid: Optional[str]) -> Optional[str]:
+        """
+        Current access token for sid. Normally already refreshed in the
+        background; refreshed inline only if it is about to expire.
+        """
+        if not sid:
+            return None
+        with self._lock:
+            token = self._tokens.get(sid)
+            if token is not None:
+                token["last_used"] = time.time()
+        if token is None:
+            return None
+        if time.time() < token.get("expires_at", 0) - EXPIRY_SLACK:
+            return token["access_token"]
+        token = self._refresh(sid)
+        return token["access_token"] if token else None
+
+    def logout(self, sid: Optional[str]) -> None:
+        if not sid:
+            return
+        with self._lock:
+            self._tokens.pop(sid, None)
+            timer = self._timers.pop(sid, None)
+            snapshot = dict(self._tokens)
+        if timer:
+            timer.cancel()
+        drop_user_client(sid)
+        self._save(snapshot)
+
+    def _idle(self, token: Token) -> bool:
+        return time.time() - token.get("last_used", 0) > self.idle_timeout
+
+    def _evict_oldest(self) -> None:
+        with self._lock:
+            excess = len(self._tokens) - self.max_sessions
+            oldest = sorted(self._tokens, key=lambda s: self._tokens[s].get("last_used", 0))[:max(0, excess)]
+        for sid in oldest:
+            self.logout(sid)
+
+    def _put(self, sid: str, token: Token) -> None:
+        with self._lock:
+            self._tokens[sid] = token
+            snapshot = dict(self._tokens)
+        self._save(snapshot)
+        self._schedule(sid)
+
+    def _save(self, snapshot: Dict[str, Token]) -> None:
+        if self._store:
+            try:
+                self._store.save(snapshot)
+            except OSError as e:
+                log.warning("could not persist Spotify tokens: %s", e)
+
+    def _schedule(self, sid: str, delay: Optional[float] = None) -> None:
+        with self._lock:
+            token = self._tokens.get(sid)
+            if token is None:
+                return
+            if delay is None:
+                delay = max(0.0, token.get("expires_at", 0) - self.refresh_margin - time.time())
+            old = self._timers.get(sid)
+            timer = threading.Timer(delay, self._background_refresh, args=(sid,))
+            timer.daemon = True
+            self._timers[sid] = timer
+        if old:
+            old.cancel()
+        timer.start()
+
+    def _background_refresh(self, sid: str) -> None:
+        with self._lock:
+            token = self._tokens.get(sid)
+        if token is not None and self._idle(token):
+            self.logout(sid)  # abandoned: drop it instead of refreshing forever
+            return
+        with start_trace("token_timer"):
+            self._refresh(sid)
+
+    @traced("token_refresh")
+    def _refresh(self, sid: str) -> Optional[Token]:
+        """Refresh sid's token unless another thread already did."""
+        with self._refresh_lock:
+            with self._lock:
+                token = self._tokens.get(sid)
+            if token is None:
+                return None
+            if time.time() < token.get("expires_at", 0) - self.refresh_margin:
+                # Already refreshed by another thread, or a timer fired early
+                self._schedule(sid)
+                return token
+            if "refresh_token" not in token:
+                self.logout(sid)
+                return None
+            try:
+                new_token = _with_expires_at(self._refresher(token["refresh_token"]))
+            except Exception as e:
+                if time.time() >= token.get("expires_at", 0):
+                    log.warning("Spotify token refresh failed, signing out: %s", e)
+                    self.logout(sid)
+                    return None
+                log.warning("Spotify token refresh failed, retrying in %ss: %s", RETRY_DELAY, e)
+                self._schedule(sid, RETRY_DELAY)
+                return token
+            # Spotify may omit the refresh token when it is unchanged
+            new_token.setdefault("refresh_token", token["refresh_token"])
+            new_token["last_used"] = token.get("last_used", 0)
+            self.refreshes += 1
+            self._put(sid, new_token)
+            return new_token
+
+def _with_expires_at(token: Token) -> Token:
+    token = dict(token)
+    if "expires_at" not in token:
+        token["expires_at"] = time.time() + float(token.get("expires_in", 3600))
+    return token
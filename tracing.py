@@ -0,0 +1,159 @@
+"""
+Lightweight timing spans for the Streamlit app.
+
+A trace is a tree of named spans recorded for one unit of work (one
+Streamlit rerun, one background token refresh). span() and @traced attach
+to whichever trace is active in the current context, so they cost a
+single ContextVar lookup when nothing is being traced. search_pipeline
+copies the context into its workers, so spans opened there nest under the
+span that started the fan-out.
+
+start_trace() hands the finished Trace back to the caller (the app shows
+it in its debug panel) and, when MASHLAB_TRACE_FILE is set, appends it to
+that file as one JSON line, rotating at MASHLAB_TRACE_MAX_BYTES (default
+5 MB) with 3 backups.
+"""
+from __future__ import annotations
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_FILE_ENV = "MASHLAB_TRACE_FILE"
+TRACE_BACKUPS = 3
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "error")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+
+    @property
+    def ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        d: Dict[str, Any] = {"name": self.name, "at_ms": round((self.start - origin) * 1000, 2),
+                             "ms": round(self.ms, 2)}
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.error:
+            d["error"] = self.error
+        if self.children:
+            d["children"] = [c.to_dict(origin) for c in self.children]
+        return d
+
+class Trace:
+    def __init__(self, name: str, **attrs: Any):
+        self.root = Span(name, attrs)
+        self.wall_time = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"ts": round(self.wall_time, 3), **self.root.to_dict(self.root.start)}
+
+    def lines(self, min_ms: float = 0.0) -> List[str]:
+        """The span tree as indented text, e.g. for st.code()."""
+        out: List[str] = []
+
+        def walk(span: Span, depth: int) -> None:
+            if depth and span.ms < min_ms:
+                return
+            attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+            flag = f" !{span.error}" if span.error else ""
+            out.append(f"{span.ms:8.1f} ms  {'  ' * depth}{span.name}{' ' + attrs if attrs else ''}{flag}")
+            for child in span.children:
+                walk(child, depth + 1)
+
+        walk(self.root, 0)
+        return out
+
+_current: ContextVar[Optional[Span]] = ContextVar("mashlab_span", default=None)
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the active span; does nothing outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator form of span(), named after the function by default."""
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    """Record a new trace for the block, then keep and log it."""
+    trace = Trace(name, **attrs)
+    token = _current.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = type(e).__name__
+        raise
+    finally:
+        trace.root.end = time.perf_counter()
+        _current.reset(token)
+        _write(trace)
+
+_log_lock = threading.Lock()
+_trace_handler: Optional[RotatingFileHandler] = None
+_trace_log = logging.getLogger("mashlab.trace")
+_trace_log.propagate = False
+_trace_log.setLevel(logging.INFO)
+
+def _trace_logger() -> Optional[logging.Logger]:
+    """The JSONL trace logger, (re)opened whenever MASHLAB_TRACE_FILE changes."""
+    global _trace_handler
+    path = os.getenv(TRACE_FILE_ENV)
+    if not path:
+        return None
+    if _trace_handler is None or _trace_handler.baseFilename != os.path.abspath(path):
+        with _log_lock:
+            if _trace_handler is None or _trace_handler.baseFilename != os.path.abspath(path):
+                handler = RotatingFileHandler(path, maxBytes=int(os.getenv("MASHLAB_TRACE_MAX_BYTES", 5 * 1024 * 1024)),
+                                              backupCount=TRACE_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                if _trace_handler is not None:
+                    _trace_log.removeHandler(_trace_handler)
+                    _trace_handler.close()
+                _trace_log.addHandler(handler)
+                _trace_handler = handler
+    return _trace_log
+
+def _write(trace: Trace) -> None:
+    logger = _trace_logger()
+    if logger is not None:
+        logger.info(json.dumps(trace.to_dict(), default=str, separators=(",", ":")))
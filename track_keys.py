@@ -0,0 +1,25 @@
+"""
+Normalized title/artist keys for matching the same recording across providers.
+"""
+from __future__ import annotations
+import re
+import unicodedata
+from typing import Tuple
+
+def clean(s: str) -> str:
+    """Casefolded words of any script; accents on Latin letters are dropped (Beyoncé == beyonce)."""
+    s = unicodedata.normalize("NFKD", s or "").casefold()
+    s = re.sub(r"(?<=[a-z])[\u0300-\u036f]+", "", s)
+    s = unicodedata.normalize("NFC", s)  # recompose other scripts (й, が)
+    s = re.sub(r"\s*\([^)]*\)", "", s)  # drop (...) like (feat. X)
+    s = re.sub(r"[\W_]+", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+def dedupe_key(title: str, artist: str) -> Tuple[str, str]:
+    """
+    (clean title, clean primary artist). Only the first credited artist is
+    used because providers list featured artists differently. Either part
+    can be empty for titles made only of punctuation or symbols.
+    """
+    primary = re.split(r",| & | feat\.? | ft\.? | x ", (artist or "").lower(), maxsplit=1)[0]
+    return clean(title), clean(primary)
@@ -0,0 +1,150 @@
+"""
+Compact struct-of-arrays track collection.
+
+A TrackStore keeps one NumPy array per column instead of one dict per track:
+bpm/energy as float64 (NaN = missing), key_int/mode_int as int8 (-1 =
+missing) and every other column as an object array of interned strings, so
+repeated artists, sources and Camelot codes share one str each.
+
+Indexing with an int returns a TrackRow, a two-slot view that reads and
+writes the arrays and behaves like the old row dicts (r["bpm"], r.get()).
+Slicing returns a TrackStore over views of the same arrays, without copying.
+Search results, the library snapshot (and the Library pages cut from it)
+and the compat engine all use it. Library exports do not: they stream
+batches straight from SQLite (library_export.py).
+"""
+from __future__ import annotations
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+FLOAT_COLUMNS = ("bpm", "energy")
+INT_COLUMNS = ("key_int", "mode_int")
+_MISSING_INT = -1
+
+def _to_array(name: str, values: Sequence[Any]) -> np.ndarray:
+    if name in FLOAT_COLUMNS:
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if name in INT_COLUMNS:
+        return np.array([_MISSING_INT if v is None else v for v in values], dtype=np.int8)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = [sys.intern(v) if type(v) is str else v for v in values]
+    return arr
+
+def _to_python(name: str, value: Any) -> Any:
+    if name in FLOAT_COLUMNS:
+        return None if np.isnan(value) else float(value)
+    if name in INT_COLUMNS:
+        return None if value == _MISSING_INT else int(value)
+    return value
+
+def _to_cell(name: str, value: Any) -> Any:
+    if name in FLOAT_COLUMNS:
+        return np.nan if value is None else value
+    if name in INT_COLUMNS:
+        return _MISSING_INT if value is None else value
+    return sys.intern(value) if type(value) is str else value
+
+class TrackRow:
+    """A view of one row; writes go straight to the store's arrays."""
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: "TrackStore", i: int):
+        self._store = store
+        self._i = i
+
+    def __getitem__(self, name: str) -> Any:
+        return _to_python(name, self._store.columns[name][self._i])
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self._store.columns[name][self._i] = _to_cell(name, value)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._store.columns
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self[name] if name in self._store.columns else default
+
+    def keys(self) -> List[str]:
+        return list(self._store.columns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: self[name] for name in self._store.columns}
+
+    def __repr__(self) -> str:
+        return f"TrackRow({self.to_dict()!r})"
+
+class TrackStore:
+    def __init__(self, columns: Mapping[str, np.ndarray]):
+        self.columns: Dict[str, np.ndarray] = dict(columns)
+        lengths = {len(a) for a in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+        self._len = lengths.pop() if lengths else 0
+        self._index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, Sequence[Any]]) -> "TrackStore":
+        return cls({name: _to_array(name, values) for name, values in columns.items()})
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]], names: Optional[Sequence[str]] = None) -> "TrackStore":
+        rows = list(rows)
+        names = list(names) if names is not None else list(rows[0]) if rows else []
+        return cls.from_columns({name: [row.get(name) for row in rows] for name in names})
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[TrackRow]:
+        return (TrackRow(self, i) for i in range(self._len))
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def __getitem__(self, key: Union[int, slice, Sequence[int], np.ndarray]) -> Union[TrackRow, "TrackStore"]:
+        """int -> row view; slice -> zero-copy store; int/bool array -> copied subset."""
+        if isinstance(key, (int, np.integer)):
+            i = int(key)
+            if i < 0:
+                i += self._len
+            if not 0 <= i < self._len:
+                raise IndexError(key)
+            return TrackRow(self, i)
+        return TrackStore({name: arr[key] for name, arr in self.columns.items()})
+
+    @property
+    def index(self) -> Dict[str, int]:
+        """track_id -> position, built on first use."""
+        if self._index is None:
+            self._index = {t: i for i, t in enumerate(self.columns["track_id"])}
+        return self._index
+
+    def row(self, track_id: str) -> Optional[TrackRow]:
+        i = self.index.get(track_id)
+        return None if i is None else TrackRow(self, i)
+
+    def values(self, name: str) -> List[Any]:
+        """One column as Python values (None for missing)."""
+        return [_to_python(name, v) for v in self.columns[name]]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [row.to_dict() for row in self]
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: self.values(name) for name in self.columns})
+
+    def nbytes(self) -> int:
+        """Approximate footprint: array buffers plus each distinct string once."""
+        total, seen = 0, set()
+        for arr in self.columns.values():
+            total += arr.nbytes
+            if arr.dtype == object:
+                for v in arr:
+                    if id(v) not in seen:
+                        seen.add(id(v))
+                        total += sys.getsizeof(v)
+        return total
@@ -0,0 +1,210 @@
+"""
+Single-writer write-behind queue for SQLite.
+
+Request handlers enqueue mutations and return immediately. One writer
+thread owns the only write connection, drains whatever is queued (up to
+max_batch statements) and commits it as one transaction, grouping runs of
+the same statement into executemany(). Because there is never more than one
+writer, handlers stop colliding on "database is locked". If a statement in
+the batch fails, the batch is bisected under savepoints inside that same
+transaction, so only the bad statements are dropped and it still costs one
+commit.
+
+Callers that need read-your-writes call flush(), which blocks until every
+mutation enqueued before it has been processed, then failed(seq) to learn
+whether their own statement actually landed.
+"""
+from __future__ import annotations
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+Mutation = Tuple[int, str, Sequence[Any]]
+
+MAX_FAILED_KEPT = 1000  # failed seqs remembered for failed()
+
+class WriteBehindQueue:
+    def __init__(self, db_path: str, max_batch: int = 500, max_delay: float = 0.02, timeout: float = 30.0):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[Mutation]]" = queue.Queue()
+        self._seq = itertools.count(1)
+        self._seq_lock = threading.Lock()
+        self._last_enqueued = 0
+        self._last_committed = 0
+        self._committed = threading.Condition()
+        self._failed: "OrderedDict[int, str]" = OrderedDict()  # seq -> error, guarded by _committed
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "committed": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+        }
+
+    # ----- producer side -----
+    def enqueue(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Queue one statement; returns its sequence number."""
+        self._ensure_started()
+        with self._seq_lock:
+            seq = next(self._seq)
+            self._last_enqueued = seq
+            self._stats["enqueued"] += 1
+            self._queue.put((seq, sql, tuple(params)))
+        return seq
+
+    def enqueue_many(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Queue the same statement for every row; returns the last sequence number."""
+        seq = self._last_enqueued
+        for params in rows:
+            seq = self.enqueue(sql, params)
+        return seq
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Wait until everything enqueued so far is processed. False on timeout."""
+        target = self._last_enqueued
+        with self._committed:
+            return self._committed.wait_for(lambda: self._last_committed >= target, timeout=timeout)
+
+    def failed(self, seq: int) -> Optional[str]:
+        """The error for a processed mutation that did not commit, or None if it landed."""
+        with self._committed:
+            return self._failed.get(seq)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._stats["batches"]
+        return {
+            "depth": self._queue.qsize(),
+            "enqueued": self._stats["enqueued"],
+            "committed": self._stats["committed"],
+            "failed": self._stats["failed"],
+            "batches": batches,
+            "last_commit_ms": round(self._stats["last_commit_ms"], 3),
+            "max_commit_ms": round(self._stats["max_commit_ms"], 3),
+            "avg_commit_ms": round(self._stats["total_commit_ms"] / batches, 3) if batches else 0.0,
+        }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Commit what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ----- writer side -----
+    def _ensure_started(self) -> None:
+        # Started lazily so a pre-fork server (gunicorn) gets one writer per worker
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def _drain(self, first: Mutation) -> Tuple[List[Mutation], bool]:
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stop = self._drain(first)
+                try:
+                    self._commit(conn, batch)
+                except Exception as e:
+                    # Never let one batch kill the writer; flush() would wait forever
+                    log.exception("write-behind batch of %d failed", len(batch))
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    self._finish(batch, {seq: str(e) for seq, _sql, _params in batch}, 0.0)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Mutation]) -> None:
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            failed = self._apply(conn, batch)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # Still locked after the timeout, or the commit itself failed:
+            # nothing in the batch landed
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            log.error("write-behind batch of %d not committed: %s", len(batch), e)
+            failed = {seq: str(e) for seq, _sql, _params in batch}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("mashlab_db_write_batch_seconds", elapsed_ms / 1000)
+        self._finish(batch, failed, elapsed_ms)
+
+    def _finish(self, batch: List[Mutation], failed: Dict[int, str], elapsed_ms: float) -> None:
+        self._stats["batches"] += 1
+        self._stats["committed"] += len(batch) - len(failed)
+        self._stats["failed"] += len(failed)
+        self._stats["last_commit_ms"] = elapsed_ms
+        self._stats["total_commit_ms"] += elapsed_ms
+        self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], elapsed_ms)
+        with self._committed:
+            self._failed.update(failed)
+            while len(self._failed) > MAX_FAILED_KEPT:
+                self._failed.popitem(last=False)
+            self._last_committed = batch[-1][0]
+            self._committed.notify_all()
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[Mutation]) -> Dict[int, str]:
+        """
+        Run batch inside the open transaction, coalescing runs of the same
+        statement into executemany(). A failing slice is rolled back to its
+        savepoint and split in half, so one bad write in a batch of n costs
+        about 2*log2(n) extra slices, not a commit per statement. Returns
+        {seq: error} for the statements that failed.
+        """
+        conn.execute("SAVEPOINT write_batch")
+        try:
+            for sql, group in itertools.groupby(batch, key=lambda m: m[1]):
+                conn.executemany(sql, [params for _seq, _sql, params in group])
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO write_batch")
+            conn.execute("RELEASE write_batch")
+            if len(batch) == 1:
+                seq, sql, _params = batch[0]
+                log.error("write-behind mutation %s failed: %s (%s)", seq, e, sql.strip().splitlines()[0])
+                return {seq: str(e)}
+            mid = len(batch) // 2
+            return {**self._apply(conn, batch[:mid]), **self._apply(conn, batch[mid:])}
+        conn.execute("RELEASE write_batch")
+        return {}